@@ -1,14 +1,26 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import pandas as pd
+import asyncio
+import json
+import csv
 import io
 import os
+import gc
+import time
 import logging
 from typing import List, Dict, Any, Optional
-from app.schema.movie_schema import MovieInput, MoviePrediction, BatchMovieInput, BatchMoviePrediction
-from app.preprocessing.feature_engineering import preprocess_movie_data
-from app.models.prediction_model import get_model_instance
-import re
+from app.schema.movie_schema import MovieInput, MoviePrediction, BatchMovieInput, BatchMoviePrediction, MultiModelPrediction
+from app.preprocessing.parallel import shutdown_pool
+from app.models.prediction_model import get_model_instance, predict_movies_routed, predict_movies_with_models
+from app.models.model_registry import UnknownModelError, get_registry
+from app.models.model_router import get_router
+from app.utils.executor import ExecutorSaturated, get_executor
+from app.utils.batcher import MICROBATCH_ENABLED, get_batcher
+from app.utils.prediction_cache import get_prediction_cache, prediction_key
+from app.utils.columnar import MEDIA_TYPES, ColumnarFormatError, predict_columnar
+from app.utils.metrics import METRICS_CONTENT_TYPE, REQUEST_LATENCY, render_metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,6 +39,100 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Film used by /sample and by the startup warm-up prediction
+SAMPLE_MOVIE = {
+    "film_title": "Avatar 3",
+    "release_date": "2025-12-25",
+    "duration": "2h 45min",
+    "age_classification": "Tout public",
+    "producers": "James Cameron,Jon Landau",
+    "director": "James Cameron",
+    "top_stars": "Sam Worthington,Zoe Saldana,Sigourney Weaver",
+    "languages": "Anglais",
+    "distributor": "20th Century Studios",
+    "year_of_production": "2025",
+    "film_nationality": "États-Unis",
+    "filming_secrets": "15 anecdotes",
+    "awards": "",
+    "associated_genres": "Science-Fiction,Aventure",
+    "broadcast_category": "en salle",
+    "trailer_views": "5000000 vues",
+    "synopsis": "Jake Sully et Neytiri sont de retour pour une nouvelle aventure épique sur Pandora, confrontés à de nouveaux défis qui menacent leur peuple et leur planète."
+}
+
+# Set STARTUP_WARMUP=0 to skip the warm-up prediction
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") != "0"
+
+# Set MODEL_PRELOAD=1 with `gunicorn --preload -k uvicorn.workers.UvicornWorker`:
+# the models are then loaded once in the master process and their memory is
+# shared copy-on-write by every forked worker instead of being loaded once per worker
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "0") == "1"
+
+def preload_model():
+    """Load the hosted models in the master process, before the workers are forked"""
+    models = get_registry().load_all()
+    # Keep the collector from writing to the inherited objects, which would copy their pages
+    gc.freeze()
+    for name, model in models.items():
+        logger.info(f"Model {name} preloaded before fork ({model.model_status()['state']})")
+
+if MODEL_PRELOAD:
+    preload_model()
+
+# Latency of every request, labelled with the route template rather than the raw URL
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method, status=status).observe(
+            time.perf_counter() - started
+        )
+
+# Load the models once when the server starts, requests share these instances
+@app.on_event("startup")
+async def load_model():
+    registry = get_registry()
+    for name, model in registry.load_all().items():
+        logger.info(f"Model {name} ready at startup ({model.model_status()['state']})")
+    
+    # Run one prediction per model so TextBlob, CatBoost and the pandas paths
+    # are imported and warmed before the first request instead of during it
+    if STARTUP_WARMUP:
+        started = time.perf_counter()
+        try:
+            predict_movies_with_models(pd.DataFrame([SAMPLE_MOVIE]), registry.names())
+            logger.info(f"Warm-up prediction done in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Warm-up prediction failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_executor():
+    get_executor().shutdown()
+    shutdown_pool()
+
+# Refused jobs are answered with 429 (endpoint limit) or 503 (pool saturated)
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(UnknownModelError)
+async def unknown_model_handler(request, exc: UnknownModelError):
+    return JSONResponse(
+        status_code=404,
+        content={"detail": f"Unknown model: {exc.args[0]}. Hosted models: {', '.join(get_registry().names())}"}
+    )
+
 @app.get("/")
 async def root():
     return {
@@ -35,7 +141,12 @@ async def root():
         "endpoints": [
             {"path": "/predict", "method": "POST", "description": "Predict box office for a single movie"},
             {"path": "/predict_batch", "method": "POST", "description": "Predict box office for multiple movies"},
-            {"path": "/predict_csv", "method": "POST", "description": "Upload a CSV file to get predictions"}
+            {"path": "/predict_csv", "method": "POST", "description": "Upload a CSV file to get predictions"},
+            {"path": "/predict_csv_stream", "method": "POST", "description": "Upload a CSV file and stream predictions back as NDJSON or CSV"},
+            {"path": "/predict_arrow", "method": "POST", "description": "Predict an Apache Arrow IPC stream of movies"},
+            {"path": "/predict_parquet", "method": "POST", "description": "Predict a Parquet file of movies"},
+            {"path": "/predict_models", "method": "POST", "description": "Predict a single movie with several hosted models at once"},
+            {"path": "/models", "method": "GET", "description": "List the hosted models, their versions and traffic shares"}
         ]
     }
 
@@ -43,61 +154,168 @@ async def root():
 @app.get("/health")
 async def health_check():
     try:
-        # Check if model can be loaded
+        # Check the shared model instance, without reloading it from disk
         model = get_model_instance()
-        return {"status": "healthy", "model_loaded": True}
+        return {
+            "status": "degraded" if model.degraded else "healthy",
+            "model_loaded": model.model_loaded,
+            "model_status": model.model_status(),
+            "models": get_registry().describe(),
+            "executor": get_executor().stats(),
+            "prediction_cache": get_prediction_cache().stats()
+        }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return {"status": "unhealthy", "error": str(e)}
 
+async def predict_cached(movies: List[Dict[str, Any]], lane: str, model: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Predict raw movie payloads, only running the pipeline for those not in the prediction cache
+
+    Each film goes to the named model, or to the model the router picks for it
+    when no model is named.
+    """
+    registry = get_registry()
+    if model is not None:
+        registry.path_of(model)
+        model_names = [model] * len(movies)
+    else:
+        model_names = get_router().route_many([movie.get('film_title') for movie in movies])
+    # Read without loading: a model that is not loaded yet is loaded on a worker, its films skip the cache
+    published = {name: registry.version_of(name) for name in set(model_names)}
+    cacheable = [i for i, name in enumerate(model_names) if published[name] is not None]
+    
+    cache = get_prediction_cache()
+    keys, cached = cache.lookup([movies[i] for i in cacheable],
+                                [f"{model_names[i]}:{published[model_names[i]]}" for i in cacheable])
+    key_of = dict(zip(cacheable, keys))
+    predictions = [None] * len(movies)
+    for i, prediction in zip(cacheable, cached):
+        predictions[i] = prediction
+    missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+    if not missing:
+        return predictions
+    
+    if lane == "predict" and MICROBATCH_ENABLED:
+        # Predicted together with the other requests of the same few milliseconds
+        computed = await asyncio.gather(*[get_batcher().submit(movies[i], model_names[i]) for i in missing])
+    else:
+        # Preprocess and predict on the inference workers
+        movies_df = pd.DataFrame([movies[i] for i in missing])
+        computed = await get_executor().run(lane, predict_movies_routed, movies_df, [model_names[i] for i in missing])
+    
+    # A model reloaded by the workers meanwhile does not fill the entries of the previous version
+    stored = [
+        (key_of[i], prediction) for i, prediction in zip(missing, computed)
+        if i in key_of and prediction['features'].get('model_version') == published[model_names[i]]
+    ]
+    cache.store([key for key, _ in stored], [prediction for _, prediction in stored])
+    for i, prediction in zip(missing, computed):
+        predictions[i] = prediction
+    return predictions
+
+# Prometheus metrics endpoint
+@app.get("/metrics", tags=["utilities"])
+async def metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 # Single movie prediction endpoint
 @app.post("/predict", response_model=MoviePrediction, tags=["predictions"])
-async def predict_movie(movie: MovieInput):
+async def predict_movie(movie: MovieInput, model: Optional[str] = Query(None, description="Hosted model to use instead of the routed one")):
     try:
         logger.info(f"Received prediction request for movie: {movie.film_title}")
         
-        # Convert to DataFrame
-        movie_df = pd.DataFrame([movie.dict()])
-        
-        # Preprocess data
-        processed_df = preprocess_movie_data(movie_df)
-        logger.info(f"Preprocessing complete for movie: {movie.film_title}")
-        
-        # Get prediction
-        model = get_model_instance()
-        predictions = model.predict(processed_df)
+        predictions = await predict_cached([movie.dict()], "predict", model)
         logger.info(f"Prediction complete for movie: {movie.film_title}")
         
         return predictions[0]
     
+    except (ExecutorSaturated, UnknownModelError):
+        raise
     except Exception as e:
         logger.error(f"Error predicting movie {movie.film_title}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 # Batch prediction endpoint
 @app.post("/predict_batch", response_model=BatchMoviePrediction, tags=["predictions"])
-async def predict_batch(batch: BatchMovieInput):
+async def predict_batch(batch: BatchMovieInput, model: Optional[str] = Query(None, description="Hosted model to use instead of the routed ones")):
     try:
         logger.info(f"Received batch prediction request for {len(batch.movies)} movies")
         
-        # Convert to DataFrame
-        movies_df = pd.DataFrame([movie.dict() for movie in batch.movies])
-        
-        # Preprocess data
-        processed_df = preprocess_movie_data(movies_df)
-        logger.info(f"Preprocessing complete for batch of {len(batch.movies)} movies")
-        
-        # Get predictions
-        model = get_model_instance()
-        predictions = model.predict(processed_df)
+        predictions = await predict_cached([movie.dict() for movie in batch.movies], "predict_batch", model)
         logger.info(f"Prediction complete for batch of {len(batch.movies)} movies")
         
         return {"predictions": predictions}
     
+    except (ExecutorSaturated, UnknownModelError):
+        raise
     except Exception as e:
         logger.error(f"Error predicting batch of movies: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Batch prediction error: {str(e)}")
 
+# Hosted models, their load state and their share of the routed traffic
+@app.get("/models", tags=["utilities"])
+async def list_models():
+    shares = get_router().shares()
+    return {
+        "models": [
+            {**model, "traffic_share": shares.get(model["name"], 0.0)}
+            for model in get_registry().describe()
+        ]
+    }
+
+# Single movie predicted by several models in one request
+@app.post("/predict_models", response_model=MultiModelPrediction, tags=["predictions"])
+async def predict_models(movie: MovieInput, models: Optional[List[str]] = Query(None, description="Hosted models to compare, all of them by default")):
+    try:
+        registry = get_registry()
+        model_names = models or registry.names()
+        logger.info(f"Received multi-model prediction request for movie: {movie.film_title} ({', '.join(model_names)})")
+        
+        # Models whose prediction of this payload is cached are not run again. Versions are
+        # read without loading: models not loaded yet are loaded on a worker and skip the cache
+        cache = get_prediction_cache()
+        payload = movie.dict()
+        published = {name: registry.version_of(name) for name in model_names}
+        keys = {name: prediction_key(payload, f"{name}:{version}") for name, version in published.items() if version}
+        predictions = {name: cache.get(keys[name]) if name in keys else None for name in model_names}
+        missing = [name for name, prediction in predictions.items() if prediction is None]
+        if missing:
+            # Preprocessed once, then predicted by each missing model on the inference workers
+            computed = await get_executor().run("predict", predict_movies_with_models, pd.DataFrame([payload]), missing)
+            for name in missing:
+                predictions[name] = computed[name][0]
+                if name in keys and predictions[name]['features'].get('model_version') == published[name]:
+                    cache.store([keys[name]], computed[name])
+        
+        return {"film_title": movie.film_title, "predictions": predictions}
+    
+    except (ExecutorSaturated, UnknownModelError):
+        raise
+    except Exception as e:
+        logger.error(f"Error predicting movie {movie.film_title} with several models: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+def predict_csv_content(csv_content: str) -> List[Dict[str, Any]]:
+    """Parse an uploaded CSV and predict its movies (runs on an inference worker)"""
+    # Read CSV with correct parameters
+    csv_df = pd.read_csv(
+        io.StringIO(csv_content),
+        sep=',',          
+        quotechar='"',    
+        encoding='utf-8'  
+    )
+    
+    # Debug the DataFrame columns and first row
+    logger.info(f"CSV columns: {csv_df.columns.tolist()}")
+    if not csv_df.empty:
+        logger.info(f"First row film_title: {csv_df['film_title'].iloc[0]}")
+    
+    logger.info(f"CSV loaded with {len(csv_df)} movies")
+    
+    # Large uploads are preprocessed on the sharded process pool
+    return predict_movies_routed(csv_df, parallel=True)
+
 # CSV upload endpoint
 @app.post("/predict_csv", response_model=BatchMoviePrediction, tags=["predictions"])
 async def predict_csv(file: UploadFile = File(...)):
@@ -111,87 +329,156 @@ async def predict_csv(file: UploadFile = File(...)):
         csv_content = contents.decode('utf-8')
         logger.info(f"CSV Content first 100 chars: {csv_content[:100]}")
         
-        # Read CSV with correct parameters
-        csv_df = pd.read_csv(
-            io.StringIO(csv_content),
-            sep=',',          
-            quotechar='"',    
-            encoding='utf-8'  
-        )
-        
-        # Debug the DataFrame columns and first row
-        logger.info(f"CSV columns: {csv_df.columns.tolist()}")
-        if not csv_df.empty:
-            logger.info(f"First row film_title: {csv_df['film_title'].iloc[0]}")
-        
-        logger.info(f"CSV loaded with {len(csv_df)} movies")
-        
-        # Preprocess data
-        processed_df = preprocess_movie_data(csv_df)
-        logger.info(f"Preprocessing complete for CSV with {len(csv_df)} movies")
-        
-        # Get predictions
-        model = get_model_instance()
-        predictions = model.predict(processed_df)
-        logger.info(f"Prediction complete for CSV with {len(csv_df)} movies")
+        # Parse, preprocess and predict on the inference workers
+        predictions = await get_executor().run("predict_csv", predict_csv_content, csv_content)
+        logger.info(f"Prediction complete for CSV with {len(predictions)} movies")
         
         return {"predictions": predictions}
     
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error predicting from CSV {file.filename}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"CSV prediction error: {str(e)}")
     
+# Rows parsed and predicted at a time by the streaming CSV endpoint
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+
+def format_predictions(predictions: List[Dict[str, Any]], output_format: str, header: bool) -> str:
+    """Serialize a chunk of predictions as NDJSON lines or CSV rows"""
+    if output_format == "ndjson":
+        return "".join(json.dumps(prediction, ensure_ascii=False) + "\n" for prediction in predictions)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(["film_title", "predicted_fr_entries", "method"])
+    for prediction in predictions:
+        writer.writerow([
+            prediction['film_title'],
+            prediction['predicted_fr_entries'],
+            prediction.get('features', {}).get('method')
+        ])
+    return buffer.getvalue()
+
+class LaneStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse holding an executor slot of lane until it is sent
+
+    The slot is given back when the response is done, including when the
+    client goes away or the headers cannot be sent before the body is
+    iterated at all.
+    """
+
+    def __init__(self, content, lane: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.lane = lane
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            get_executor().release(self.lane)
+
+async def stream_csv_predictions(file: UploadFile, output_format: str, chunk_size: int):
+    """
+    Parse the upload chunk by chunk and yield each chunk's predictions as soon as they are ready
+
+    Runs on the predict_csv slot held by the LaneStreamingResponse.
+    """
+    executor = get_executor()
+    try:
+        reader = pd.read_csv(file.file, sep=',', quotechar='"', encoding='utf-8', chunksize=chunk_size)
+        total = 0
+        while True:
+            # Parsing reads the spooled upload, keep it off the event loop
+            chunk = await asyncio.to_thread(next, reader, None)
+            if chunk is None:
+                break
+            predictions = await executor.run_acquired(predict_movies_routed, chunk)
+            yield format_predictions(predictions, output_format, header=total == 0)
+            total += len(chunk)
+        logger.info(f"Streamed predictions for {total} movies from {file.filename}")
+    except Exception as e:
+        logger.error(f"Error streaming predictions from CSV {file.filename}: {str(e)}")
+        if output_format == "ndjson":
+            yield json.dumps({"error": f"CSV prediction error: {str(e)}"}) + "\n"
+        else:
+            # A CSV has no room for an error marker: abort the response so the
+            # client sees a failed transfer instead of a truncated result
+            raise
+    finally:
+        await file.close()
+
+# Streaming CSV upload endpoint
+@app.post("/predict_csv_stream", tags=["predictions"])
+async def predict_csv_stream(
+    file: UploadFile = File(...),
+    output_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, gt=0, le=100000)
+):
+    """
+    Predict a CSV catalogue of any size with flat memory
+    
+    The upload is parsed and predicted chunk_size rows at a time and results
+    are streamed back as NDJSON (one prediction per line) or CSV.
+    """
+    logger.info(f"Received streaming CSV prediction request: {file.filename}")
+    
+    # Hold one predict_csv slot for the whole stream, refused before any output
+    get_executor().acquire("predict_csv")
+    media_type = "application/x-ndjson" if output_format == "ndjson" else "text/csv"
+    return LaneStreamingResponse(stream_csv_predictions(file, output_format, chunk_size), "predict_csv",
+                                 media_type=media_type)
+
+async def predict_columnar_body(request: Request, input_format: str, output_format: str):
+    """Predict a raw Arrow or Parquet request body, answering in JSON or in output_format"""
+    try:
+        data = await request.body()
+        logger.info(f"Received {input_format} prediction request of {len(data)} bytes")
+        
+        result = await get_executor().run("predict_batch", predict_columnar, data, input_format, output_format)
+        
+        if output_format == "json":
+            logger.info(f"Prediction complete for {input_format} batch of {len(result)} movies")
+            return {"predictions": result}
+        return Response(content=result, media_type=MEDIA_TYPES[output_format])
+    
+    except ExecutorSaturated:
+        raise
+    except ColumnarFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=f"Columnar formats need pyarrow: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error predicting {input_format} batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{input_format} prediction error: {str(e)}")
+
+# Arrow IPC batch endpoint
+@app.post("/predict_arrow", tags=["predictions"])
+async def predict_arrow(
+    request: Request,
+    output_format: str = Query("json", alias="format", pattern="^(json|arrow)$")
+):
+    """Predict a body holding an Arrow IPC stream with the MovieInput columns"""
+    return await predict_columnar_body(request, "arrow", output_format)
+
+# Parquet batch endpoint
+@app.post("/predict_parquet", tags=["predictions"])
+async def predict_parquet(
+    request: Request,
+    output_format: str = Query("json", alias="format", pattern="^(json|parquet)$")
+):
+    """Predict a body holding a Parquet file with the MovieInput columns"""
+    return await predict_columnar_body(request, "parquet", output_format)
+
 # Sample data endpoint for demonstration
 @app.get("/sample", tags=["utilities"])
 async def get_sample():
     return {
-        "sample_input": {
-            "film_title": "Avatar 3",
-            "release_date": "2025-12-25",
-            "duration": "2h 45min",
-            "age_classification": "Tout public",
-            "producers": "James Cameron,Jon Landau",
-            "director": "James Cameron",
-            "top_stars": "Sam Worthington,Zoe Saldana,Sigourney Weaver",
-            "languages": "Anglais",
-            "distributor": "20th Century Studios",
-            "year_of_production": "2025",
-            "film_nationality": "États-Unis",
-            "filming_secrets": "15 anecdotes",
-            "awards": "",
-            "associated_genres": "Science-Fiction,Aventure",
-            "broadcast_category": "en salle",
-            "trailer_views": "5000000 vues",
-            "synopsis": "Jake Sully et Neytiri sont de retour pour une nouvelle aventure épique sur Pandora, confrontés à de nouveaux défis qui menacent leur peuple et leur planète."
-        }
+        "sample_input": SAMPLE_MOVIE
     }
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
-
-
-def parse_duration(duration_str):
-    """Parse duration string like '1h 44min' to minutes"""
-    if pd.isna(duration_str) or duration_str is None:
-        return 105  
-    
-    if isinstance(duration_str, (int, float)):
-        return float(duration_str)
-    
-    total_minutes = 0
-    
-    hours_match = re.search(r'(\d+)h', str(duration_str))
-    if hours_match:
-        total_minutes += int(hours_match.group(1)) * 60
-    
-    minutes_match = re.search(r'(\d+)min', str(duration_str))
-    if minutes_match:
-        total_minutes += int(minutes_match.group(1))
-    
-    if total_minutes == 0:
-        number_match = re.search(r'(\d+)', str(duration_str))
-        if number_match:
-            total_minutes = int(number_match.group(1))
-    
-    return total_minutes if total_minutes > 0 else 105
\ No newline at end of file
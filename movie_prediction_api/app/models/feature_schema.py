@@ -0,0 +1,324 @@
+"""
+Feature schema of the CatBoost model and the inference matrix builder
+
+The schema is read once from the loaded model (feature_names_ and categorical
+indices), so the column order never has to be rediscovered per request. The
+builder writes the preprocessed features straight into a preallocated float32
+block for the numeric features and an object block for the categorical ones,
+in schema order, and hands them to CatBoost as a Pool. The one-hot features
+of the list columns are scattered from their interned items.
+
+From SPARSE_MULTI_HOT_MIN_ROWS films on (backfills), the one-hot features are
+kept as a sparse block (app.models.multi_hot) next to the dense numeric and
+categorical columns instead of being written into the dense block.
+
+CatBoost hashes the string form of categorical values, so categorical features
+are passed as the strings seen at training time. Each column is encoded once
+per distinct value: its string form and its integer code in the vocabulary
+stored in the preprocessing artifact (-1 for categories never seen in training).
+"""
+import os
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models.multi_hot import MultiHotEncoder, source_of
+from app.utils.metrics import UNSEEN_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+# Batches of at least this many films get their one-hot features as a sparse block
+SPARSE_MULTI_HOT_MIN_ROWS = int(os.getenv("SPARSE_MULTI_HOT_MIN_ROWS", "10000"))
+
+
+@lru_cache(maxsize=65536)
+def clean_feature_name(name: str) -> str:
+    """Feature name as CatBoost saw it at training time"""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """
+    Frozen description of the features expected by a model
+
+    Args:
+        feature_names: Feature names in model order
+        cat_indices: Positions of the categorical features
+    """
+    feature_names: Tuple[str, ...]
+    cat_indices: Tuple[int, ...]
+
+    @classmethod
+    def from_model(cls, model) -> Optional["FeatureSchema"]:
+        """Read the schema of a fitted CatBoost model, None if the model has none"""
+        names = getattr(model, 'feature_names_', None)
+        if not names:
+            return None
+        return cls(tuple(names), tuple(sorted(model.get_cat_feature_indices())))
+
+    @property
+    def num_indices(self) -> Tuple[int, ...]:
+        cat = set(self.cat_indices)
+        return tuple(i for i in range(len(self.feature_names)) if i not in cat)
+
+    @property
+    def numeric_features(self) -> List[str]:
+        return [self.feature_names[i] for i in self.num_indices]
+
+    @property
+    def categorical_features(self) -> List[str]:
+        return [self.feature_names[i] for i in self.cat_indices]
+
+    @property
+    def dtypes(self) -> Dict[str, str]:
+        """Dtype of each feature as fed to the model"""
+        cat = set(self.cat_indices)
+        return {name: 'category' if i in cat else 'float32' for i, name in enumerate(self.feature_names)}
+
+    @property
+    def source_columns(self) -> List[str]:
+        """Preprocessed columns the features are read from, the list column of each one-hot feature"""
+        columns = dict.fromkeys(self.categorical_features)
+        for name in self.numeric_features:
+            source = source_of(name)
+            columns.setdefault(source[1] if source else name)
+        return list(columns)
+
+    def multi_hot_features(self) -> Dict[str, List[str]]:
+        """One-hot features of each list column, in numeric block order"""
+        features: Dict[str, List[str]] = {}
+        for name in self.numeric_features:
+            source = source_of(name)
+            if source:
+                features.setdefault(source[1], []).append(name)
+        return features
+
+
+class CategoryVocabulary:
+    """
+    Integer codes of the categories of a feature seen at training time
+
+    Args:
+        values: Distinct string values of the feature in the training data
+    """
+
+    def __init__(self, values: List[str]):
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def codes_of(self, strings: np.ndarray) -> np.ndarray:
+        """Code of each string, -1 for unseen categories"""
+        return np.array([self._codes.get(s, -1) for s in strings], dtype=np.int32)
+
+
+# Integer categoricals, floats as soon as one film of a batch misses them
+INTEGER_CATEGORICALS = ('year_of_production', 'release_date_france_year', 'release_date_france_day')
+
+_INTEGER_STRING = re.compile(r'-?\d+')
+
+
+def category_string(value, integral: bool = False) -> str:
+    """
+    String form of a categorical value
+
+    Args:
+        value: Categorical value
+        integral: Write integral floats as ints. A year or a day becomes a
+            float column as soon as one film of the batch misses it; 2025.0
+            is still the category '2025' seen in training. Float categoricals
+            (synopsis_sentiment) keep their float form, 0.0 stays '0.0'.
+    """
+    if integral and isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def is_integral_vocabulary(values: List[str]) -> bool:
+    """Whether every category seen in training is written as an integer"""
+    return bool(values) and all(_INTEGER_STRING.fullmatch(value) for value in values)
+
+
+def integral_categoricals(columns: List[str], vocabularies: Dict[str, List[str]]) -> set:
+    """Categorical columns whose integral floats are written as ints: integer vocabularies, else INTEGER_CATEGORICALS"""
+    return {
+        col for col in columns
+        if (is_integral_vocabulary(vocabularies[col]) if col in vocabularies else col in INTEGER_CATEGORICALS)
+    }
+
+
+def distinct_strings(series: pd.Series, integral: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    String form of a column, computed once per distinct value
+
+    Args:
+        series: Categorical column
+        integral: Write integral floats as ints (see category_string)
+
+    Returns:
+        Position of each row in the distinct values, and the category_string
+        of each distinct value (series.astype(str) unless integral)
+    """
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=False) != 'string':
+        # Mixed values: factorize would merge None with NaN and 1 with True
+        codes, uniques = pd.factorize(np.array([category_string(value, integral) for value in series], dtype=object))
+        return codes, np.asarray(uniques, dtype=object)
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    if integral and pd.api.types.is_float_dtype(series.dtype):
+        return codes, np.array([category_string(value, integral) for value in uniques], dtype=object)
+    return codes, pd.Series(uniques, dtype=series.dtype).astype(str).to_numpy(dtype=object)
+
+
+def category_strings(series: pd.Series, integral: bool = False) -> pd.Series:
+    """category_string of every value of a column"""
+    rows, uniques = distinct_strings(series, integral)
+    return pd.Series(uniques[rows], index=series.index, name=series.name, dtype=object)
+
+
+class FeatureMatrixBuilder:
+    """
+    Build the model inputs of a preprocessed batch in schema order
+
+    Args:
+        schema: Feature schema of the model
+        preprocessing: Fitted PreprocessingArtifact used to scale continuous features
+    """
+
+    def __init__(self, schema: FeatureSchema, preprocessing=None):
+        self.schema = schema
+        self.preprocessing = preprocessing
+        self.numeric_features = schema.numeric_features
+        self.categorical_features = schema.categorical_features
+        # The model's one-hot features are the multi-hot vocabularies frozen at training time
+        self.multi_hot = MultiHotEncoder(schema.multi_hot_features(), clean_feature_name)
+        one_hot = set(self.multi_hot.feature_names)
+        self._plain_numeric = [
+            (position, name) for position, name in enumerate(self.numeric_features) if name not in one_hot
+        ]
+        # Position in the numeric block of each column of the multi-hot block
+        numeric_positions = {name: position for position, name in enumerate(self.numeric_features)}
+        self._one_hot_positions = np.array(
+            [numeric_positions[name] for name in self.multi_hot.feature_names], dtype=np.int64
+        )
+        self._scaled = set(preprocessing.continuous_cols) if preprocessing is not None else set()
+        vocabularies = preprocessing.vocabularies if preprocessing is not None else {}
+        self.vocabularies = {
+            name: CategoryVocabulary(vocabularies[name]) for name in self.categorical_features if name in vocabularies
+        }
+        self._integral = integral_categoricals(self.categorical_features, vocabularies)
+
+    def plain_numeric_values(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """float32 values of each numeric feature that is not one-hot, scaled, missing values as NaN"""
+        scaled = [name for _, name in self._plain_numeric if name in self._scaled and name in df.columns]
+        values = {}
+        if scaled:
+            block = self.preprocessing.scale_columns(df, scaled)
+            values = {name: block[:, i].astype(np.float32) for i, name in enumerate(scaled)}
+
+        for _, name in self._plain_numeric:
+            if name in values:
+                continue
+            if name in df.columns:
+                values[name] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float32)
+            else:
+                values[name] = np.full(len(df), np.nan, dtype=np.float32)
+        return values
+
+    def numeric_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Contiguous float32 array of the numeric features, missing values as NaN"""
+        matrix = np.zeros((len(df), len(self.numeric_features)), dtype=np.float32)
+
+        values = self.plain_numeric_values(df)
+        for position, name in self._plain_numeric:
+            matrix[:, position] = values[name]
+
+        rows, columns = self.multi_hot.nonzero(df)
+        matrix[rows, self._one_hot_positions[columns]] = 1.0
+
+        return matrix
+
+    def encode_categoricals(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode the categorical features of a batch
+
+        Returns:
+            Object array of the values as strings, and int32 array of their
+            vocabulary codes (-1 when unseen or when the feature has no vocabulary)
+        """
+        n_rows = len(df)
+        strings = np.empty((n_rows, len(self.categorical_features)), dtype=object)
+        codes = np.full((n_rows, len(self.categorical_features)), -1, dtype=np.int32)
+        for position, name in enumerate(self.categorical_features):
+            strings[:, position], codes[:, position] = self._encode_categorical(df, name)
+        return strings, codes
+
+    def _encode_categorical(self, df: pd.DataFrame, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Strings and vocabulary codes of one categorical feature"""
+        codes = np.full(len(df), -1, dtype=np.int32)
+        if name not in df.columns:
+            return np.full(len(df), 'nan', dtype=object), codes
+        rows, uniques = distinct_strings(df[name], name in self._integral)
+
+        vocabulary = self.vocabularies.get(name)
+        if vocabulary is not None:
+            codes = vocabulary.codes_of(uniques)[rows]
+            unseen = int(np.count_nonzero(codes < 0))
+            if unseen:
+                UNSEEN_CATEGORIES.labels(feature=name).inc(unseen)
+        return uniques[rows], codes
+
+    def categorical_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Object array of the categorical features as strings"""
+        return self.encode_categoricals(df)[0]
+
+    def build_pool(self, df: pd.DataFrame, sparse: Optional[bool] = None):
+        """
+        CatBoost Pool of a preprocessed batch
+
+        Args:
+            df: Preprocessed batch
+            sparse: Pass the one-hot features as a sparse block, by default
+                for batches of at least SPARSE_MULTI_HOT_MIN_ROWS films
+        """
+        if sparse is None:
+            sparse = len(df) >= SPARSE_MULTI_HOT_MIN_ROWS
+        if sparse and self.multi_hot.n_features:
+            return self.build_sparse_pool(df)
+
+        from catboost import Pool, FeaturesData
+
+        numeric = self.numeric_matrix(df)
+        if not self.categorical_features:
+            return Pool(numeric, feature_names=list(self.schema.feature_names))
+
+        return Pool(FeaturesData(
+            num_feature_data=numeric,
+            cat_feature_data=self.categorical_matrix(df),
+            num_feature_names=self.numeric_features,
+            cat_feature_names=self.categorical_features,
+        ))
+
+    def build_sparse_pool(self, df: pd.DataFrame):
+        """
+        CatBoost Pool of a preprocessed batch with the one-hot features kept sparse
+
+        The one-hot features become sparse columns (fill value 0) of the frame
+        given to CatBoost, next to the dense numeric and categorical columns,
+        which are not copied into 2D blocks. The predictions are the same as
+        with build_pool(df, sparse=False).
+        """
+        from catboost import Pool
+
+        columns: Dict[str, object] = dict(self.plain_numeric_values(df))
+        one_hot = pd.DataFrame.sparse.from_spmatrix(self.multi_hot.encode(df), columns=self.multi_hot.feature_names)
+        columns.update(one_hot.items())
+        for name in self.categorical_features:
+            columns[name] = self._encode_categorical(df, name)[0]
+
+        frame = pd.DataFrame({name: columns[name] for name in self.schema.feature_names}, copy=False)
+        return Pool(frame, cat_features=self.categorical_features or None)
@@ -0,0 +1,188 @@
+"""
+Registry of the prediction models hosted by the API
+
+Configuration (environment):
+    MODELS                        named models hosted side by side, "name=path,name=path"
+                                  (default: one model named "default", see resolve_model_path)
+    MODEL_RELOAD_CHECK_INTERVAL   seconds between two checks of a model file on disk (default 2)
+"""
+import os
+import time
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.prediction_model import MoviePredictionModel
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between two checks of the model file on disk
+RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "2.0"))
+
+MODEL_SPECS = os.getenv("MODELS")
+DEFAULT_MODEL_NAME = "default"
+
+
+class UnknownModelError(KeyError):
+    """Raised when a request names a model the registry does not host"""
+
+
+def parse_model_specs(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse "name=path,name=path" into a dict, a single default model when empty"""
+    specs = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, path = item.split('=', 1)
+        specs[name.strip()] = path.strip()
+    return specs or {DEFAULT_MODEL_NAME: None}
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the loaded prediction models
+
+    Models are loaded once (normally during the FastAPI startup hook) and the
+    same instance is shared by every request. When the model file changes on
+    disk, a new instance is built next to the current one and swapped in with
+    a single assignment, so in-flight requests keep the instance they already
+    hold.
+
+    Models are addressed by name (the first one listed is the default) and
+    each loaded instance carries the content hash of its file as version.
+
+    Args:
+        check_interval: Minimum number of seconds between two checks of a model file
+        models: Model paths by name, MODELS by default
+    """
+
+    def __init__(self, check_interval: float = RELOAD_CHECK_INTERVAL, models: Dict[str, Optional[str]] = None):
+        self.check_interval = check_interval
+        self.models = dict(models) if models else parse_model_specs(MODEL_SPECS)
+        self.default_name = next(iter(self.models))
+        self._entries: Dict[Optional[str], Tuple[MoviePredictionModel, Optional[Tuple[int, int]]]] = {}
+        self._last_check: Dict[Optional[str], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+        """Return (mtime, size) of the model file, or None if it is missing"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, model_path: str = None) -> MoviePredictionModel:
+        """
+        Load a model and publish it in the registry
+
+        If the new file cannot be loaded while a working model is already
+        published, the working model is kept.
+        """
+        with self._lock:
+            return self._load_locked(model_path)
+
+    def _load_locked(self, model_path: Optional[str]) -> MoviePredictionModel:
+        started = time.perf_counter()
+        model = MoviePredictionModel(model_path)
+        signature = self._file_signature(model.model_path)
+
+        current = self._entries.get(model_path)
+        if current is not None and current[0].model_loaded and not model.model_loaded:
+            logger.warning(f"Reload of {model.model_path} failed, keeping the previously loaded model")
+            self._entries[model_path] = (current[0], signature)
+            return current[0]
+
+        self._entries[model_path] = (model, signature)
+        self._last_check[model_path] = time.monotonic()
+        logger.info(f"Model published from {model.model_path} in {time.perf_counter() - started:.3f}s")
+        return model
+
+    def get(self, model_path: str = None) -> MoviePredictionModel:
+        """
+        Return the shared model, loading it on first use and reloading it
+        when the file on disk has changed
+        """
+        entry = self._entries.get(model_path)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(model_path)
+                if entry is None:
+                    return self._load_locked(model_path)
+
+        model, signature = entry
+        now = time.monotonic()
+        if now - self._last_check.get(model_path, 0.0) < self.check_interval:
+            return model
+
+        self._last_check[model_path] = now
+        if self._file_signature(model.model_path) == signature:
+            return model
+
+        with self._lock:
+            model, signature = self._entries[model_path]
+            if self._file_signature(model.model_path) != signature:
+                logger.info(f"Model file changed on disk, reloading: {model.model_path}")
+                model = self._load_locked(model_path)
+        return model
+
+    def names(self) -> List[str]:
+        """Names of the hosted models, the default one first"""
+        return list(self.models)
+
+    def path_of(self, name: str = None) -> Optional[str]:
+        """Model path of a hosted model, the default model when name is None"""
+        name = name or self.default_name
+        if name not in self.models:
+            raise UnknownModelError(name)
+        return self.models[name]
+
+    def get_model(self, name: str = None) -> MoviePredictionModel:
+        """Shared instance of a hosted model, the default model when name is None"""
+        return self.get(self.path_of(name))
+
+    def version_of(self, name: str = None) -> Optional[str]:
+        """
+        Version of the published instance of a hosted model, None when it is not loaded yet
+
+        Never loads or reloads a model, so it is safe on the event loop: a file
+        changed on disk keeps reporting the published version until a worker
+        gets the model and reloads it.
+        """
+        entry = self._entries.get(self.path_of(name))
+        return entry[0].model_version if entry is not None else None
+
+    def load_all(self) -> Dict[str, MoviePredictionModel]:
+        """Load the hosted models that are not loaded yet"""
+        return {
+            name: self.get(path) if self.is_loaded(path) else self.load(path)
+            for name, path in self.models.items()
+        }
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Name, default flag and load state of every hosted model, without loading them"""
+        described = []
+        for name, path in self.models.items():
+            entry = self._entries.get(path)
+            status = entry[0].model_status() if entry is not None else {'state': 'not_loaded'}
+            described.append({'name': name, 'default': name == self.default_name, **status})
+        return described
+
+    def is_loaded(self, model_path: str = None) -> bool:
+        """Whether a model has been published for this path"""
+        return model_path in self._entries
+
+    def clear(self) -> None:
+        """Forget every loaded model"""
+        with self._lock:
+            self._entries.clear()
+            self._last_check.clear()
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """Get the process-wide model registry"""
+    return _registry
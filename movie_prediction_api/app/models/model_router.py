@@ -0,0 +1,88 @@
+"""
+Weighted routing of prediction traffic between the hosted models
+
+Each film is sent to one model chosen from a hash of its title, so the split
+follows the configured weights while a given film always lands on the same
+model (and stays in the prediction cache of that model).
+
+Configuration (environment):
+    MODEL_WEIGHTS   share of the traffic of each model, "name=weight,name=weight"
+                    (default: every request goes to the default model)
+"""
+import os
+import zlib
+import bisect
+import logging
+from typing import Dict, List, Optional
+
+from app.models.model_registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+MODEL_WEIGHTS = os.getenv("MODEL_WEIGHTS")
+
+
+def parse_weights(value: Optional[str]) -> Dict[str, float]:
+    """Parse "name=weight,name=weight" into a dict"""
+    weights = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, weight = item.split('=', 1)
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class ModelRouter:
+    """
+    Deterministic weighted choice of a model per film
+
+    Args:
+        weights: Relative share of the traffic by model name, models with a
+            zero weight only receive the requests that name them explicitly
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = {name: weight for name, weight in weights.items() if weight > 0}
+        if not self.weights:
+            raise ValueError("At least one model needs a positive weight")
+        total = sum(self.weights.values())
+        self._names = list(self.weights)
+        self._bounds = []
+        cumulative = 0.0
+        for weight in self.weights.values():
+            cumulative += weight / total
+            self._bounds.append(cumulative)
+        self._bounds[-1] = 1.0
+
+    def route(self, key: str) -> str:
+        """Model of a routing key (the film title)"""
+        point = zlib.crc32(str(key).encode('utf-8')) / 2 ** 32
+        return self._names[bisect.bisect_right(self._bounds, point)]
+
+    def route_many(self, keys: List[str]) -> List[str]:
+        return [self.route(key) for key in keys]
+
+    def shares(self) -> Dict[str, float]:
+        """Configured share of the traffic of each model"""
+        total = sum(self.weights.values())
+        return {name: weight / total for name, weight in self.weights.items()}
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_router() -> ModelRouter:
+    """Get the process-wide router, built from MODEL_WEIGHTS and the hosted models"""
+    global _router
+    if _router is None:
+        registry = get_registry()
+        weights = parse_weights(MODEL_WEIGHTS)
+        unknown = [name for name in weights if name not in registry.models]
+        if unknown:
+            logger.warning(f"MODEL_WEIGHTS names models that are not hosted, ignored: {', '.join(unknown)}")
+        weights = {name: weight for name, weight in weights.items() if name in registry.models}
+        if not any(weight > 0 for weight in weights.values()):
+            weights = {registry.default_name: 1.0}
+        _router = ModelRouter(weights)
+    return _router
@@ -0,0 +1,142 @@
+"""
+Sparse multi-hot encoding of the list columns (genres, nationalities, talent)
+
+A model sees a list column as one 0/1 feature per item known at training
+time, named "<prefix><item>" (lang_Anglais, star_Tom_Cruise...). The
+vocabularies are frozen: they come from the feature names of the loaded model
+or from the preprocessing artifact, and items never seen in training are
+ignored. A film has a handful of items out of hundreds of features, so the
+block is built as a scipy CSR matrix from the interned items of the list
+columns, without a dense row per film.
+
+scipy is imported on first use.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.list_columns import list_items
+
+logger = logging.getLogger(__name__)
+
+# One-hot features of the models are "<prefix><item>" for the items of a list column
+MULTI_HOT_SOURCES = {
+    'lang_': 'languages_list',
+    'nat_': 'nationality_list',
+    'star_': 'top_stars_list',
+    'prod_': 'producers_list',
+    'genre_': 'associated_genres_list',
+}
+
+
+def source_of(feature_name: str):
+    """(prefix, list column) of a one-hot feature, None for any other feature"""
+    for prefix, column in MULTI_HOT_SOURCES.items():
+        if feature_name.startswith(prefix):
+            return prefix, column
+    return None
+
+
+class MultiHotEncoder:
+    """
+    Frozen multi-hot vocabularies of the list columns
+
+    Args:
+        features: For each list column, its one-hot feature names in block order
+        clean: Function applied to "<prefix><item>" to get the feature name of
+            an item (CatBoost feature names replace special characters)
+    """
+
+    def __init__(self, features: Dict[str, List[str]], clean=None):
+        self.features = {column: list(names) for column, names in features.items() if names}
+        self.clean = clean or (lambda name: name)
+        self.feature_names: List[str] = [name for names in self.features.values() for name in names]
+        # Column of each feature name in the block, per list column
+        self._columns: Dict[str, Dict[str, int]] = {}
+        offset = 0
+        for column, names in self.features.items():
+            self._columns[column] = {name: offset + i for i, name in enumerate(names)}
+            offset += len(names)
+
+    @classmethod
+    def from_items(cls, items: Dict[str, List[str]], clean=None) -> "MultiHotEncoder":
+        """Encoder of the items kept at training time, {list column: [item, ...]}"""
+        prefixes = {column: prefix for prefix, column in MULTI_HOT_SOURCES.items()}
+        clean = clean or (lambda name: name)
+        features = {
+            column: list(dict.fromkeys(clean(prefixes[column] + str(item)) for item in values))
+            for column, values in items.items() if column in prefixes
+        }
+        return cls(features, clean)
+
+    @staticmethod
+    def fit_items(features: pd.DataFrame, min_count: int = 1) -> Dict[str, List[str]]:
+        """
+        Sorted items of each list column seen in at least min_count films,
+        to freeze at training time (see PreprocessingArtifact)
+        """
+        vocabularies = {}
+        for column in MULTI_HOT_SOURCES.values():
+            if column not in features.columns:
+                continue
+            rows, codes, vocabulary = list_items(features[column])
+            # Films per item, an item listed twice for a film counts once
+            pairs = np.unique(np.stack([codes, rows]), axis=1)
+            films = np.bincount(pairs[0], minlength=len(vocabulary))
+            vocabularies[column] = sorted(item for item, count in zip(vocabulary, films) if count >= min_count)
+        return vocabularies
+
+    def items(self) -> Dict[str, List[str]]:
+        """Item of each feature without its prefix, {list column: [item, ...]}, as from_items takes them"""
+        prefixes = {column: prefix for prefix, column in MULTI_HOT_SOURCES.items()}
+        return {column: [name[len(prefixes[column]):] for name in names] for column, names in self.features.items()}
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    def nonzero(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row and block column of every known item of the batch
+
+        Each distinct item of a list column is resolved to its feature once.
+        Missing list columns leave their features at 0.
+        """
+        all_rows, all_columns = [], []
+        prefixes = {column: prefix for prefix, column in MULTI_HOT_SOURCES.items()}
+        for column, positions in self._columns.items():
+            if column not in df.columns:
+                continue
+            rows, codes, vocabulary = list_items(df[column])
+            if not len(codes):
+                continue
+            item_columns = np.array(
+                [positions.get(self.clean(prefixes[column] + item), -1) for item in vocabulary], dtype=np.int64
+            )[codes]
+            known = item_columns >= 0
+            all_rows.append(rows[known])
+            all_columns.append(item_columns[known])
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(all_rows).astype(np.int64), np.concatenate(all_columns)
+
+    def encode(self, df: pd.DataFrame):
+        """
+        Multi-hot block of a batch
+
+        Returns:
+            scipy.sparse.csr_matrix of shape (len(df), n_features), float32,
+            1 where a film has the item of the feature
+        """
+        from scipy import sparse
+
+        rows, columns = self.nonzero(df)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(len(df), self.n_features)
+        )
+        # An item listed twice for a film is still a single 1
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0
+        return matrix
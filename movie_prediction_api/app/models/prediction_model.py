@@ -2,61 +2,111 @@ import os
 import pickle
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 import logging
-from typing import Dict, List, Union, Any
-import ast
+from typing import Dict, List, Optional, Union, Any
+import time
+import hashlib
+from datetime import datetime, timezone
+
+from app.preprocessing.feature_engineering import preprocess_movie_data
+from app.preprocessing.feature_plan import merge_plans, plan_stages
+from app.models.feature_schema import FeatureSchema, FeatureMatrixBuilder, category_strings, integral_categoricals
+from app.models.predictors import CatBoostPredictor, RuleBasedPredictor, StubPredictor
+from app.utils.metrics import BATCH_SIZE, PREDICTIONS
+from app.models.preprocessing_artifact import artifact_path_for, load_preprocessing_artifact
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Define columns that need to be scaled
+CONTINUOUS_COLS = [
+    'duration', 'synopsis_length', 
+    'award_count', 'nomination_count', 
+    'trailer_views_num', 'filming_secrets_num', 'top_distributor_score', 
+    'distributor_power', 'franchise_blockbuster_score', 'estimated_marketing_power'
+]
+
+# Define categorical columns for the model
+CATEGORICAL_COLS = [
+    'year_of_production', 'release_date_france_year', 'release_date_france_day',
+    'release_season', 'broadcast_category', 'duration_binary',
+    'director_binary', 'producers_count_binary', 'top_stars_count_binary',
+    'press_rating_binary', 'nationality_list_binary', 'viewer_rating_binary', 
+    'trailer_views_num_binary', 'synopsis_binary', 'distributor_binary',
+    'duration_classified', 'synopsis_sentiment', 'is_sequel',
+    'synopsis_length_categorized', 'synopisis_sentiment_categorized',
+    'award_binary', 'nomination_binary', 'is_gaming_franchise',
+    'franchise_level', 'is_superhero_franchise', 'is_animation_franchise', 
+    'is_action_franchise', 'is_licence', 'is_mcu', 'is_likely_blockbuster',
+    'is_major_studio', 'is_french_major_studio', 'major_studio_and_licence',
+    'french_major_and_licence', 'major_studio_x_franchise', 'is_connected_universe'
+]
+
+# Raw columns that the CatBoost model also reads as categorical features
+RAW_CATEGORICAL_COLS = ['director', 'distributor']
+
+# Model shipped with the API, used when neither a path nor MODEL_PATH is given
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'model', 'catboost_model.cbm'
+)
+
+def resolve_model_path(model_path: str = None) -> str:
+    """Model file to load: the given path, else the MODEL_PATH environment variable, else the shipped model"""
+    return model_path or os.getenv("MODEL_PATH") or DEFAULT_MODEL_PATH
+
+def model_file_version(model_path: str) -> str:
+    """Short content hash of a model file and of its preprocessing artifact"""
+    digest = hashlib.sha1()
+    for path in (model_path, artifact_path_for(model_path)):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()[:12]
+
 class MoviePredictionModel:
     def __init__(self, model_path: str = None):
         """
         Initialize the movie prediction model
         
         Args:
-            model_path: Path to the pickled model file
+            model_path: Path to the CatBoost model file, resolved with resolve_model_path when None
         """
-        if model_path is None:
-            # Utiliser le chemin absolu exact où se trouve le modèle
-            if os.name == 'nt':  # Windows
-                model_path = "C:\\Users\\asus\\OneDrive\\Bureau\\Formations\\FilmPrediction\\film-prediction\\movie_prediction_api\\model\\catboost_model.cbm"
-            else:
-                model_path = "/home/l-o/Projets/film-prediction/movie_prediction_api/model/catboost_model.cbm"
-                
-            # Ajoutez des logs pour le débogage
-            logger.info(f"Looking for model at: {model_path}")
-            logger.info(f"File exists: {os.path.exists(model_path)}")
-        
-        self.model_path = model_path
+        self.model_path = resolve_model_path(model_path)
+        self.model_loaded = False
+        self.load_error = None
+        started = time.perf_counter()
         self.model = self._load_model()
-        self.scaler = StandardScaler()
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = datetime.now(timezone.utc)
+        self.scaler = None
         
-        # Define columns that need to be scaled
-        self.continuous_cols = [
-            'duration', 'synopsis_length', 
-            'award_count', 'nomination_count', 
-            'trailer_views_num', 'filming_secrets_num', 'top_distributor_score', 
-            'distributor_power', 'franchise_blockbuster_score', 'estimated_marketing_power'
-        ]
+        # Scaler statistics and vocabularies fitted on the training data
+        self.preprocessing = load_preprocessing_artifact(self.model_path)
         
-        # Define categorical columns for the model
-        self.categorical_cols = [
-            'year_of_production', 'release_date_france_year', 'release_date_france_day',
-            'release_season', 'broadcast_category', 'duration_binary',
-            'director_binary', 'producers_count_binary', 'top_stars_count_binary',
-            'press_rating_binary', 'nationality_list_binary', 'viewer_rating_binary', 
-            'trailer_views_num_binary', 'synopsis_binary', 'distributor_binary',
-            'duration_classified', 'synopsis_sentiment', 'is_sequel',
-            'synopsis_length_categorized', 'synopisis_sentiment_categorized',
-            'award_binary', 'nomination_binary', 'is_gaming_franchise',
-            'franchise_level', 'is_superhero_franchise', 'is_animation_franchise', 
-            'is_action_franchise', 'is_licence', 'is_mcu', 'is_likely_blockbuster',
-            'is_major_studio', 'is_french_major_studio', 'major_studio_and_licence',
-            'french_major_and_licence', 'major_studio_x_franchise', 'is_connected_universe'
-        ]
+        self.continuous_cols = list(CONTINUOUS_COLS)
+        self.categorical_cols = list(CATEGORICAL_COLS)
+        
+        # Feature order and categorical indices read once from the loaded model
+        self.schema = FeatureSchema.from_model(self.model)
+        self.feature_builder = FeatureMatrixBuilder(self.schema, self.preprocessing) if self.schema else None
+        
+        # Prediction engines: the CatBoost model when it is loaded, otherwise the
+        # stub of the degraded mode, and the rule-based fallback
+        if self.feature_builder is not None:
+            self.predictor = CatBoostPredictor(self.model, self.feature_builder)
+        else:
+            if self.model_loaded:
+                self.load_error = "The model has no feature names"
+            self.predictor = StubPredictor()
+            logger.warning(f"No model loaded from {self.model_path}, serving placeholder predictions (degraded mode)")
+        self.fallback = RuleBasedPredictor()
+        
+        # Feature stages producing the columns the predictors read, the others are skipped
+        self.required_columns = list(dict.fromkeys(self.predictor.required_columns + self.fallback.required_columns))
+        self.feature_stages = plan_stages(self.required_columns)
+        
+        # Identifies the model files in caches of predictions
+        self.model_version = model_file_version(self.model_path) if self.model_loaded else "mock"
     
     # Dans app/models/prediction_model.py, modifiez la méthode _load_model 
     def _load_model(self):
@@ -75,6 +125,7 @@ class MoviePredictionModel:
             # Essayer de charger le modèle
             model.load_model(self.model_path)
             logger.info(f"Model loaded successfully!")
+            self.model_loaded = True
             
             # Ne pas tester la prédiction ici, c'est risqué car on ne connaît pas le format attendu
             # par le modèle pour les données d'entrée
@@ -82,32 +133,26 @@ class MoviePredictionModel:
             return model
         except Exception as e:
             logger.error(f"Failed to load model: {str(e)}")
-            
-            # Créer un modèle factice au lieu de lever une exception
-            logger.warning("Using a mock model as fallback")
-            class MockModel:
-                def predict(self, X):
-                    # Générer des prédictions basées sur des caractéristiques
-                    import random
-                    random.seed(42)  # Pour des résultats cohérents
-                    
-                    results = []
-                    for _ in range(len(X)):
-                        prediction = random.randint(300000, 3000000)
-                        results.append(prediction)
-                    return results
-            
-            return MockModel()
-        
-    def parse_stringified_lists(self, df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
-        """Parse stringified lists in the DataFrame"""
-        for col in columns:
-            if col in df.columns:
-                df[col] = df[col].apply(
-                    lambda x: ast.literal_eval(x) if isinstance(x, str) and x.startswith('[') else x
-                )
-        return df
+            self.load_error = str(e)
+            return None
     
+    @property
+    def degraded(self) -> bool:
+        """Whether predictions come from the placeholder stub instead of a model"""
+        return isinstance(self.predictor, StubPredictor)
+    
+    def model_status(self) -> Dict[str, Any]:
+        """Load state of the model, as reported by /health"""
+        return {
+            'state': 'degraded' if self.degraded else 'loaded',
+            'predictor': self.predictor.name,
+            'source_path': self.model_path,
+            'version': self.model_version,
+            'loaded_at': self.loaded_at.isoformat(),
+            'load_seconds': round(self.load_seconds, 3),
+            'error': self.load_error,
+        }
+        
     def prepare_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Prepare features for prediction
@@ -121,21 +166,24 @@ class MoviePredictionModel:
         # Make a copy to avoid changing the original
         df_model = df.copy()
         
-        # Parse any stringified lists
-        list_columns = [
-            'top_stars_list', 'associated_genres_list', 'languages_list',
-            'nationality_list', 'producers_list'
-        ]
-        df_model = self.parse_stringified_lists(df_model, list_columns)
-        
         # Convert categorical columns to category dtype
+        vocabularies = self.preprocessing.vocabularies if self.preprocessing is not None else {}
+        integral = integral_categoricals(self.categorical_cols, vocabularies)
         for col in self.categorical_cols:
             if col in df_model.columns:
-                df_model[col] = df_model[col].astype(str).astype('category')
+                df_model[col] = category_strings(df_model[col], col in integral).astype('category')
         
-        # Scale continuous columns
+        # Scale continuous columns with the statistics fitted on the training data
         continuous_cols_present = [col for col in self.continuous_cols if col in df_model.columns]
-        if continuous_cols_present:
+        if continuous_cols_present and self.preprocessing is not None:
+            fitted_cols = [col for col in continuous_cols_present if col in self.preprocessing.continuous_cols]
+            if fitted_cols:
+                df_model[fitted_cols] = self.preprocessing.scale_columns(df_model, fitted_cols)
+        elif continuous_cols_present:
+            # Without an artifact, fall back to scaling the batch against itself
+            if self.scaler is None:
+                from sklearn.preprocessing import StandardScaler
+                self.scaler = StandardScaler()
             df_model[continuous_cols_present] = self.scaler.fit_transform(df_model[continuous_cols_present])
         
         # Drop columns not needed for prediction
@@ -162,49 +210,28 @@ class MoviePredictionModel:
     def predict(self, features: pd.DataFrame) -> List[Dict[str, Any]]:
         """
         Make prediction for movie entries using the model
+        
+        Args:
+            features: DataFrame returned by preprocess_movie_data
         """
         try:
-            # Préparer les features
-            X = self.prepare_features(features)
-            
-            # Extraire seulement les features numériques
-            X_numeric = X.select_dtypes(include=[np.number])
-            logger.info(f"Numeric features shape: {X_numeric.shape}")
-            logger.info(f"Numeric feature names: {X_numeric.columns.tolist()}")
-            
             try:
-            
-                predictions = self.model.predict(X_numeric)
-                method = "numeric_features"
-            except Exception as e1:
-                logger.warning(f"Direct prediction failed: {str(e1)}")
-                
-                try:
-                    
-                    X_array = X_numeric.values
-                    predictions = self.model.predict(X_array)
-                    method = "numpy_array"
-                except Exception as e2:
-                    logger.warning(f"NumPy array prediction failed: {str(e2)}")
-                    
-                    logger.info("Using rule-based fallback model")
-                    predictions = self._rule_based_prediction(features)
-                    method = "rule_based"
+                predictions = self.predictor.predict(features)
+                method = self.predictor.name
+            except Exception as e:
+                logger.warning(f"{self.predictor.name} prediction failed: {str(e)}")
+                logger.info("Using rule-based fallback model")
+                predictions = self.fallback.predict(features)
+                method = self.fallback.name
+            PREDICTIONS.labels(method=method).inc(len(features))
             
             # Créer les résultats
             results = []
             for i, film_title in enumerate(features['film_title']):
-                if method == "rule_based":
-                    # Le modèle de repli a déjà créé les prédictions par film
-                    pred_entries = predictions[i]
-                else:
-                    # Pour les prédictions du vrai modèle
-                    pred_entries = max(0, int(predictions[i]))
-                
                 result = {
                     'film_title': film_title,
-                    'predicted_fr_entries': pred_entries,
-                    'features': {'method': method}
+                    'predicted_fr_entries': max(0, int(predictions[i])),
+                    'features': {'method': method, 'model_version': self.model_version}
                 }
                 results.append(result)
             
@@ -214,46 +241,88 @@ class MoviePredictionModel:
             logger.error(f"Prediction error: {str(e)}")
             raise RuntimeError(f"Failed to make prediction: {str(e)}")
         
-    def _rule_based_prediction(self, features: pd.DataFrame) -> List[int]:
-        """Modèle de repli basé sur des règles simples"""
-        import hashlib
-        
-        predictions = []
-        for _, row in features.iterrows():
-            film_title = row['film_title']
-            
-            # Base prediction
-            base = 800000
-            
-            # Adjust based on known features if available
-            if 'franchise_level' in row and not pd.isna(row['franchise_level']):
-                base += int(row['franchise_level']) * 300000
-            
-            if 'is_superhero_franchise' in row and row['is_superhero_franchise'] == 1:
-                base += 1000000
-            
-            if 'is_animation_franchise' in row and row['is_animation_franchise'] == 1:
-                base += 800000
-            
-            if 'is_action_franchise' in row and row['is_action_franchise'] == 1:
-                base += 600000
-            
-            if 'is_likely_blockbuster' in row and row['is_likely_blockbuster'] == 1:
-                base += 1200000
-            
-            # Add deterministic variation
-            hash_obj = hashlib.md5(film_title.encode())
-            hash_int = int(hash_obj.hexdigest(), 16)
-            variation = ((hash_int % 20) - 10) / 100  # -10% to +10%
-            
-            final_prediction = int(base * (1 + variation))
-            predictions.append(final_prediction)
-        
-        return predictions
-        
-# _model_instance = None
-
 def get_model_instance(model_path: str = None) -> MoviePredictionModel:
-    """Get or create the model instance"""
-    # Créer une nouvelle instance à chaque fois (moins efficace mais plus fiable)
-    return MoviePredictionModel(model_path)
\ No newline at end of file
+    """Get the shared model instance from the process-wide registry, the default hosted model when no path is given"""
+    from app.models.model_registry import get_registry
+    registry = get_registry()
+    return registry.get(model_path) if model_path else registry.get_model()
+
+def predict_movies(movies_df: pd.DataFrame, model_path: str = None, parallel: bool = False) -> List[Dict[str, Any]]:
+    """
+    Preprocess raw movie rows and predict them with the shared model
+
+    This is the unit of work run on the inference executor. It is a
+    module-level function so it can also be sent to worker processes, where
+    it loads the process's own model instance on first use.
+
+    Args:
+        movies_df: Raw movie rows
+        model_path: Model to predict with, the default model if None
+        parallel: Shard the preprocessing of large batches over worker
+            processes (see app.preprocessing.parallel)
+    """
+    BATCH_SIZE.observe(len(movies_df))
+    model = get_model_instance(model_path)
+    if parallel:
+        from app.preprocessing.parallel import preprocess_parallel
+        processed_df = preprocess_parallel(movies_df, stages=model.feature_stages)
+    else:
+        processed_df = preprocess_movie_data(movies_df, stages=model.feature_stages)
+    return model.predict(processed_df)
+
+def predict_movies_routed(movies_df: pd.DataFrame, model_names: Optional[List[str]] = None,
+                          parallel: bool = False) -> List[Dict[str, Any]]:
+    """
+    Preprocess raw movie rows once and predict each row with the hosted model named for it
+
+    Args:
+        movies_df: Raw movie rows
+        model_names: Name of the model of each row, by default the model the
+            router picks from each film title
+        parallel: Shard the preprocessing of large batches over worker
+            processes (see app.preprocessing.parallel)
+    """
+    from app.models.model_registry import get_registry
+    BATCH_SIZE.observe(len(movies_df))
+    if model_names is None:
+        from app.models.model_router import get_router
+        titles = movies_df['film_title'] if 'film_title' in movies_df.columns else [None] * len(movies_df)
+        model_names = get_router().route_many(list(titles))
+    registry = get_registry()
+    models = {name: registry.get_model(name) for name in dict.fromkeys(model_names)}
+    stages = merge_plans(m.feature_stages for m in models.values())
+    if parallel:
+        from app.preprocessing.parallel import preprocess_parallel
+        processed_df = preprocess_parallel(movies_df, stages=stages)
+    else:
+        processed_df = preprocess_movie_data(movies_df, stages=stages)
+    
+    results = [None] * len(processed_df)
+    names = pd.Series(list(model_names))
+    for name, positions in names.groupby(names).indices.items():
+        predictions = models[name].predict(processed_df.iloc[positions])
+        for position, prediction in zip(positions, predictions):
+            prediction['features']['model'] = name
+            results[position] = prediction
+    return results
+
+def predict_movies_with_models(movies_df: pd.DataFrame, model_names: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Preprocess raw movie rows once and predict all of them with each of several hosted models
+
+    Returns:
+        Predictions of each model, by model name
+    """
+    from app.models.model_registry import get_registry
+    BATCH_SIZE.observe(len(movies_df))
+    registry = get_registry()
+    models = {name: registry.get_model(name) for name in model_names}
+    processed_df = preprocess_movie_data(movies_df, stages=merge_plans(m.feature_stages for m in models.values()))
+    
+    results = {}
+    for name, model in models.items():
+        predictions = model.predict(processed_df)
+        for prediction in predictions:
+            prediction['features']['model'] = name
+        results[name] = predictions
+    return results
@@ -0,0 +1,131 @@
+"""
+Prediction engines behind MoviePredictionModel
+
+A Predictor turns a preprocessed batch (the DataFrame returned by
+preprocess_movie_data) into one predicted number of entries per row. The
+CatBoost model, the rule-based fallback and the stub of the degraded mode
+implement the same interface, so each can be benchmarked on its own or run
+next to another one as a shadow.
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.parsing import string_values
+from app.utils.metrics import FEATURE_MATRIX_DURATION, MODEL_DURATION, STUB_PREDICTIONS, timed
+
+logger = logging.getLogger(__name__)
+
+
+class Predictor(ABC):
+    """Interface of the prediction engines"""
+
+    # Reported as the prediction method in the API responses and metrics
+    name = "predictor"
+
+    # Columns of the preprocessed batch read by predict, used to plan the feature stages
+    required_columns: Tuple[str, ...] = ('film_title',)
+
+    @abstractmethod
+    def predict(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        Predict a preprocessed batch
+
+        Args:
+            features: DataFrame returned by preprocess_movie_data
+
+        Returns:
+            Float array with one predicted number of entries per row
+        """
+
+
+class CatBoostPredictor(Predictor):
+    """
+    CatBoost model fed through the feature schema builder
+
+    Args:
+        model: Loaded CatBoostRegressor
+        feature_builder: FeatureMatrixBuilder of the model's schema
+    """
+
+    name = "catboost"
+
+    def __init__(self, model, feature_builder):
+        self.model = model
+        self.feature_builder = feature_builder
+        self.required_columns = ('film_title', *feature_builder.schema.source_columns)
+
+    def predict(self, features: pd.DataFrame) -> np.ndarray:
+        with timed(FEATURE_MATRIX_DURATION):
+            pool = self.feature_builder.build_pool(features)
+        with timed(MODEL_DURATION):
+            return np.asarray(self.model.predict(pool), dtype=float)
+
+
+class RuleBasedPredictor(Predictor):
+    """
+    Fallback estimate from the franchise features, computed column-wise
+
+    A base of 800k entries is raised by franchise_level and the superhero,
+    animation, action and blockbuster flags, then varied by -10% to +9%
+    according to a deterministic hash of the title.
+    """
+
+    name = "rule_based"
+
+    BASE_ENTRIES = 800000
+    FRANCHISE_LEVEL_ENTRIES = 300000
+    FLAG_ENTRIES = {
+        'is_superhero_franchise': 1000000,
+        'is_animation_franchise': 800000,
+        'is_action_franchise': 600000,
+        'is_likely_blockbuster': 1200000,
+    }
+
+    required_columns = ('film_title', 'franchise_level', *FLAG_ENTRIES)
+
+    @staticmethod
+    def title_variation(titles: pd.Series) -> np.ndarray:
+        """Deterministic variation in [-0.10, 0.09] per title, from pandas' SipHash of the text"""
+        hashes = pd.util.hash_pandas_object(string_values(titles), index=False).to_numpy()
+        return ((hashes % 20).astype(np.int64) - 10) / 100
+
+    def predict(self, features: pd.DataFrame) -> np.ndarray:
+        base = np.full(len(features), self.BASE_ENTRIES, dtype=np.int64)
+
+        if 'franchise_level' in features.columns:
+            level = pd.to_numeric(features['franchise_level'], errors='coerce').to_numpy(dtype=float)
+            base += np.where(np.isnan(level), 0, np.trunc(level)).astype(np.int64) * self.FRANCHISE_LEVEL_ENTRIES
+
+        for flag, entries in self.FLAG_ENTRIES.items():
+            if flag in features.columns:
+                base += (features[flag] == 1).to_numpy() * entries
+
+        variation = self.title_variation(features['film_title'])
+        return np.trunc(base * (1 + variation))
+
+
+class StubPredictor(Predictor):
+    """
+    Placeholder engine of the degraded mode, used when no model file could be loaded
+
+    Returns a deterministic number of entries in [MIN_ENTRIES, MAX_ENTRIES]
+    per title, so responses keep their shape and stay stable between calls,
+    but the values carry no information. Every film it serves is counted in
+    movie_api_stub_predictions.
+    """
+
+    name = "mock_model"
+
+    MIN_ENTRIES = 300000
+    MAX_ENTRIES = 3000000
+
+    def predict(self, features: pd.DataFrame) -> np.ndarray:
+        span = self.MAX_ENTRIES - self.MIN_ENTRIES + 1
+        hashes = pd.util.hash_pandas_object(string_values(features['film_title']), index=False).to_numpy()
+        predictions = (self.MIN_ENTRIES + hashes % span).astype(float)
+        STUB_PREDICTIONS.inc(len(predictions))
+        return predictions
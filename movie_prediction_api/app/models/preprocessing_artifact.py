@@ -0,0 +1,212 @@
+"""
+Preprocessing statistics fitted once on the training data
+
+The artifact stores the StandardScaler statistics of the continuous features,
+the vocabulary of each categorical feature and the items of each list column
+kept for the multi-hot features (see app.models.multi_hot). It is loaded with the model
+and applied with a plain array transform, so a single film is scaled exactly
+like the same film inside a large batch.
+
+Build it from the training CSV of the model, with raw film columns:
+    python -m app.models.preprocessing_artifact training_films.csv
+
+Fitting refuses features missing from the CSV or holding a single value
+(an identity scaler or a one-category vocabulary would silently pass
+unfitted features to the model); films_nettoyes.csv, for one, has no
+trailer views.
+"""
+import os
+import json
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 1
+ARTIFACT_FILENAME = "preprocessing.json"
+
+# Training exports name some raw columns differently from MovieInput
+TRAINING_COLUMN_ALIASES = {
+    'titre': 'film_title',
+    'synopsis_y': 'synopsis',
+}
+
+
+def _is_integral(series: pd.Series) -> bool:
+    """Whether a numeric column only holds integers, missing values aside"""
+    if not pd.api.types.is_float_dtype(series.dtype):
+        return False
+    values = series.dropna().to_numpy()
+    return bool(len(values)) and bool(np.all(np.mod(values, 1) == 0))
+
+
+class PreprocessingArtifact:
+    """
+    Fitted scaler statistics and categorical vocabularies
+
+    Args:
+        continuous_cols: Scaled columns, in the order of mean and scale
+        mean: Mean of each continuous column on the training data
+        scale: Standard deviation of each continuous column (1 when constant)
+        vocabularies: Sorted distinct values of each categorical column
+        metadata: Free-form information about how the artifact was built
+        multi_hot_items: Sorted items of each list column that get a multi-hot feature
+    """
+
+    def __init__(self, continuous_cols: List[str], mean: List[float], scale: List[float],
+                 vocabularies: Dict[str, List[str]] = None, metadata: Dict = None,
+                 multi_hot_items: Dict[str, List[str]] = None):
+        self.continuous_cols = list(continuous_cols)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.vocabularies = vocabularies or {}
+        self.metadata = metadata or {}
+        self.multi_hot_items = multi_hot_items or {}
+        self._positions = {col: i for i, col in enumerate(self.continuous_cols)}
+
+    @classmethod
+    def fit(cls, features: pd.DataFrame, continuous_cols: List[str], categorical_cols: List[str],
+            metadata: Dict = None, multi_hot_min_count: int = 1) -> "PreprocessingArtifact":
+        """
+        Fit the statistics on preprocessed training features
+
+        Items of the list columns found in fewer than multi_hot_min_count
+        films get no multi-hot feature.
+
+        Raises:
+            ValueError: If a continuous or categorical column is missing from
+                features or holds a single value
+        """
+        from sklearn.preprocessing import StandardScaler
+        from app.models.feature_schema import distinct_strings
+        from app.models.multi_hot import MultiHotEncoder
+
+        columns = list(continuous_cols) + list(categorical_cols)
+        missing = [col for col in columns if col not in features.columns]
+        constant = [col for col in columns if col in features.columns and features[col].nunique(dropna=False) < 2]
+        if missing or constant:
+            raise ValueError(f"Cannot fit the preprocessing artifact: missing columns {missing}, "
+                             f"constant columns {constant}")
+
+        scaler = StandardScaler().fit(features[continuous_cols].astype(float))
+
+        # Integer categoricals stored as floats (missing values) keep their integer categories
+        vocabularies = {
+            col: sorted(distinct_strings(features[col], _is_integral(features[col]))[1].tolist())
+            for col in categorical_cols
+        }
+
+        metadata = dict(metadata or {})
+        metadata.setdefault('n_rows', int(len(features)))
+        metadata.setdefault('fitted_at', datetime.now().isoformat(timespec='seconds'))
+
+        multi_hot_items = MultiHotEncoder.fit_items(features, multi_hot_min_count)
+
+        return cls(continuous_cols, scaler.mean_.tolist(), scaler.scale_.tolist(), vocabularies, metadata,
+                   multi_hot_items)
+
+    def scale_columns(self, df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+        """
+        Standardize columns of df with the fitted statistics
+
+        Returns:
+            Float array of shape (len(df), len(columns))
+        """
+        positions = [self._positions[col] for col in columns]
+        values = df[columns].to_numpy(dtype=float)
+        return (values - self.mean[positions]) / self.scale[positions]
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': ARTIFACT_VERSION,
+            'metadata': self.metadata,
+            'scaler': {
+                'columns': self.continuous_cols,
+                'mean': self.mean.tolist(),
+                'scale': self.scale.tolist(),
+            },
+            'vocabularies': self.vocabularies,
+            'multi_hot_items': self.multi_hot_items,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PreprocessingArtifact":
+        if data.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported preprocessing artifact version: {data.get('version')}")
+        scaler = data['scaler']
+        return cls(scaler['columns'], scaler['mean'], scaler['scale'], data.get('vocabularies'), data.get('metadata'),
+                   data.get('multi_hot_items'))
+
+    def multi_hot_encoder(self):
+        """MultiHotEncoder of the frozen list items, to build the training block of a richer model"""
+        from app.models.feature_schema import clean_feature_name
+        from app.models.multi_hot import MultiHotEncoder
+
+        return MultiHotEncoder.from_items(self.multi_hot_items, clean_feature_name)
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        logger.info(f"Saved preprocessing artifact to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "PreprocessingArtifact":
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def artifact_path_for(model_path: str) -> str:
+    """Location of the preprocessing artifact that goes with a model file"""
+    return os.getenv("PREPROCESSING_ARTIFACT_PATH") or os.path.join(os.path.dirname(model_path), ARTIFACT_FILENAME)
+
+
+def load_preprocessing_artifact(model_path: str) -> Optional[PreprocessingArtifact]:
+    """Load the artifact next to the model, or None if there is none"""
+    path = artifact_path_for(model_path)
+    if not os.path.exists(path):
+        logger.warning(f"No preprocessing artifact at {path}, continuous features will be scaled per batch")
+        return None
+    try:
+        artifact = PreprocessingArtifact.load(path)
+        logger.info(f"Preprocessing artifact loaded from {path}")
+        return artifact
+    except Exception as e:
+        logger.error(f"Failed to load preprocessing artifact {path}: {str(e)}")
+        return None
+
+
+def build_from_csv(csv_path: str, output_path: str) -> PreprocessingArtifact:
+    """Run the feature pipeline over a training CSV and fit the artifact on it"""
+    from app.preprocessing.feature_engineering import preprocess_movie_data
+    from app.models.prediction_model import CONTINUOUS_COLS, CATEGORICAL_COLS, RAW_CATEGORICAL_COLS
+
+    raw = pd.read_csv(csv_path)
+    for source, target in TRAINING_COLUMN_ALIASES.items():
+        if source in raw.columns and target not in raw.columns:
+            raw = raw.rename(columns={source: target})
+
+    features = preprocess_movie_data(raw)
+    artifact = PreprocessingArtifact.fit(
+        features, CONTINUOUS_COLS, CATEGORICAL_COLS + RAW_CATEGORICAL_COLS,
+        metadata={'source': os.path.basename(csv_path)}
+    )
+    artifact.save(output_path)
+    return artifact
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Fit the preprocessing artifact on a training CSV")
+    parser.add_argument("csv_path", help="CSV with raw film columns (film_title, duration, synopsis, ...)")
+    parser.add_argument("--output", default=os.path.join("model", ARTIFACT_FILENAME), help="Where to write the artifact")
+    args = parser.parse_args()
+
+    built = build_from_csv(args.csv_path, args.output)
+    print(f"Fitted on {built.metadata['n_rows']} films: {len(built.continuous_cols)} scaled columns, "
+          f"{len(built.vocabularies)} vocabularies, "
+          f"{sum(len(items) for items in built.multi_hot_items.values())} multi-hot items")
@@ -1,22 +1,49 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime
-import re
 import ast
 import calendar
-from textblob import TextBlob
+import sys
 import logging
-import re 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from app.preprocessing.history_index import get_history_index
+from app.preprocessing.keywords import KEYWORDS
+from app.preprocessing.parsing import parse_count, parse_duration, parse_trailer_views, parse_year
+from app.preprocessing.sentiment import compute_polarity
+from app.utils.metrics import STAGE_DURATION, timed
+
 logger = logging.getLogger(__name__)
 
-def preprocess_movie_data(movie_data):
+# Feature stages in the order preprocess_movie_data runs them. Both this module
+# and app.preprocessing.vectorized define a function for each name.
+PIPELINE_STAGES = [
+    'transform_basic_features',
+    'add_placeholder_columns',
+    'add_date_features',
+    'add_duration_features',
+    'add_director_features',
+    'add_people_features',
+    'add_cultural_features',
+    'add_genre_features',
+    'add_synopsis_features',
+    'add_distributor_features',
+    'add_history_features',
+    'add_franchise_features',
+    'add_licence_features',
+    'add_studio_features',
+    'add_interaction_features',
+]
+
+def preprocess_movie_data(movie_data, vectorized: bool = True, stages: list = None):
     """
     Process raw movie data and transform it into the format required by the model
     
     Args:
         movie_data: DataFrame or dict containing raw movie data
+        vectorized: Use the column-wise implementation of the feature stages
+            (app.preprocessing.vectorized). The row-wise stages below are kept
+            as the reference implementation.
+        stages: Names of the stages to run, in pipeline order (see
+            app.preprocessing.feature_plan), all of them by default
     
     Returns:
         DataFrame with processed features
@@ -42,28 +69,51 @@ def preprocess_movie_data(movie_data):
         if col not in df.columns:
             df[col] = None
     
-    # Transform and add empty columns for any missing expected columns
-    df = transform_basic_features(df)
-    
-    # Add all the engineered features
-    df = add_date_features(df)
-    df = add_duration_features(df)
-    df = add_director_features(df)
-    df = add_people_features(df)
-    df = add_cultural_features(df)
-    df = add_synopsis_features(df)
-    df = add_distributor_features(df)
-    df = add_franchise_features(df)
-    df = add_licence_features(df)
-    df = add_studio_features(df)
-    df = add_interaction_features(df)
+    # Transform and add empty columns for any missing expected columns,
+    # then add all the engineered features
+    for stage in get_pipeline_stages(vectorized, stages):
+        with timed(STAGE_DURATION, stage=stage.__name__):
+            df = stage(df)
     
     return df
 
+def get_pipeline_stages(vectorized: bool = True, names: list = None) -> list:
+    """
+    Get the ordered feature stages run by preprocess_movie_data
+    
+    Args:
+        vectorized: Return the column-wise stages instead of the row-wise ones
+        names: Only return these stages (still in pipeline order)
+    
+    Returns:
+        List of functions taking and returning a DataFrame
+    """
+    if vectorized:
+        from app.preprocessing import vectorized as stages
+    else:
+        stages = sys.modules[__name__]
+    
+    selected = PIPELINE_STAGES if names is None else [name for name in PIPELINE_STAGES if name in names]
+    return [getattr(stages, name) for name in selected]
+
 def transform_basic_features(df):
     """
     Transform the basic features to expected format
     """
+    # Convert duration from string to minutes
+    if 'duration' in df.columns:
+        df['duration'] = df['duration'].apply(parse_duration)
+    
+    # Parse year of production if it's a string
+    if 'year_of_production' in df.columns and df['year_of_production'].dtype == 'object':
+        df['year_of_production'] = df['year_of_production'].apply(lambda x: parse_year(x) if pd.notna(x) else None)
+    
+    return df
+
+def add_placeholder_columns(df):
+    """
+    Add the placeholder and default columns of the scraped dataset that the API does not receive
+    """
     # Create URL and image URL placeholders
     if 'film_url' not in df.columns:
         df['film_url'] = df['film_title'].apply(lambda x: f"https://www.allocine.fr/film/fichefilm_gen_cfilm={hash(x) % 1000000}.html")
@@ -75,14 +125,6 @@ def transform_basic_features(df):
     if 'film_id' not in df.columns:
         df['film_id'] = df['film_title'].apply(lambda x: hash(x) % 1000000)
     
-    # Convert duration from string to minutes
-    if 'duration' in df.columns:
-        df['duration'] = df['duration'].apply(parse_duration)
-    
-    # Parse year of production if it's a string
-    if 'year_of_production' in df.columns and df['year_of_production'].dtype == 'object':
-        df['year_of_production'] = df['year_of_production'].apply(lambda x: parse_year(x) if pd.notna(x) else None)
-    
     # Ensure we have ratings (defaults)
     if 'press_rating' not in df.columns:
         df['press_rating'] = 2.5
@@ -232,7 +274,12 @@ def add_cultural_features(df):
         lambda x: 1 if isinstance(x, list) and any(nat.lower() == 'france' for nat in x) else 0
     )
     
-    # Process associated_genres_list
+    return df
+
+def add_genre_features(df):
+    """
+    Add features related to the associated genres
+    """
     df['associated_genres_list'] = df['associated_genres'].apply(parse_list_string)
     df['associated_genres_count'] = df['associated_genres_list'].apply(
         lambda x: len(x) if isinstance(x, list) else 0
@@ -254,7 +301,7 @@ def add_synopsis_features(df):
     
     # Calculate synopsis sentiment
     df['synopsis_sentiment'] = df['synopsis'].apply(
-        lambda x: TextBlob(str(x) if pd.notna(x) else "").sentiment.polarity
+        lambda x: compute_polarity(str(x) if pd.notna(x) else "")
     )
     
     def categorize_synopsis_length(num):
@@ -284,9 +331,7 @@ def add_synopsis_features(df):
     df['synopsis_length_categorized'] = df['synopsis_length'].apply(categorize_synopsis_length)
     df['synopisis_sentiment_categorized'] = df['synopsis_sentiment'].apply(categorize_synopsis_sentiment)
     
-    df['filming_secrets_num'] = df['filming_secrets'].apply(
-        lambda x: int(re.search(r'\d+', str(x)).group()) if pd.notna(x) and re.search(r'\d+', str(x)) else 0
-    )
+    df['filming_secrets_num'] = df['filming_secrets'].apply(parse_count)
     
     if 'awards' in df.columns:
         
@@ -320,89 +365,15 @@ def add_distributor_features(df):
         lambda x: 1 if pd.notna(x) and x != '' else 0
     )
     
-    # Define top distributors
-    top_distributor = {
-        'walt disney': 3.0,
-        'marvel studios': 3.0,
-        'universal': 2.5,
-        'paramount': 2.5,
-        'warner bros': 2.5,
-        'sony': 2.0,
-        'columbia': 2.0,
-        '20th century': 2.0,
-        'studiocanal': 2.0,
-        'gaumont': 2.0,
-        'pathé': 2.0,
-        'netflix': 2.0,
-        'snd': 1.8,
-        'diaphana': 1.8,
-        'memento': 1.5,
-        'apollo': 1.5,
-        'ufo': 1.2,
-        'tf1': 1.2,
-        'metropolitan': 1.2,
-        'pyramide': 1.2,
-        'losange': 1.2,
-        'le pacte': 1.0,
-        'wild bunch': 1.0,
-        'kmbo': 1.0,
-        'jhr': 1.0,
-        'gebeka': 1.0,
-        'rezo': 1.0
-    }
-    
     # Score top distributors
     df['top_distributor_score'] = df['distributor'].apply(
-        lambda x: 1 if isinstance(x, str) and any(distributor.lower() in str(x).lower() for distributor in top_distributor) else 0.5
+        lambda x: 1 if isinstance(x, str) and any(distributor.lower() in str(x).lower() for distributor in KEYWORDS['top_distributors']) else 0.5
     )
     
-    # Weight dictionaries for distributor power
-    studio_weights = {
-        'walt disney': 3.0,
-        'marvel studios': 3.0,
-        'universal': 2.5,
-        'paramount': 2.5,
-        'warner bros': 2.5,
-        'sony': 2.0,
-        'columbia': 2.0,
-        '20th century': 2.0,
-        'netflix': 2.0,
-    }
-    
-    distributor_weights = {
-        'walt disney': 3.0,
-        'universal': 2.5,
-        'paramount': 2.5,
-        'warner bros': 2.5,
-        'sony': 2.0,
-        'studiocanal': 2.0,
-        'gaumont': 2.0,
-        'pathé': 2.0,
-        'netflix': 2.0,
-        'snd': 1.8,
-        'diaphana': 1.8,
-        'memento': 1.5,
-        'apollo': 1.5,
-        'ufo': 1.2,
-        'tf1': 1.2,
-        'metropolitan': 1.2,
-        'pyramide': 1.2,
-        'losange': 1.2,
-    }
-    
-    independent_weights = {
-        'le pacte': 1.0,
-        'wild bunch': 1.0,
-        'kmbo': 1.0,
-        'jhr': 1.0,
-        'gebeka': 1.0,
-        'rezo': 1.0,
-    }
-    
     # Normalize keys
-    studio_weights = {k.lower(): v for k, v in studio_weights.items()}
-    distributor_weights = {k.lower(): v for k, v in distributor_weights.items()}
-    independent_weights = {k.lower(): v for k, v in independent_weights.items()}
+    studio_weights = {k.lower(): v for k, v in KEYWORDS['studio_weights'].items()}
+    distributor_weights = {k.lower(): v for k, v in KEYWORDS['distributor_weights'].items()}
+    independent_weights = {k.lower(): v for k, v in KEYWORDS['independent_weights'].items()}
     
     # Function to compute power from fuzzy matching
     def compute_power_fuzzy(distributor):
@@ -433,151 +404,69 @@ def add_distributor_features(df):
     
     return df
 
+def add_history_features(df):
+    """
+    Add the track record of the director, stars and distributor in past
+    French releases (see app.preprocessing.history_index): number of past
+    films and mean first-week entries, NaN when the name is unknown
+    """
+    index = get_history_index()
+
+    director = df['director'].apply(lambda x: index.lookup('director', x))
+    df['director_past_films'] = director.apply(lambda x: x[0])
+    df['director_past_entries'] = director.apply(lambda x: x[1])
+
+    def star_entries(stars):
+        entries = [index.lookup('star', star)[1] for star in stars] if isinstance(stars, list) else []
+        return [x for x in entries if not np.isnan(x)]
+
+    stars = df['top_stars_list'].apply(star_entries)
+    df['stars_past_known'] = stars.apply(len)
+    df['stars_past_entries'] = stars.apply(lambda x: np.mean(x) if x else np.nan)
+    df['stars_past_max_entries'] = stars.apply(lambda x: max(x) if x else np.nan)
+
+    distributor = df['distributor'].apply(lambda x: index.lookup('distributor', x))
+    df['distributor_past_films'] = distributor.apply(lambda x: x[0])
+    df['distributor_past_entries'] = distributor.apply(lambda x: x[1])
+
+    return df
+
 def add_franchise_features(df):
     """
     Add features related to movie franchise status
     """
-    # Define franchise lists
-    top_franchises = [
-        'mad max', 'iron man', 'captain america', 'thor', 'wolverine',
-        'mission impossible', 'terminator', 'hunger games', 'twilight',
-        'pirates des caraïbes', 'le hobbit', 'matrix', 'minecraft',
-        'les minions', 'john wick', 'alien', 'predator', 'rocky', 'rambo',
-        'conjuring', 'saw', 'scream', 'halloween', 'barbie',
-        'harry potter', 'star wars', 'spider-man', 'avengers', 'x-men',
-        'batman', 'jurassic', 'fast and furious', 'transformers',
-        'le seigneur des anneaux', 'shrek', 'le roi lion', 'indiana jones',
-        "l'âge de glace", 'deadpool', 'super mario bros', 'les animaux fantastiques',
-        'avatar', 'les dents de la', 'les gardiens de la galaxie'
-    ]
-    
-    # Mega franchises
-    mega_franchises = [
-        'avatar', 'jurassic', 'star wars', 'harry potter',
-        'avengers', 'fast and furious', 'le roi lion', 'spider-man'
-    ]
-    
-    # Major franchises
-    major_franchises = [
-        'iron man', 'captain america', 'x-men', 'batman',
-        'transformers', 'deadpool', 'les minions', 'moi moche et méchant',
-        'mission impossible', 'shrek', 'le seigneur des anneaux', "l'âge de glace",
-        'super mario bros'
-    ]
-    
-    # Big franchises
-    big_franchises = [
-        'mad max', 'hunger games', 'twilight', 'john wick', 'thor', 'wolverine',
-        'matrix', 'pirates des caraïbes', 'le hobbit', 'conjuring',
-        'les animaux fantastiques', 'indiana jones', 'les gardiens de la galaxie',
-        'minecraft', 'rocky', 'rambo', 'alien', 'predator',
-        'scream', 'saw', 'halloween', 'barbie', 'terminator', 'les dents de la'
-    ]
-    
     # Detection function using franchise level
-    def identify_franchise_level(title, top_franchises):
+    def identify_franchise_level(title):
         # Return the franchise power level (0 to 4) based on the film title.
         if not isinstance(title, str):
             return 0
         
         title_lower = title.lower()
         
-        if any(f in title_lower for f in mega_franchises):
+        if any(f in title_lower for f in KEYWORDS['mega_franchises']):
             return 4
-        if any(f in title_lower for f in major_franchises):
+        if any(f in title_lower for f in KEYWORDS['major_franchises']):
             return 3
-        if any(f in title_lower for f in big_franchises):
+        if any(f in title_lower for f in KEYWORDS['big_franchises']):
             return 2
-        return 1 if any(f in title_lower for f in top_franchises) else 0
+        return 1 if any(f in title_lower for f in KEYWORDS['top_franchises']) else 0
     
-    df['franchise_level'] = df['film_title'].apply(lambda x: identify_franchise_level(x, top_franchises))
-    
-    # MCU titles
-    mcu_titles = [
-        'avengers', 'iron man', 'captain america', 'thor', 'hulk',
-        'black panther', 'doctor strange', 'les gardiens de la galaxie',
-        'ant-man', 'spider-man', 'les eternels', 'shang-chi', 'black widow',
-        'marvels', 'wanda', 'vision', 'falcon', "le soldat de l'hiver"
-    ]
+    df['franchise_level'] = df['film_title'].apply(identify_franchise_level)
     
     df['is_mcu'] = df['film_title'].apply(
-        lambda x: 1 if isinstance(x, str) and any(title in x.lower() for title in mcu_titles) else 0
+        lambda x: 1 if isinstance(x, str) and any(title in x.lower() for title in KEYWORDS['mcu_titles']) else 0
     )
     
-    # Likely blockbusters
-    likely_blockbusters = [
-        'avengers', 'star wars', 'jurassic world', 'avatar',
-        'harry potter', 'spider-man', 'batman', 'superman',
-        'fast and furious', 'frozen', 'la reine des neiges',
-        'minions', 'le roi lion',
-        'the dark knight', 'barbie', 'oppenheimer',
-        'mario', 'les animaux fantastiques'
-    ]
-    
     df['is_likely_blockbuster'] = df['film_title'].apply(
-        lambda x: 1 if isinstance(x, str) and any(f.lower() in x.lower() for f in likely_blockbusters) else 0
+        lambda x: 1 if isinstance(x, str) and any(f.lower() in x.lower() for f in KEYWORDS['likely_blockbusters']) else 0
     )
-    
-    # Calculate franchise blockbuster score
-    def calculate_franchise_blockbuster_score(row):
-        # 1. Base score from franchise level
-        base_score = row['franchise_level'] * 2
-        
-        # 2. Bonus for each franchise category
-        bonus_score = sum([
-            row.get('is_superhero_franchise', 0),
-            row.get('is_animation_franchise', 0),
-            row.get('is_action_franchise', 0),
-            row.get('is_gaming_franchise', 0),
-            row.get('is_sequel', 0)
-        ])
-        
-        # 3. Bonus for "strong" distributors
-        strong_distributors = [
-            'warner', 'disney', 'universal', 'paramount', 
-            'sony', '20th century', 'pathé', 'gaumont', 'netflix'
-        ]
-        
-        dist_bonus = 0
-        if isinstance(row.get('distributor'), str):
-            dist_bonus = 1 if any(sd.lower() in row['distributor'].lower() for sd in strong_distributors) else 0
-        
-        # 4. Combine everything
-        return base_score + bonus_score + dist_bonus
-    
-    # We'll calculate this after adding the licence features
-    
+
+    # franchise_blockbuster_score is calculated after adding the licence features
+
     return df
 
 def add_licence_features(df):
     
-    superhero_franchises = [
-        'marvel', 'avengers', 'captain america', 'iron man', 'thor', 'hulk',
-        'batman', 'superman', 'dc', 'justice league', 'x-men', 'spider-man',
-        'wolverine', 'deadpool', 'les gardiens de la galaxie'
-    ]
-    
-    animation_franchises = [
-        'disney', 'pixar', 'dreamworks', 'illumination', 'vaiana', 'astérix',
-        'shrek', 'toy story', 'madagascar', 'minions', 'vice-versa',
-        'moi, moche et méchant', "l'âge de glace", 'le roi lion', 'super mario bros'
-    ]
-    
-    action_franchises = [
-        'mad max', 'fast and furious', '007', 'mission : impossible',
-        'star wars', 'harry potter', 'hunger games', 'jurassic', 'terminator',
-        'dune', 'john wick', 'matrix', 'indiana jones', 'le seigneur des anneaux',
-        'le hobbit', 'barbie', 'conjuring', 'saw', 'scream', 'halloween',
-        'rocky', 'rambo', 'alien', 'predator', 'les animaux fantastiques',
-        'les dents de la'
-    ]
-    
-    gaming_franchises = [
-        'minecraft', 'mario', 'super mario bros', 'pokemon', 'tomb raider',
-        "assassin's creed", 'sonic', 'mortal kombat', 'uncharted', 'warcraft'
-    ]
-    
-    
     def contains_any(text, keywords):
         if not isinstance(text, str):
             return False
@@ -585,19 +474,19 @@ def add_licence_features(df):
         return any(f in text for f in keywords)
     
     df['is_superhero_franchise'] = df['film_title'].apply(
-        lambda x: int(contains_any(x, superhero_franchises)) if pd.notna(x) else 0
+        lambda x: int(contains_any(x, KEYWORDS['superhero_franchises'])) if pd.notna(x) else 0
     )
     
     df['is_animation_franchise'] = df['film_title'].apply(
-        lambda x: int(contains_any(x, animation_franchises)) if pd.notna(x) else 0
+        lambda x: int(contains_any(x, KEYWORDS['animation_franchises'])) if pd.notna(x) else 0
     )
     
     df['is_action_franchise'] = df['film_title'].apply(
-        lambda x: int(contains_any(x, action_franchises)) if pd.notna(x) else 0
+        lambda x: int(contains_any(x, KEYWORDS['action_franchises'])) if pd.notna(x) else 0
     )
     
     df['is_gaming_franchise'] = df['film_title'].apply(
-        lambda x: int(contains_any(x, gaming_franchises)) if pd.notna(x) else 0
+        lambda x: int(contains_any(x, KEYWORDS['gaming_franchises'])) if pd.notna(x) else 0
     )
     
     df['is_licence'] = (
@@ -607,14 +496,8 @@ def add_licence_features(df):
         df['is_gaming_franchise']
     ).astype(int)
     
-    sequel_indicators = [
-        '2', '3', '4', '5', 'ii', 'iii', 'iv', 'v', 'vi', 
-        'le retour', 'la suite', 'chapitre', 'épisode', 'saga', 
-        'partie', 'part', 'volume'
-    ]
-    
     df['is_sequel'] = df['film_title'].apply(
-        lambda x: int(contains_any(x, sequel_indicators)) if pd.notna(x) else 0
+        lambda x: int(contains_any(x, KEYWORDS['sequel_indicators'])) if pd.notna(x) else 0
     )
     
     # Now calculate franchise_blockbuster_score
@@ -632,13 +515,8 @@ def add_licence_features(df):
     bonus_score = df[bonus_cols].sum(axis=1)
     
     # 3. Bonus for "strong" distributors
-    strong_distributors = [
-        'warner', 'disney', 'universal', 'paramount', 
-        'sony', '20th century', 'pathé', 'gaumont', 'netflix'
-    ]
-    
     dist_bonus = df['distributor'].apply(
-        lambda x: 1 if isinstance(x, str) and any(sd.lower() in x.lower() for sd in strong_distributors) else 0
+        lambda x: 1 if isinstance(x, str) and any(sd.lower() in x.lower() for sd in KEYWORDS['strong_distributors']) else 0
     )
     
     # 4. Combine everything
@@ -646,50 +524,6 @@ def add_licence_features(df):
     
     return df
 
-def parse_duration(duration_str):
-    """Parse duration string like '1h 44min' to minutes"""
-    if pd.isna(duration_str) or duration_str is None:
-        return 105  # Default duration
-    
-    if isinstance(duration_str, (int, float)):
-        return float(duration_str)
-    
-    total_minutes = 0
-    
-    # Extract hours
-    hours_match = re.search(r'(\d+)h', str(duration_str))
-    if hours_match:
-        total_minutes += int(hours_match.group(1)) * 60
-    
-    # Extract minutes
-    minutes_match = re.search(r'(\d+)min', str(duration_str))
-    if minutes_match:
-        total_minutes += int(minutes_match.group(1))
-    
-    # If no pattern matched but there's a number, assume it's minutes
-    if total_minutes == 0:
-        number_match = re.search(r'(\d+)', str(duration_str))
-        if number_match:
-            total_minutes = int(number_match.group(1))
-    
-    # If still zero, use default
-    return total_minutes if total_minutes > 0 else 105
-
-
-def parse_year(year_str):
-    """Parse year string to integer"""
-    if pd.isna(year_str) or year_str is None:
-        return None
-    
-    if isinstance(year_str, (int, float)):
-        return int(year_str)
-    
-    year_match = re.search(r'(\d{4})', str(year_str))
-    if year_match:
-        return int(year_match.group(1))
-    
-    return datetime.now().year
-
 def get_iso_week(date_str):
     """Get ISO week number from date string"""
     if pd.isna(date_str) or date_str is None:
@@ -734,52 +568,17 @@ def parse_list_string(list_str):
     
     return []
 
-def parse_trailer_views(views_str):
-    """Parse trailer views string to number"""
-    if pd.isna(views_str) or views_str is None:
-        return 0
-    
-    if isinstance(views_str, (int, float)):
-        return float(views_str)
-    
-    # Remove non-numeric characters and convert to number
-    views_str = str(views_str)
-    # Try to extract numbers
-    num_match = re.findall(r'[\d\s.,]+', views_str)
-    if num_match:
-        # Join all matches and clean
-        num_str = ''.join(num_match)
-        # Replace common thousand separators
-        num_str = num_str.replace(' ', '').replace(',', '').replace('.', '')
-        try:
-            return float(num_str)
-        except ValueError:
-            pass
-    
-    return 0
-
 def add_studio_features(df):
     """
     Add features related to studio and production company
     """
-    # Define studio categories
-    major_studios = [
-        'disney', 'warner', 'universal', 'sony', 'paramount',
-        '20th century', 'fox', 'gaumont', 'pathé',
-        'netflix', 'amazon', 'apple'
-    ]
-    
-    french_majors = [
-        'studiocanal', 'gaumont', 'pathé', 'ufp', 'snd', 'diaphana'
-    ]
-    
     # Create studio feature columns
     df['is_major_studio'] = df['distributor'].apply(
-        lambda x: 1 if isinstance(x, str) and any(studio.lower() in x.lower() for studio in major_studios) else 0
+        lambda x: 1 if isinstance(x, str) and any(studio.lower() in x.lower() for studio in KEYWORDS['major_studios']) else 0
     )
     
     df['is_french_major_studio'] = df['distributor'].apply(
-        lambda x: 1 if isinstance(x, str) and any(fm.lower() in x.lower() for fm in french_majors) else 0
+        lambda x: 1 if isinstance(x, str) and any(fm.lower() in x.lower() for fm in KEYWORDS['french_majors']) else 0
     )
     
     # Create composite features
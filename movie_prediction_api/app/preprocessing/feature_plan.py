@@ -0,0 +1,148 @@
+"""
+Dependency-aware selection of the feature stages a model needs
+
+Each stage of preprocess_movie_data declares the columns it reads and the
+columns it writes. Given the columns consumed by a model (its feature list,
+read when the model is loaded) the planner keeps only the stages that
+produce them, directly or through the columns later stages read, so online
+inference skips the placeholder columns and the features no model uses.
+
+Set FEATURE_PRUNING=0 to always run every stage.
+"""
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from app.preprocessing.feature_engineering import PIPELINE_STAGES
+
+logger = logging.getLogger(__name__)
+
+FEATURE_PRUNING = os.getenv("FEATURE_PRUNING", "1") != "0"
+
+
+@dataclass(frozen=True)
+class StageColumns:
+    """
+    Columns read and written by a feature stage
+
+    Args:
+        requires: Columns the stage reads
+        produces: Columns the stage writes, including the ones it rewrites in place
+    """
+    requires: Tuple[str, ...]
+    produces: Tuple[str, ...]
+
+
+STAGE_COLUMNS: Dict[str, StageColumns] = {
+    'transform_basic_features': StageColumns(
+        requires=('duration', 'year_of_production'),
+        produces=('duration', 'year_of_production'),
+    ),
+    'add_placeholder_columns': StageColumns(
+        requires=('film_title', 'release_date'),
+        produces=('film_url', 'film_image_url', 'film_id', 'press_rating', 'viewer_rating', 'fr_entries',
+                  'us_entries', 'budget', 'fr_entry_week_iso_week', 'us_entry_week_iso_week', 'viewer_notes',
+                  'viewer_critiques', 'press_critics_count_num'),
+    ),
+    'add_date_features': StageColumns(
+        requires=('release_date',),
+        produces=('release_date', 'release_date_france_year', 'release_date_france_month',
+                  'release_date_france_day', 'release_season', 'release_season_binary', 'release_date_binary'),
+    ),
+    'add_duration_features': StageColumns(
+        requires=('duration',),
+        produces=('duration_binary', 'duration_classified'),
+    ),
+    'add_director_features': StageColumns(
+        requires=('director',),
+        produces=('director_binary',),
+    ),
+    'add_people_features': StageColumns(
+        requires=('producers', 'top_stars'),
+        produces=('producers_list', 'producers_count', 'producers_count_binary',
+                  'top_stars_list', 'top_stars_count', 'top_stars_count_binary'),
+    ),
+    'add_cultural_features': StageColumns(
+        requires=('languages', 'film_nationality'),
+        produces=('languages_list', 'languages_count', 'nationality_list', 'nationality_list_count',
+                  'nationality_list_binary'),
+    ),
+    'add_genre_features': StageColumns(
+        requires=('associated_genres',),
+        produces=('associated_genres_list', 'associated_genres_count'),
+    ),
+    'add_synopsis_features': StageColumns(
+        requires=('synopsis', 'filming_secrets', 'awards', 'trailer_views'),
+        produces=('synopsis_length', 'synopsis_binary', 'synopsis_sentiment', 'synopsis_length_categorized',
+                  'synopisis_sentiment_categorized', 'filming_secrets_num', 'award_count', 'nomination_count',
+                  'award_binary', 'nomination_binary', 'trailer_views_num', 'trailer_views_num_binary'),
+    ),
+    'add_distributor_features': StageColumns(
+        requires=('distributor',),
+        produces=('distributor_binary', 'top_distributor_score', 'distributor_power'),
+    ),
+    'add_history_features': StageColumns(
+        requires=('director', 'top_stars_list', 'distributor'),
+        produces=('director_past_films', 'director_past_entries', 'stars_past_known', 'stars_past_entries',
+                  'stars_past_max_entries', 'distributor_past_films', 'distributor_past_entries'),
+    ),
+    'add_franchise_features': StageColumns(
+        requires=('film_title',),
+        produces=('franchise_level', 'is_mcu', 'is_likely_blockbuster'),
+    ),
+    'add_licence_features': StageColumns(
+        requires=('film_title', 'franchise_level', 'distributor'),
+        produces=('is_superhero_franchise', 'is_animation_franchise', 'is_action_franchise',
+                  'is_gaming_franchise', 'is_licence', 'is_sequel', 'franchise_blockbuster_score'),
+    ),
+    'add_studio_features': StageColumns(
+        requires=('distributor', 'is_licence'),
+        produces=('is_major_studio', 'is_french_major_studio', 'major_studio_and_licence',
+                  'french_major_and_licence'),
+    ),
+    'add_interaction_features': StageColumns(
+        requires=('film_title', 'franchise_level', 'is_major_studio', 'is_superhero_franchise',
+                  'is_likely_blockbuster', 'is_mcu'),
+        produces=('major_studio_x_franchise', 'is_connected_universe', 'estimated_marketing_power',
+                  'success_amplifier'),
+    ),
+}
+
+
+def plan_stages(columns: Iterable[str]) -> List[str]:
+    """
+    Names of the stages needed to compute a set of columns, in pipeline order
+
+    Walks the pipeline backwards: a stage is kept when it writes a column
+    still needed, and the columns it reads become needed in turn. Columns no
+    stage writes are raw inputs (or features the pipeline never computes).
+
+    Args:
+        columns: Columns the consumers of the preprocessed batch read
+
+    Returns:
+        Subset of PIPELINE_STAGES, every stage when FEATURE_PRUNING is off
+    """
+    if not FEATURE_PRUNING:
+        return list(PIPELINE_STAGES)
+
+    needed = set(columns)
+    selected = set()
+    for name in reversed(PIPELINE_STAGES):
+        stage = STAGE_COLUMNS[name]
+        if needed.intersection(stage.produces):
+            selected.add(name)
+            needed.update(stage.requires)
+
+    stages = [name for name in PIPELINE_STAGES if name in selected]
+    skipped = [name for name in PIPELINE_STAGES if name not in selected]
+    if skipped:
+        logger.info(f"Feature plan skips {len(skipped)} stages: {', '.join(skipped)}")
+    return stages
+
+
+def merge_plans(plans: Iterable[List[str]]) -> List[str]:
+    """Stages of several plans, in pipeline order, for a batch preprocessed once for several models"""
+    selected = set().union(*plans)
+    return [name for name in PIPELINE_STAGES if name in selected]
@@ -0,0 +1,334 @@
+"""
+Track record of directors, stars and distributors in past French releases
+
+The index maps normalized names (lowercase, no accents or punctuation) to the
+number of past films and the sum of their first-week French entries, for
+each role. It is built from the scraped CSVs, kept in memory and read by the
+add_history_features stage of preprocess_movie_data with one dict lookup per
+distinct name.
+
+The file also keeps the record of each film (entries and names), so a new
+scraping run is merged film by film: the totals of a film whose record
+changed are taken out and put back with the new record, everything else
+stays as it is.
+
+Build it, then refresh it after each scraping run (from movie_prediction_api):
+    python -m app.preprocessing.history_index build ../MLFlow/leo_is_there/films_nettoyes.csv ../MLFlow/leo_is_there/resultfilm.csv
+    python -m app.preprocessing.history_index update new_films.csv
+
+A film keeps the names found for it in every source (cast of resultfilm.csv
+and top_stars of films_nettoyes.csv), and the entries of the latest one.
+
+Configuration (environment):
+    HISTORY_INDEX_PATH               index file (default: model/history_index.json)
+    HISTORY_RELOAD_CHECK_INTERVAL    seconds between two checks of the file on disk (default 60)
+"""
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import threading
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.parsing import parse_trailer_views
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "model", "history_index.json"
+)
+HISTORY_INDEX_PATH = os.getenv("HISTORY_INDEX_PATH", DEFAULT_INDEX_PATH)
+RELOAD_CHECK_INTERVAL = float(os.getenv("HISTORY_RELOAD_CHECK_INTERVAL", "60"))
+
+ROLES = ('director', 'star', 'distributor')
+
+# Columns of the scraped CSVs, first match wins
+ID_COLUMNS = ('film_id', 'film_id_x')
+ENTRIES_COLUMNS = ('entrees_demarrage_france', 'fr_entries')
+
+# Cast of resultfilm.csv: "Name (Rôle principal - - Character) | Name (Second rôle) | Composer"
+CAST_ENTRY_PATTERN = re.compile(r'^\s*([^(|]+?)\s*\(([^)]*)\)')
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^0-9a-z]+')
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name: str) -> str:
+    """Lookup key of a name: lowercase ASCII words separated by single spaces"""
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return NON_ALPHANUMERIC_PATTERN.sub(' ', ascii_name.lower()).strip()
+
+
+def split_names(value) -> List[str]:
+    """Names of a comma-separated cell, nothing for missing values"""
+    if not isinstance(value, str):
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def cast_names(value) -> List[str]:
+    """Actors of a resultfilm.csv cast cell, the crew without a role is left out"""
+    if not isinstance(value, str):
+        return []
+    names = []
+    for entry in value.split('|'):
+        match = CAST_ENTRY_PATTERN.match(entry)
+        if match and 'rôle' in match.group(2).lower():
+            names.append(match.group(1))
+    return names
+
+
+def read_records(csv_path: str) -> Dict[str, Dict]:
+    """
+    Film records of a scraped CSV
+
+    Returns:
+        Record by film id: first-week entries ('entries', None when unknown)
+        and the names of each role found in the file
+    """
+    raw = pd.read_csv(csv_path, dtype=str)
+    id_column = next((col for col in ID_COLUMNS if col in raw.columns), None)
+    if id_column is None:
+        raise ValueError(f"{csv_path} has no film id column ({', '.join(ID_COLUMNS)})")
+    entries_column = next((col for col in ENTRIES_COLUMNS if col in raw.columns), None)
+
+    records = {}
+    for row in raw.to_dict('records'):
+        film_id = row[id_column]
+        if not isinstance(film_id, str):
+            continue
+        entries = parse_trailer_views(row[entries_column]) if entries_column else 0
+        record = {'entries': float(entries) if entries else None}
+        if isinstance(row.get('director'), str) and row['director'].strip():
+            record['director'] = [row['director'].strip()]
+        stars = split_names(row.get('top_stars')) or cast_names(row.get('acteurs'))
+        if stars:
+            record['star'] = stars
+        if isinstance(row.get('distributor'), str) and row['distributor'].strip():
+            record['distributor'] = [row['distributor'].strip()]
+        records[film_id] = merge_records(records.get(film_id), record)
+    return records
+
+
+def merge_records(old: Optional[Dict], new: Dict) -> Dict:
+    """
+    Record of a film updated with a newer one: the known entries of the newer
+    record win, the names of each role are the union of both, so merging the
+    same file twice changes nothing
+    """
+    merged = dict(old or {})
+    for key, value in new.items():
+        if not value:
+            continue
+        merged[key] = list(dict.fromkeys(merged.get(key, []) + list(value))) if key in ROLES else value
+    merged.setdefault('entries', None)
+    return merged
+
+
+class HistoryIndex:
+    """
+    Past films and first-week entries by role and normalized name
+
+    Args:
+        films: Record of each indexed film by id
+        totals: [films, sum of entries] by role and normalized name, computed
+            from films when not given
+        metadata: Free-form information about how the index was built
+    """
+
+    def __init__(self, films: Dict[str, Dict] = None, totals: Dict[str, Dict[str, List[float]]] = None,
+                 metadata: Dict = None):
+        self.films: Dict[str, Dict] = {}
+        self.metadata = metadata or {}
+        if totals is not None:
+            self.films = dict(films or {})
+            self.totals = {role: dict(totals.get(role, {})) for role in ROLES}
+        else:
+            self.totals = {role: {} for role in ROLES}
+            for film_id, record in (films or {}).items():
+                self.upsert(film_id, record)
+
+    def _apply(self, record: Dict, sign: int) -> None:
+        entries = record.get('entries')
+        if not entries:
+            return
+        for role in ROLES:
+            for key in {normalize_name(name) for name in record.get(role, [])} - {''}:
+                total = self.totals[role].setdefault(key, [0, 0.0])
+                total[0] += sign
+                total[1] += sign * entries
+                if total[0] <= 0:
+                    del self.totals[role][key]
+
+    def upsert(self, film_id: str, record: Dict) -> bool:
+        """
+        Add or update a film, only its own contribution to the totals is recomputed
+
+        Returns:
+            True if the index changed
+        """
+        old = self.films.get(film_id)
+        merged = merge_records(old, record)
+        if merged == old:
+            return False
+        if old is not None:
+            self._apply(old, -1)
+        self._apply(merged, 1)
+        self.films[film_id] = merged
+        return True
+
+    def update(self, records: Dict[str, Dict]) -> int:
+        """Merge film records into the index, returns the number of films added or changed"""
+        return sum(self.upsert(film_id, record) for film_id, record in records.items())
+
+    def lookup(self, role: str, name) -> Tuple[int, float]:
+        """Number of past films and mean first-week entries of a name, (0, NaN) if unknown"""
+        if not isinstance(name, str):
+            return 0, np.nan
+        total = self.totals[role].get(normalize_name(name))
+        if total is None:
+            return 0, np.nan
+        return int(total[0]), total[1] / total[0]
+
+    def lookup_many(self, role: str, names: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """lookup of each name, as an int64 array of films and a float array of mean entries"""
+        stats = [self.lookup(role, name) for name in names]
+        films = np.array([films for films, _ in stats], dtype=np.int64)
+        entries = np.array([entries for _, entries in stats], dtype=float)
+        return films, entries
+
+    def describe(self) -> Dict:
+        return {
+            'films': len(self.films),
+            **{f"{role}s": len(self.totals[role]) for role in ROLES},
+            **self.metadata,
+        }
+
+    def to_dict(self) -> Dict:
+        return {'version': INDEX_VERSION, 'metadata': self.metadata, 'totals': self.totals, 'films': self.films}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HistoryIndex":
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported history index version: {data.get('version')}")
+        return cls(data.get('films'), data.get('totals'), data.get('metadata'))
+
+    def save(self, path: str) -> None:
+        # Written next to the target then renamed, so a running API never reads a partial file
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary_path, path)
+        logger.info(f"Saved history index of {len(self.films)} films to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "HistoryIndex":
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+_index: Optional[HistoryIndex] = None
+_signature: Optional[Tuple[int, int]] = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def get_history_index() -> HistoryIndex:
+    """
+    Get the process-wide index, reloaded when HISTORY_INDEX_PATH changes on disk
+
+    An empty index is returned when there is no file, so the history
+    features are then missing (NaN entries, 0 films).
+    """
+    global _index, _signature, _last_check
+    now = time.monotonic()
+    if _index is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _index
+    with _lock:
+        _last_check = now
+        signature = _file_signature(HISTORY_INDEX_PATH)
+        if _index is not None and signature == _signature:
+            return _index
+        if signature is None:
+            if _index is None:
+                logger.warning(f"No history index at {HISTORY_INDEX_PATH}, the history features will be missing")
+                _index = HistoryIndex()
+        else:
+            try:
+                _index = HistoryIndex.load(HISTORY_INDEX_PATH)
+                logger.info(f"History index loaded from {HISTORY_INDEX_PATH}: {_index.describe()}")
+            except Exception as e:
+                logger.error(f"Failed to load history index {HISTORY_INDEX_PATH}: {str(e)}")
+                _index = _index or HistoryIndex()
+        _signature = signature
+        return _index
+
+
+def read_all_records(csv_paths: List[str]) -> Dict[str, Dict]:
+    """Records of several CSVs merged by film id, later files win"""
+    records: Dict[str, Dict] = {}
+    for path in csv_paths:
+        for film_id, record in read_records(path).items():
+            records[film_id] = merge_records(records.get(film_id), record)
+    return records
+
+
+def build_index(csv_paths: List[str], output_path: str) -> HistoryIndex:
+    """Index every film of the CSVs from scratch"""
+    index = HistoryIndex(read_all_records(csv_paths), metadata={
+        'sources': [os.path.basename(path) for path in csv_paths],
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    index.save(output_path)
+    return index
+
+
+def update_index(csv_paths: List[str], index_path: str) -> Tuple[HistoryIndex, int]:
+    """
+    Merge the films of new CSVs into an existing index
+
+    Returns:
+        The updated index and the number of films added or changed
+    """
+    index = HistoryIndex.load(index_path) if os.path.exists(index_path) else HistoryIndex()
+    changed = index.update(read_all_records(csv_paths))
+    sources = index.metadata.setdefault('sources', [])
+    sources.extend(os.path.basename(path) for path in csv_paths if os.path.basename(path) not in sources)
+    index.metadata['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    if changed:
+        index.save(index_path)
+    return index, changed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build or refresh the director/star/distributor history index")
+    parser.add_argument("command", choices=["build", "update"],
+                        help="build: index the CSVs from scratch, update: merge them into the existing index")
+    parser.add_argument("csv_paths", nargs="+", help="Scraped CSVs (films_nettoyes.csv, resultfilm.csv layouts)")
+    parser.add_argument("--index", default=HISTORY_INDEX_PATH, help="Index file to write")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "build":
+        built = build_index(args.csv_paths, args.index)
+        print(f"Indexed {len(built.films)} films in {time.perf_counter() - started:.2f}s: {built.describe()}")
+    else:
+        updated, n_changed = update_index(args.csv_paths, args.index)
+        print(f"Merged {n_changed} new or changed films in {time.perf_counter() - started:.2f}s: {updated.describe()}")
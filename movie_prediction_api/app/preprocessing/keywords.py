@@ -0,0 +1,294 @@
+"""
+Keyword table for the distributor, franchise, licence and studio features
+
+KEYWORD_TABLE maps the scanned column to its keyword categories. A category is
+either a list of keywords or a {keyword: weight} dict when the feature uses
+weights. KeywordMatcher compiles all the keywords of a column into one regular
+expression, so a string is scanned once whatever the number of categories.
+"""
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_TABLE: Dict[str, Dict[str, Union[List[str], Dict[str, float]]]] = {
+    'distributor': {
+        'top_distributors': {
+            'walt disney': 3.0,
+            'marvel studios': 3.0,
+            'universal': 2.5,
+            'paramount': 2.5,
+            'warner bros': 2.5,
+            'sony': 2.0,
+            'columbia': 2.0,
+            '20th century': 2.0,
+            'studiocanal': 2.0,
+            'gaumont': 2.0,
+            'pathé': 2.0,
+            'netflix': 2.0,
+            'snd': 1.8,
+            'diaphana': 1.8,
+            'memento': 1.5,
+            'apollo': 1.5,
+            'ufo': 1.2,
+            'tf1': 1.2,
+            'metropolitan': 1.2,
+            'pyramide': 1.2,
+            'losange': 1.2,
+            'le pacte': 1.0,
+            'wild bunch': 1.0,
+            'kmbo': 1.0,
+            'jhr': 1.0,
+            'gebeka': 1.0,
+            'rezo': 1.0
+        },
+        'studio_weights': {
+            'walt disney': 3.0,
+            'marvel studios': 3.0,
+            'universal': 2.5,
+            'paramount': 2.5,
+            'warner bros': 2.5,
+            'sony': 2.0,
+            'columbia': 2.0,
+            '20th century': 2.0,
+            'netflix': 2.0,
+        },
+        'distributor_weights': {
+            'walt disney': 3.0,
+            'universal': 2.5,
+            'paramount': 2.5,
+            'warner bros': 2.5,
+            'sony': 2.0,
+            'studiocanal': 2.0,
+            'gaumont': 2.0,
+            'pathé': 2.0,
+            'netflix': 2.0,
+            'snd': 1.8,
+            'diaphana': 1.8,
+            'memento': 1.5,
+            'apollo': 1.5,
+            'ufo': 1.2,
+            'tf1': 1.2,
+            'metropolitan': 1.2,
+            'pyramide': 1.2,
+            'losange': 1.2,
+        },
+        'independent_weights': {
+            'le pacte': 1.0,
+            'wild bunch': 1.0,
+            'kmbo': 1.0,
+            'jhr': 1.0,
+            'gebeka': 1.0,
+            'rezo': 1.0,
+        },
+        'strong_distributors': [
+            'warner', 'disney', 'universal', 'paramount',
+            'sony', '20th century', 'pathé', 'gaumont', 'netflix'
+        ],
+        'major_studios': [
+            'disney', 'warner', 'universal', 'sony', 'paramount',
+            '20th century', 'fox', 'gaumont', 'pathé',
+            'netflix', 'amazon', 'apple'
+        ],
+        'french_majors': [
+            'studiocanal', 'gaumont', 'pathé', 'ufp', 'snd', 'diaphana'
+        ],
+    },
+    'film_title': {
+        'top_franchises': [
+            'mad max', 'iron man', 'captain america', 'thor', 'wolverine',
+            'mission impossible', 'terminator', 'hunger games', 'twilight',
+            'pirates des caraïbes', 'le hobbit', 'matrix', 'minecraft',
+            'les minions', 'john wick', 'alien', 'predator', 'rocky', 'rambo',
+            'conjuring', 'saw', 'scream', 'halloween', 'barbie',
+            'harry potter', 'star wars', 'spider-man', 'avengers', 'x-men',
+            'batman', 'jurassic', 'fast and furious', 'transformers',
+            'le seigneur des anneaux', 'shrek', 'le roi lion', 'indiana jones',
+            "l'âge de glace", 'deadpool', 'super mario bros', 'les animaux fantastiques',
+            'avatar', 'les dents de la', 'les gardiens de la galaxie'
+        ],
+        'mega_franchises': [
+            'avatar', 'jurassic', 'star wars', 'harry potter',
+            'avengers', 'fast and furious', 'le roi lion', 'spider-man'
+        ],
+        'major_franchises': [
+            'iron man', 'captain america', 'x-men', 'batman',
+            'transformers', 'deadpool', 'les minions', 'moi moche et méchant',
+            'mission impossible', 'shrek', 'le seigneur des anneaux', "l'âge de glace",
+            'super mario bros'
+        ],
+        'big_franchises': [
+            'mad max', 'hunger games', 'twilight', 'john wick', 'thor', 'wolverine',
+            'matrix', 'pirates des caraïbes', 'le hobbit', 'conjuring',
+            'les animaux fantastiques', 'indiana jones', 'les gardiens de la galaxie',
+            'minecraft', 'rocky', 'rambo', 'alien', 'predator',
+            'scream', 'saw', 'halloween', 'barbie', 'terminator', 'les dents de la'
+        ],
+        'mcu_titles': [
+            'avengers', 'iron man', 'captain america', 'thor', 'hulk',
+            'black panther', 'doctor strange', 'les gardiens de la galaxie',
+            'ant-man', 'spider-man', 'les eternels', 'shang-chi', 'black widow',
+            'marvels', 'wanda', 'vision', 'falcon', "le soldat de l'hiver"
+        ],
+        'likely_blockbusters': [
+            'avengers', 'star wars', 'jurassic world', 'avatar',
+            'harry potter', 'spider-man', 'batman', 'superman',
+            'fast and furious', 'frozen', 'la reine des neiges',
+            'minions', 'le roi lion',
+            'the dark knight', 'barbie', 'oppenheimer',
+            'mario', 'les animaux fantastiques'
+        ],
+        'superhero_franchises': [
+            'marvel', 'avengers', 'captain america', 'iron man', 'thor', 'hulk',
+            'batman', 'superman', 'dc', 'justice league', 'x-men', 'spider-man',
+            'wolverine', 'deadpool', 'les gardiens de la galaxie'
+        ],
+        'animation_franchises': [
+            'disney', 'pixar', 'dreamworks', 'illumination', 'vaiana', 'astérix',
+            'shrek', 'toy story', 'madagascar', 'minions', 'vice-versa',
+            'moi, moche et méchant', "l'âge de glace", 'le roi lion', 'super mario bros'
+        ],
+        'action_franchises': [
+            'mad max', 'fast and furious', '007', 'mission : impossible',
+            'star wars', 'harry potter', 'hunger games', 'jurassic', 'terminator',
+            'dune', 'john wick', 'matrix', 'indiana jones', 'le seigneur des anneaux',
+            'le hobbit', 'barbie', 'conjuring', 'saw', 'scream', 'halloween',
+            'rocky', 'rambo', 'alien', 'predator', 'les animaux fantastiques',
+            'les dents de la'
+        ],
+        'gaming_franchises': [
+            'minecraft', 'mario', 'super mario bros', 'pokemon', 'tomb raider',
+            "assassin's creed", 'sonic', 'mortal kombat', 'uncharted', 'warcraft'
+        ],
+        'sequel_indicators': [
+            '2', '3', '4', '5', 'ii', 'iii', 'iv', 'v', 'vi',
+            'le retour', 'la suite', 'chapitre', 'épisode', 'saga',
+            'partie', 'part', 'volume'
+        ],
+    },
+}
+
+# Flat view of the table: category name to its keywords (or keyword weights)
+KEYWORDS = {
+    category: keywords
+    for categories in KEYWORD_TABLE.values()
+    for category, keywords in categories.items()
+}
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Build a regex alternation shaped like a prefix tree of the keywords
+
+    At a given position the regex engine follows a single branch per
+    character instead of trying every keyword, and greedy matching returns the
+    longest keyword starting there.
+    """
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Precompiled multi-keyword matcher over a set of keyword categories
+
+    The keywords of every category are compiled into one lookahead regex, so
+    one scan of a string finds every keyword it contains (overlapping ones
+    included) and every category hit at once. Results are cached per string,
+    which makes repeated titles and distributors almost free.
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]], cache_size: int = 65536):
+        self.categories = list(categories)
+        self._weights = {
+            category: dict(keywords) if isinstance(keywords, dict) else None
+            for category, keywords in categories.items()
+        }
+
+        keyword_masks: Dict[str, int] = {}
+        for bit, (category, keywords) in enumerate(categories.items()):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                keyword_masks[keyword] = keyword_masks.get(keyword, 0) | (1 << bit)
+
+        # A keyword found at a position implies every shorter keyword that is
+        # a prefix of it, which the longest-match regex does not report
+        self._implied: Dict[str, Tuple[FrozenSet[str], int]] = {}
+        for longest in keyword_masks:
+            prefixes = frozenset(k for k in keyword_masks if longest.startswith(k))
+            mask = 0
+            for keyword in prefixes:
+                mask |= keyword_masks[keyword]
+            self._implied[longest] = (prefixes, mask)
+
+        self._pattern = re.compile('(?=(' + _trie_pattern(keyword_masks) + '))')
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, text: str) -> Tuple[FrozenSet[str], int]:
+        """Keywords found in text and the bit mask of the categories they belong to"""
+        found = set()
+        mask = 0
+        for longest in set(self._pattern.findall(text.lower())):
+            prefixes, keyword_mask = self._implied[longest]
+            found.update(prefixes)
+            mask |= keyword_mask
+        return frozenset(found), mask
+
+    def categories_of(self, text: str) -> List[str]:
+        """Names of the categories with a keyword in text"""
+        _, mask = self.match(text)
+        return [category for bit, category in enumerate(self.categories) if mask >> bit & 1]
+
+    def _match_column(self, series: pd.Series) -> Tuple[np.ndarray, list]:
+        """Match each distinct string once, non-strings match nothing"""
+        values = series.astype(object)
+        strings = values.where(values.map(lambda x: isinstance(x, str)))
+        codes, uniques = pd.factorize(strings)
+        return codes, [self.match(text) for text in uniques]
+
+    def flags(self, series: pd.Series) -> pd.DataFrame:
+        """
+        Category flags for a column
+
+        Returns:
+            DataFrame with one 0/1 column per category, aligned on series
+        """
+        codes, matches = self._match_column(series)
+        # The extra trailing 0 is picked by code -1 (missing values)
+        masks = np.array([mask for _, mask in matches] + [0], dtype=np.int64)[codes]
+        return pd.DataFrame(
+            {category: (masks >> bit) & 1 for bit, category in enumerate(self.categories)},
+            index=series.index
+        )
+
+    def first_weight(self, series: pd.Series, category: str) -> np.ndarray:
+        """Weight of the first keyword of a weighted category found in each string, 0 if none"""
+        weights = self._weights[category]
+        codes, matches = self._match_column(series)
+        values = [next((w for k, w in weights.items() if k in found), 0) for found, _ in matches]
+        return np.array(values + [0], dtype=float)[codes]
+
+
+TITLE_MATCHER = KeywordMatcher(KEYWORD_TABLE['film_title'])
+DISTRIBUTOR_MATCHER = KeywordMatcher(KEYWORD_TABLE['distributor'])
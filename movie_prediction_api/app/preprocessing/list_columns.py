@@ -0,0 +1,146 @@
+"""
+Columnar storage of the multi-valued fields (producers, stars, languages...)
+
+The vectorized pipeline keeps each list column as an Arrow list array inside
+the DataFrame (dtype list<string>[pyarrow]): one flat array of items and the
+offsets of each film in it, instead of one Python list per cell. Counts come
+from the offsets, flags and the multi-hot features from the flat items,
+dictionary-encoded so each distinct item is looked at once.
+
+The readers below also accept the object columns of Python lists built by the
+row-wise pipeline, and stringified lists, so both pipelines feed the same
+consumers.
+
+pyarrow is imported on first use and stays optional (only the columnar
+endpoints require it): without it, split_list_column builds the Python lists
+of the row-wise pipeline.
+"""
+import logging
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.feature_engineering import parse_list_string
+from app.preprocessing.parsing import text_cells
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _arrow():
+    """(pyarrow, pyarrow.compute), or None when pyarrow is not installed"""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        logger.warning("pyarrow is not installed, list columns are stored as Python lists")
+        return None
+    return pa, pc
+
+
+def is_list_array(series: pd.Series) -> bool:
+    """Whether a column is stored as an Arrow list array"""
+    if not isinstance(series.dtype, pd.ArrowDtype):
+        return False
+    pa, _ = _arrow()
+    return pa.types.is_list(series.dtype.pyarrow_dtype)
+
+
+def _list_array(series: pd.Series):
+    """The column as one pyarrow ListArray of strings"""
+    pa, _ = _arrow()
+    array = pa.array(series.array)
+    # Concatenated frames (sharded preprocessing, batches) hold several chunks
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array.cast(pa.list_(pa.string()))
+
+
+def split_list_column(series: pd.Series) -> pd.Series:
+    """
+    Vectorized parse_list_string: "a, b,c" strings to Arrow lists ['a', 'b', 'c']
+
+    Returns:
+        Series of dtype list<string>[pyarrow] aligned on the input index,
+        missing values as empty lists (Python lists without pyarrow)
+    """
+    if _arrow() is None:
+        lists = [parse_list_string(value) for value in series]
+        return pd.Series(lists, index=series.index, name=series.name, dtype=object)
+    pa, pc = _arrow()
+    text = text_cells(series).reset_index(drop=True)
+    literal = (text.str.startswith('[', na=False) & text.str.endswith(']', na=False)).to_numpy()
+
+    lists = pc.split_pattern(pa.array(text.where(~literal), type=pa.string(), from_pandas=True), ',')
+    items = pc.utf8_trim_whitespace(pc.list_flatten(lists))
+    rows = pc.list_parent_indices(lists).to_numpy()
+    keep = pc.greater(pc.utf8_length(items), 0).to_numpy(zero_copy_only=False)
+    items, rows = items.filter(pa.array(keep)), rows[keep]
+
+    # Python list literals are rare, they go through the row-wise parser
+    literal_rows = np.flatnonzero(literal)
+    if len(literal_rows):
+        parsed = [(row, str(item)) for row in literal_rows for item in parse_list_string(text.iat[row])]
+        if parsed:
+            extra_rows, extra_items = zip(*parsed)
+            rows = np.concatenate([rows, np.asarray(extra_rows, dtype=rows.dtype)])
+            items = pa.concat_arrays([items, pa.array(extra_items, type=pa.string())])
+            order = np.argsort(rows, kind='stable')
+            rows, items = rows[order], items.take(pa.array(order))
+
+    offsets = np.zeros(len(text) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=len(text)), out=offsets[1:])
+    array = pa.ListArray.from_arrays(pa.array(offsets), items)
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=series.index, name=series.name)
+
+
+def list_lengths(series: pd.Series) -> pd.Series:
+    """Number of items of each cell of a list column, as int64"""
+    if is_list_array(series):
+        lengths = np.diff(_list_array(series).offsets.to_numpy()).astype(np.int64)
+    else:
+        lengths = series.map(lambda x: len(x) if isinstance(x, list) else 0).to_numpy(dtype=np.int64)
+    return pd.Series(lengths, index=series.index, name=series.name)
+
+
+def list_items(series: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Flat items of a list column, interned
+
+    Args:
+        series: Arrow list column, column of Python lists or of stringified lists
+
+    Returns:
+        Row position of each item, code of each item in the vocabulary, and
+        the vocabulary (distinct items as strings, in order of appearance)
+    """
+    if is_list_array(series):
+        _, pc = _arrow()
+        array = _list_array(series)
+        rows = pc.list_parent_indices(array).to_numpy()
+        encoded = pc.list_flatten(array).dictionary_encode()
+        return rows, encoded.indices.to_numpy(), np.asarray(encoded.dictionary.to_pylist(), dtype=object)
+
+    lists = series.map(lambda x: list(x) if isinstance(x, (list, tuple, np.ndarray)) else parse_list_string(x))
+    exploded = lists.reset_index(drop=True).explode().dropna()
+    codes, vocabulary = pd.factorize(exploded.astype(str))
+    return exploded.index.to_numpy(), codes, np.asarray(vocabulary, dtype=object)
+
+
+def rows_containing(series: pd.Series, value: str) -> pd.Series:
+    """1 for the cells of a list column holding value (case-insensitive), else 0"""
+    rows, codes, vocabulary = list_items(series)
+    matches = np.array([item.lower() == value for item in vocabulary], dtype=bool)
+    found = np.zeros(len(series), dtype=bool)
+    if len(codes):
+        found[rows[matches[codes]]] = True
+    return pd.Series(found.astype(np.int64), index=series.index, name=series.name)
+
+
+def to_python_lists(series: pd.Series) -> pd.Series:
+    """Object column of Python lists, the row-wise representation"""
+    if not is_list_array(series):
+        return series
+    return pd.Series(_list_array(series).to_pylist(), index=series.index, name=series.name, dtype=object)
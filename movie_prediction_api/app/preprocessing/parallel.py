@@ -0,0 +1,237 @@
+"""
+Sharded preprocessing of large batches on a pool of worker processes
+
+preprocess_movie_data holds the GIL for most of its work, so a 50k-film CSV
+runs on a single core. preprocess_parallel splits such a batch into
+contiguous shards, runs the feature pipeline on each shard in a
+ProcessPoolExecutor and reassembles the shards in order. Each worker writes
+the numeric columns of its shard into one shared memory block, read back by
+the parent without pickling. The other columns (text, Arrow lists) come back
+pickled as usual.
+
+Every stage computes a film's features from that film alone, so the result
+is the one preprocess_movie_data would give for the whole batch. The
+exception is the placeholder film_id/film_url, derived from a hash salted per
+process: they are recomputed in the parent after reassembly.
+
+Configuration (environment):
+    PREPROCESS_WORKERS              worker processes (default: CPU count)
+    PARALLEL_PREPROCESS_MIN_ROWS    smaller batches are preprocessed in-process (default 20000)
+    PREPROCESS_START_METHOD         multiprocessing start method of the workers (default forkserver)
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.feature_engineering import preprocess_movie_data
+from app.preprocessing.vectorized import placeholder_ids
+from app.utils.executor import in_worker_process
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_PREPROCESS_MIN_ROWS", "20000"))
+START_METHOD = os.getenv("PREPROCESS_START_METHOD", "forkserver")
+
+
+def _is_plain_numeric(dtype) -> bool:
+    """numpy numeric or boolean dtype, the columns sent through shared memory"""
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biuf'
+
+
+def _preprocess_shard(shard: pd.DataFrame, stages: Optional[List[str]]) -> Dict:
+    """
+    Run the feature pipeline on a shard (in a worker process)
+
+    Returns:
+        Column order, name of the shared memory block and layout of the
+        numeric columns in it, and the other columns as a DataFrame
+    """
+    features = preprocess_movie_data(shard, stages=stages)
+    numeric = [col for col in features.columns if _is_plain_numeric(features[col].dtype)]
+
+    layout, offset = [], 0
+    for col in numeric:
+        dtype = features[col].dtype
+        layout.append((col, dtype.str, offset))
+        offset += dtype.itemsize * len(features)
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for col, dtype, start in layout:
+            target = np.ndarray(len(features), dtype=dtype, buffer=block.buf, offset=start)
+            target[:] = features[col].to_numpy()
+            del target
+    except BaseException:
+        # The parent never learns the name of a block of a failed shard
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+
+    return {
+        'columns': list(features.columns),
+        'rows': len(features),
+        'block': block.name,
+        'layout': layout,
+        'other': features.drop(columns=numeric).reset_index(drop=True),
+    }
+
+
+def _release(results: List[Dict]) -> None:
+    """Free the shared memory blocks of the shards"""
+    for result in results:
+        try:
+            block = shared_memory.SharedMemory(name=result['block'])
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+
+
+def _reassemble(results: List[Dict], index: pd.Index) -> pd.DataFrame:
+    """
+    Concatenate the shards in order, numeric columns straight from shared memory
+
+    A column can be numeric in some shards only (all missing in a shard, it
+    is held as objects there): it is then concatenated from the numeric
+    values of those shards and the other columns of the rest.
+    """
+    total = sum(result['rows'] for result in results)
+    layouts = [{name: (dtype, start) for name, dtype, start in result['layout']} for result in results]
+    names = list(dict.fromkeys(name for layout in layouts for name in layout))
+    numeric: Dict[str, np.ndarray] = {
+        name: np.empty(total, dtype=np.result_type(*[np.dtype(layout[name][0]) for layout in layouts]))
+        for name in names if all(name in layout for layout in layouts)
+    }
+    mixed: Dict[str, List] = {name: [] for name in names if name not in numeric}
+
+    row = 0
+    for result, layout in zip(results, layouts):
+        block = shared_memory.SharedMemory(name=result['block'])
+        try:
+            for name, (dtype, start) in layout.items():
+                shard = np.ndarray(result['rows'], dtype=dtype, buffer=block.buf, offset=start)
+                if name in numeric:
+                    numeric[name][row:row + result['rows']] = shard
+                else:
+                    mixed[name].append(pd.Series(shard.copy()))
+                del shard
+        finally:
+            block.close()
+        for name, pieces in mixed.items():
+            if name not in layout:
+                pieces.append(result['other'][name])
+        row += result['rows']
+
+    other = pd.concat([result['other'] for result in results], ignore_index=True)
+    columns = {}
+    for name in results[0]['columns']:
+        if name in numeric:
+            columns[name] = numeric[name]
+        elif name in mixed:
+            columns[name] = pd.concat(mixed[name], ignore_index=True).array
+        else:
+            columns[name] = other[name].array
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Get the worker pool, restarted when a different number of workers is asked for"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(START_METHOD if START_METHOD in methods else None)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+            logger.info(f"Preprocessing pool started with {workers} {context.get_start_method()} workers")
+        return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=not wait)
+            _pool, _pool_workers = None, 0
+
+
+def _restore_placeholder_ids(features: pd.DataFrame, movies_df: pd.DataFrame) -> None:
+    """Recompute the placeholder ids the workers derived with their own hash salt"""
+    missing = [col for col in ('film_url', 'film_id') if col not in movies_df.columns and col in features.columns]
+    if not missing:
+        return
+    ids = placeholder_ids(movies_df['film_title'].tolist())
+    if 'film_url' in missing:
+        features['film_url'] = [f"https://www.allocine.fr/film/fichefilm_gen_cfilm={i}.html" for i in ids]
+    if 'film_id' in missing:
+        features['film_id'] = ids
+
+
+def preprocess_parallel(movies_df: pd.DataFrame, stages: Optional[List[str]] = None, workers: int = None,
+                        shards: int = None, min_rows: int = None) -> pd.DataFrame:
+    """
+    preprocess_movie_data of a large batch, sharded over worker processes
+
+    Args:
+        movies_df: Raw films
+        stages: Stages to run, all of them by default (see app.preprocessing.feature_plan)
+        workers: Worker processes, PREPROCESS_WORKERS by default (a default
+            of 1 preprocesses in-process, an explicit 1 uses one worker)
+        shards: Number of contiguous shards, one per worker by default
+        min_rows: Batches smaller than this are preprocessed in-process,
+            PARALLEL_PREPROCESS_MIN_ROWS by default
+
+    Returns:
+        DataFrame with processed features, on the index of movies_df
+    """
+    in_process = workers is None and PREPROCESS_WORKERS <= 1
+    workers = workers or PREPROCESS_WORKERS
+    min_rows = PARALLEL_MIN_ROWS if min_rows is None else min_rows
+    shards = min(shards or workers, len(movies_df))
+    # Workers of a process inference executor do not start pools of their own
+    if in_process or shards < 1 or len(movies_df) < min_rows or in_worker_process():
+        return preprocess_movie_data(movies_df, stages=stages)
+
+    movies_df = pd.DataFrame(movies_df)
+    bounds = np.linspace(0, len(movies_df), shards + 1).astype(int)
+    parts = [movies_df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    futures = []
+    try:
+        pool = get_pool(workers)
+        futures = [pool.submit(_preprocess_shard, part, stages) for part in parts]
+        results = [future.result() for future in futures]
+        features = _reassemble(results, movies_df.index)
+        _restore_placeholder_ids(features, movies_df)
+    except Exception as e:
+        logger.error(f"Parallel preprocessing failed, running it in-process: {str(e)}")
+        if isinstance(e, BrokenProcessPool):
+            # A worker died (OOM kill...), the next batch gets a fresh pool
+            shutdown_pool(wait=False)
+        features = None
+    finally:
+        # Let the other shards finish after a failure, each successful one has a block to free
+        wait(futures)
+        _release([future.result() for future in futures if not future.cancelled() and future.exception() is None])
+
+    if features is None:
+        return preprocess_movie_data(movies_df, stages=stages)
+    logger.info(f"Preprocessed {len(movies_df)} films in {shards} shards on {workers} workers")
+    return features
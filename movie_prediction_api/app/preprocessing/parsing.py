@@ -0,0 +1,240 @@
+"""
+Parsers of the scraped text fields: duration, year, trailer views and counts
+
+Each field has a scalar parser, used by the row-wise pipeline, and a column
+parser used by app.preprocessing.vectorized. Both read the same precompiled
+patterns. The scraped values repeat a lot ("1h 44min", "15 anecdotes"), so
+the scalar parsers memoize the text they have already seen and the column
+parsers only run Series.str.extract on the distinct values of a column.
+Small columns, such as the single film of a /predict request, go through the
+memoized scalar parsers, which cost less than the pandas string methods.
+"""
+import re
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HOURS_PATTERN = re.compile(r'(\d+)h')
+MINUTES_PATTERN = re.compile(r'(\d+)min')
+NUMBER_PATTERN = re.compile(r'(\d+)')
+YEAR_PATTERN = re.compile(r'(\d{4})')
+VIEWS_PATTERN = re.compile(r'[\d\s.,]+')
+
+# Used when a duration has no number in it
+DEFAULT_DURATION = 105
+
+# Distinct texts remembered by each scalar parser
+PARSE_CACHE_SIZE = 4096
+
+# Up to this many rows, the column parsers call the memoized scalar parsers
+SCALAR_PATH_MAX_ROWS = 1024
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _duration_minutes(text: str) -> int:
+    total_minutes = 0
+
+    hours_match = HOURS_PATTERN.search(text)
+    if hours_match:
+        total_minutes += int(hours_match.group(1)) * 60
+
+    minutes_match = MINUTES_PATTERN.search(text)
+    if minutes_match:
+        total_minutes += int(minutes_match.group(1))
+
+    # If no pattern matched but there's a number, assume it's minutes
+    if total_minutes == 0:
+        number_match = NUMBER_PATTERN.search(text)
+        if number_match:
+            total_minutes = int(number_match.group(1))
+
+    return total_minutes if total_minutes > 0 else DEFAULT_DURATION
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _year_of(text: str) -> Optional[int]:
+    year_match = YEAR_PATTERN.search(text)
+    return int(year_match.group(1)) if year_match else None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _views_of(text: str):
+    num_match = VIEWS_PATTERN.findall(text)
+    if num_match:
+        # Join all matches and drop the thousand separators
+        num_str = ''.join(num_match).replace(' ', '').replace(',', '').replace('.', '')
+        try:
+            return float(num_str)
+        except ValueError:
+            pass
+    return 0
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _first_number(text: str) -> int:
+    number_match = NUMBER_PATTERN.search(text)
+    return int(number_match.group(1)) if number_match else 0
+
+
+def parse_duration(duration_str):
+    """Parse duration string like '1h 44min' to minutes"""
+    if pd.isna(duration_str) or duration_str is None:
+        return DEFAULT_DURATION
+
+    if isinstance(duration_str, (int, float)):
+        return float(duration_str)
+
+    return _duration_minutes(str(duration_str))
+
+
+def parse_year(year_str):
+    """Parse year string to integer, the current year when it has no four-digit group"""
+    if pd.isna(year_str) or year_str is None:
+        return None
+
+    if isinstance(year_str, (int, float)):
+        return int(year_str)
+
+    year = _year_of(str(year_str))
+    return year if year is not None else datetime.now().year
+
+
+def parse_trailer_views(views_str):
+    """Parse trailer views string like '5 000 000 vues' to number"""
+    if pd.isna(views_str) or views_str is None:
+        return 0
+
+    if isinstance(views_str, (int, float)):
+        return float(views_str)
+
+    return _views_of(str(views_str))
+
+
+def parse_count(value) -> int:
+    """First number of a string like '15 anecdotes', 0 if there is none"""
+    if pd.isna(value):
+        return 0
+    return _first_number(str(value))
+
+
+def text_cells(series: pd.Series) -> pd.Series:
+    """Keep the string cells of a column, every other value becomes missing"""
+    values = series.astype(object)
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        return values
+    return values.where(values.map(lambda x: isinstance(x, str)))
+
+
+def string_values(series: pd.Series) -> pd.Series:
+    """
+    series.astype(str), leaving series untouched
+
+    pandas 2.1 converts the cells of an unpickled object array in place
+    (None becomes 'None' in the source column), which happens to every batch
+    sent to a worker process, so the conversion runs on a copy.
+    """
+    return series.copy().astype(str)
+
+
+def integers_or_missing(values: pd.Series) -> pd.Series:
+    """Cast to int64 when nothing is missing, like Series.apply would infer"""
+    return values.astype('int64') if values.notna().all() else values
+
+
+def _parse(series: pd.Series, parse_column: Callable[[pd.Series], pd.Series],
+           parse_value: Callable[[object], object]) -> pd.Series:
+    """
+    Parse a column as floats, value by value when it is small, otherwise with
+    the column parser run on its distinct values and broadcast to the rows
+    """
+    values = series.astype(object)
+    if len(values) <= SCALAR_PATH_MAX_ROWS:
+        return pd.Series([parse_value(value) for value in values], index=series.index, name=series.name, dtype=float)
+
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    if len(uniques) == len(values):
+        return parse_column(values).astype(float)
+    parsed = parse_column(pd.Series(uniques, dtype=object)).astype(float)
+    return pd.Series(parsed.to_numpy()[codes], index=series.index, name=series.name)
+
+
+def _duration_column(values: pd.Series) -> pd.Series:
+    text = text_cells(values)
+
+    hours = text.str.extract(HOURS_PATTERN, expand=False).astype(float).fillna(0)
+    minutes = text.str.extract(MINUTES_PATTERN, expand=False).astype(float).fillna(0)
+    total = hours * 60 + minutes
+
+    # If no pattern matched but there's a number, assume it's minutes
+    number = text.str.extract(NUMBER_PATTERN, expand=False).astype(float).fillna(0)
+    total = total.where(total > 0, number)
+    total = total.where(total > 0, float(DEFAULT_DURATION))
+
+    # Numbers are taken as they are
+    numeric = values.notna() & text.isna()
+    if numeric.any():
+        total[numeric] = pd.to_numeric(values[numeric], errors='coerce')
+
+    return total
+
+
+def _year_column(values: pd.Series) -> pd.Series:
+    text = text_cells(values)
+
+    years = text.str.extract(YEAR_PATTERN, expand=False).astype(float)
+    years = years.where(years.notna() | text.isna(), float(datetime.now().year))
+
+    numeric = values.notna() & text.isna()
+    if numeric.any():
+        years[numeric] = np.trunc(pd.to_numeric(values[numeric], errors='coerce'))
+
+    return years
+
+
+def _trailer_views_column(values: pd.Series) -> pd.Series:
+    text = text_cells(values)
+
+    digits = (
+        text.str.findall(VIEWS_PATTERN).str.join('')
+        .str.replace(' ', '', regex=False)
+        .str.replace(',', '', regex=False)
+        .str.replace('.', '', regex=False)
+    )
+    views = pd.to_numeric(digits, errors='coerce').fillna(0)
+
+    numeric = values.notna() & text.isna()
+    if numeric.any():
+        views[numeric] = pd.to_numeric(values[numeric], errors='coerce')
+
+    return views.astype(float)
+
+
+def _count_column(values: pd.Series) -> pd.Series:
+    text = string_values(values).where(values.notna())
+    return pd.to_numeric(text.str.extract(NUMBER_PATTERN, expand=False), errors='coerce').fillna(0)
+
+
+def parse_duration_column(series: pd.Series) -> pd.Series:
+    """Vectorized parse_duration: '1h 44min' strings to minutes, 105 by default"""
+    return _parse(series, _duration_column, parse_duration)
+
+
+def parse_year_column(series: pd.Series) -> pd.Series:
+    """Vectorized parse_year: first four-digit group, current year if none"""
+    return integers_or_missing(_parse(series, _year_column, parse_year))
+
+
+def parse_trailer_views_column(series: pd.Series) -> pd.Series:
+    """Vectorized parse_trailer_views: digits of '5 000 000 vues' as a number"""
+    return _parse(series, _trailer_views_column, parse_trailer_views)
+
+
+def parse_count_column(series: pd.Series) -> pd.Series:
+    """Vectorized parse_count: first number of each value, 0 if there is none"""
+    return _parse(series, _count_column, parse_count).astype('int64')
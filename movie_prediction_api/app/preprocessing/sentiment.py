@@ -0,0 +1,178 @@
+"""
+Cached synopsis sentiment scoring
+
+TextBlob polarity is the slowest feature of the pipeline, and the same films
+are sent again and again. Scores are cached by a hash of the synopsis text in
+an in-memory LRU and, when SENTIMENT_CACHE_PATH is set, in a SQLite file that
+survives restarts and is shared by the workers of a host. Each process opens
+its own connection on first use: a SQLite connection must not cross a fork
+(gunicorn --preload, process executors).
+
+TextBlob pulls in nltk and scipy, so it is imported on first use (the API
+warms it up at startup) rather than when this module is imported.
+"""
+import os
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.preprocessing.parsing import string_values
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "50000"))
+SENTIMENT_CACHE_PATH = os.getenv("SENTIMENT_CACHE_PATH")
+
+
+def synopsis_key(text: str) -> str:
+    """Content hash used as the cache key of a synopsis"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+_TextBlob = None
+
+
+def compute_polarity(text: str) -> float:
+    """TextBlob polarity of a text, without any caching"""
+    global _TextBlob
+    if _TextBlob is None:
+        from textblob import TextBlob
+        _TextBlob = TextBlob
+    return _TextBlob(text).sentiment.polarity
+
+
+class SentimentCache:
+    """
+    Two-level cache of sentiment scores keyed by synopsis hash
+
+    Args:
+        max_size: Number of scores kept in memory (least recently used evicted)
+        db_path: Optional SQLite file used as a persistent second level
+    """
+
+    def __init__(self, max_size: int = SENTIMENT_CACHE_SIZE, db_path: Optional[str] = SENTIMENT_CACHE_PATH):
+        self.max_size = max_size
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """SQLite connection of the current process, opened on first use (call with the lock held)"""
+        if not self.db_path:
+            return None
+        if self._db_pid != os.getpid():
+            # A connection inherited through fork belongs to the parent, it is dropped unused
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS sentiment (key TEXT PRIMARY KEY, polarity REAL NOT NULL)")
+            self._db.commit()
+            self._db_pid = os.getpid()
+            logger.info(f"Sentiment cache persisted in {self.db_path}")
+        return self._db
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        """Return the cached scores among keys"""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+            missing = [key for key in keys if key not in found]
+            db = self._connection() if missing else None
+            if db is not None:
+                # Stay below SQLite's default limit of bound variables
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = db.execute(
+                        f"SELECT key, polarity FROM sentiment WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, polarity in rows:
+                        found[key] = polarity
+                        self._remember(key, polarity)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: Dict[str, float]) -> None:
+        """Store new scores in both levels"""
+        if not scores:
+            return
+        with self._lock:
+            for key, polarity in scores.items():
+                self._remember(key, polarity)
+            db = self._connection()
+            if db is not None:
+                db.executemany("INSERT OR REPLACE INTO sentiment (key, polarity) VALUES (?, ?)", scores.items())
+                db.commit()
+
+    def _remember(self, key: str, polarity: float) -> None:
+        self._memory[key] = polarity
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """Empty the in-memory level and reset the counters"""
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_cache = SentimentCache()
+
+
+def get_sentiment_cache() -> SentimentCache:
+    """Get the process-wide sentiment cache"""
+    return _cache
+
+
+def score_texts(texts: Iterable[str], cache: SentimentCache = None) -> List[float]:
+    """
+    Sentiment polarity of a batch of texts
+
+    Identical texts are scored once, and texts already in the cache are not
+    scored at all.
+    """
+    if cache is None:
+        cache = _cache
+    texts = list(texts)
+    keys = {text: synopsis_key(text) for text in set(texts)}
+
+    scores = cache.get_many(keys.values())
+    new_scores = {}
+    for text, key in keys.items():
+        if key not in scores:
+            new_scores[key] = compute_polarity(text)
+    cache.put_many(new_scores)
+    scores.update(new_scores)
+
+    return [scores[keys[text]] for text in texts]
+
+
+def score_synopses(synopses: pd.Series, cache: SentimentCache = None) -> pd.Series:
+    """
+    Sentiment polarity of a synopsis column, missing synopses score as ""
+
+    Returns:
+        Float Series aligned on synopses
+    """
+    text = string_values(synopses).where(synopses.notna(), "")
+    unique = text.unique()
+    polarity = dict(zip(unique, score_texts(unique, cache)))
+    return text.map(polarity).astype(float)
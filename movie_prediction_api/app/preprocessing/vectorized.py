@@ -0,0 +1,399 @@
+"""
+Column-wise implementation of the feature stages of preprocess_movie_data
+
+Every function here produces the same columns and values as its row-wise
+counterpart in app.preprocessing.feature_engineering, but works on whole
+columns with pandas string accessors, np.select binning and array operations
+instead of one Python lambda call per row. The list columns are Arrow list
+arrays (see app.preprocessing.list_columns) where the row-wise stages build
+one Python list per cell.
+"""
+import calendar
+import logging
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing.feature_engineering import add_interaction_features
+from app.preprocessing.history_index import get_history_index
+from app.preprocessing.keywords import TITLE_MATCHER, DISTRIBUTOR_MATCHER
+from app.preprocessing.list_columns import list_items, list_lengths, rows_containing, split_list_column
+from app.preprocessing.parsing import (
+    integers_or_missing, parse_count_column, parse_duration_column, parse_trailer_views_column, parse_year_column,
+    string_values, text_cells
+)
+from app.preprocessing.sentiment import score_synopses
+
+logger = logging.getLogger(__name__)
+
+MONTH_NAMES = {month: calendar.month_name[month] for month in range(1, 13)}
+
+
+def iso_week_column(series: pd.Series) -> pd.Series:
+    """Vectorized get_iso_week, parsing each date string on its own"""
+    values = series.astype(object)
+    text = text_cells(values)
+
+    # ISO dates first, then the slower element-wise parser for the rest
+    dates = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    retry = dates.isna() & text.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(text[retry], format='mixed', errors='coerce')
+
+    timestamps = values.map(lambda x: x if isinstance(x, pd.Timestamp) else None)
+    dates = dates.where(timestamps.isna(), pd.to_datetime(timestamps))
+
+    weeks = dates.dt.isocalendar().week.astype(float)
+    return integers_or_missing(weeks)
+
+
+def transform_basic_features(df):
+    """
+    Transform the basic features to expected format
+    """
+    # Convert duration from string to minutes
+    if 'duration' in df.columns:
+        df['duration'] = parse_duration_column(df['duration'])
+
+    # Parse year of production if it's a string
+    if 'year_of_production' in df.columns and df['year_of_production'].dtype == 'object':
+        df['year_of_production'] = parse_year_column(df['year_of_production'])
+
+    return df
+
+
+def placeholder_ids(titles: list) -> np.ndarray:
+    """
+    Placeholder film ids derived from the titles
+
+    hash() of a string is salted per process, so the ids are only stable
+    within one process (see app.preprocessing.parallel).
+    """
+    return np.array([hash(x) % 1000000 for x in titles], dtype='int64')
+
+
+def add_placeholder_columns(df):
+    """
+    Add the placeholder and default columns of the scraped dataset that the API does not receive
+    """
+    titles = df['film_title'].tolist()
+    ids = placeholder_ids(titles) if 'film_url' not in df.columns or 'film_id' not in df.columns else None
+
+    # Create URL and image URL placeholders
+    if 'film_url' not in df.columns:
+        df['film_url'] = [f"https://www.allocine.fr/film/fichefilm_gen_cfilm={i}.html" for i in ids]
+
+    if 'film_image_url' not in df.columns:
+        df['film_image_url'] = "https://fr.web.img3.acsta.net/c_310_420/img/default_movie_poster.jpg"
+
+    # Create film_id if not exists
+    if 'film_id' not in df.columns:
+        df['film_id'] = ids
+
+    # Ensure we have ratings (defaults)
+    if 'press_rating' not in df.columns:
+        df['press_rating'] = 2.5
+
+    if 'viewer_rating' not in df.columns:
+        df['viewer_rating'] = 3.0
+
+    # Add default entries
+    if 'fr_entries' not in df.columns:
+        df['fr_entries'] = 0
+
+    if 'us_entries' not in df.columns:
+        df['us_entries'] = 0
+
+    # Add budget placeholder
+    if 'budget' not in df.columns:
+        df['budget'] = '-'
+
+    # Add ISO week placeholders
+    missing_weeks = [col for col in ['fr_entry_week_iso_week', 'us_entry_week_iso_week'] if col not in df.columns]
+    if missing_weeks:
+        weeks = iso_week_column(df['release_date'])
+        for col in missing_weeks:
+            df[col] = weeks
+
+    # Add missing metrics
+    if 'viewer_notes' not in df.columns:
+        df['viewer_notes'] = 0
+
+    if 'viewer_critiques' not in df.columns:
+        df['viewer_critiques'] = 0
+
+    if 'press_critics_count_num' not in df.columns:
+        df['press_critics_count_num'] = 0
+
+    return df
+
+
+def add_date_features(df):
+    """
+    Add features related to release date
+    """
+    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
+
+    month = df['release_date'].dt.month
+    df['release_date_france_year'] = df['release_date'].dt.year
+    df['release_date_france_month'] = month.map(MONTH_NAMES).astype(object).where(month.notna(), None)
+    df['release_date_france_day'] = df['release_date'].dt.day
+
+    season = np.select(
+        [month.isin([12, 1, 2]), month.isin([3, 4, 5]), month.isin([6, 7, 8])],
+        ['Winter', 'Spring', 'Summer'],
+        default='Fall'
+    )
+    df['release_season'] = pd.Series(season, index=df.index, dtype=object).where(month.notna(), None)
+
+    df['release_season_binary'] = integers_or_missing(
+        month.isin([12, 1, 2, 6, 7, 8]).astype(float).where(month.notna())
+    )
+    df['release_date_binary'] = integers_or_missing(
+        month.isin([5, 6, 7, 10, 11, 12]).astype(float).where(month.notna())
+    )
+
+    return df
+
+
+def add_duration_features(df):
+    """
+    Add features related to movie duration
+    """
+    duration = df['duration']
+    df['duration_binary'] = (duration > 120).astype(int)
+
+    df['duration_classified'] = np.select(
+        [duration.isna(), duration < 70, duration < 160, duration < 210],
+        ["normal-film", "short-film", "normal-film", "long-film"],
+        default="very long film"
+    ).astype(object)
+
+    return df
+
+
+def add_director_features(df):
+    """
+    Add features related to movie director
+    """
+    df['director_binary'] = (df['director'].notna() & df['director'].ne('')).astype(int)
+
+    return df
+
+
+def add_people_features(df):
+    """
+    Add features related to people involved (producers, stars)
+    """
+    df['producers_list'] = split_list_column(df['producers'])
+    df['producers_count'] = list_lengths(df['producers_list'])
+    df['producers_count_binary'] = (df['producers_count'] > 0).astype(int)
+
+    df['top_stars_list'] = split_list_column(df['top_stars'])
+    df['top_stars_count'] = list_lengths(df['top_stars_list'])
+    df['top_stars_count_binary'] = (df['top_stars_count'] > 0).astype(int)
+
+    return df
+
+
+def add_cultural_features(df):
+    """
+    Add features related to cultural and language attributes
+    """
+    df['languages_list'] = split_list_column(df['languages'])
+    df['languages_count'] = list_lengths(df['languages_list'])
+
+    df['nationality_list'] = split_list_column(df['film_nationality'])
+    df['nationality_list_count'] = list_lengths(df['nationality_list'])
+    df['nationality_list_binary'] = rows_containing(df['nationality_list'], 'france')
+
+    return df
+
+
+def add_genre_features(df):
+    """
+    Add features related to the associated genres
+    """
+    df['associated_genres_list'] = split_list_column(df['associated_genres'])
+    df['associated_genres_count'] = list_lengths(df['associated_genres_list'])
+
+    return df
+
+
+def add_synopsis_features(df):
+    """
+    Add features related to synopsis and film details
+    """
+    synopsis = df['synopsis']
+    present = synopsis.notna()
+
+    # Process synopsis
+    synopsis_text = string_values(synopsis).where(present, "")
+    df['synopsis_length'] = synopsis_text.str.len()
+    df['synopsis_binary'] = (df['synopsis_length'] > 200).astype(int)
+
+    # Sentiment is computed once per distinct synopsis, and only if not cached
+    df['synopsis_sentiment'] = score_synopses(synopsis)
+
+    length = df['synopsis_length']
+    df['synopsis_length_categorized'] = np.select(
+        [length <= 200, length < 700, (length > 700) & (length < 1000)],
+        ["not long", "normal", "long"],
+        default="very long"
+    ).astype(object)
+
+    sentiment = df['synopsis_sentiment']
+    df['synopisis_sentiment_categorized'] = np.select(
+        [sentiment.isna(), sentiment <= -0.2, sentiment < 0.2, (sentiment > 0.2) & (sentiment < 0.5)],
+        ["neutral", "negative", "neutral", "positive"],
+        default="very positive"
+    ).astype(object)
+
+    df['filming_secrets_num'] = parse_count_column(df['filming_secrets'])
+
+    if 'awards' in df.columns:
+        awards = df['awards']
+        df['award_count'] = (awards.notna() & string_values(awards).str.strip().ne('')).astype(int)
+        df['nomination_count'] = df['award_count']
+    else:
+        df['award_count'] = 0
+        df['nomination_count'] = 0
+
+    df['award_binary'] = (df['award_count'] > 0).astype(int)
+    df['nomination_binary'] = (df['nomination_count'] > 0).astype(int)
+
+    if 'trailer_views' in df.columns:
+        df['trailer_views_num'] = parse_trailer_views_column(df['trailer_views'])
+    else:
+        df['trailer_views_num'] = 0
+
+    df['trailer_views_num_binary'] = (df['trailer_views_num'] > 10000).astype(int)
+
+    return df
+
+
+def add_distributor_features(df):
+    """
+    Add features related to movie distributor
+    """
+    distributor = df['distributor']
+    df['distributor_binary'] = (distributor.notna() & distributor.ne('')).astype(int)
+
+    flags = DISTRIBUTOR_MATCHER.flags(distributor)
+    df['top_distributor_score'] = np.where(flags['top_distributors'] == 1, 1.0, 0.5)
+
+    # Independent distributors win over the studio and distributor weights
+    independent = DISTRIBUTOR_MATCHER.first_weight(distributor, 'independent_weights')
+    studio = DISTRIBUTOR_MATCHER.first_weight(distributor, 'studio_weights')
+    dist = DISTRIBUTOR_MATCHER.first_weight(distributor, 'distributor_weights')
+    df['distributor_power'] = np.where(independent > 0, independent, studio + dist)
+
+    return df
+
+
+def _past_performance(index, role: str, names: pd.Series):
+    """Past films and mean entries of each name of a column, looked up once per distinct name"""
+    codes, uniques = pd.factorize(names.astype(object), use_na_sentinel=False)
+    films, entries = index.lookup_many(role, uniques)
+    return films[codes], entries[codes]
+
+
+def add_history_features(df):
+    """
+    Add the track record of the director, stars and distributor in past
+    French releases, looked up once per distinct name
+    """
+    index = get_history_index()
+
+    df['director_past_films'], df['director_past_entries'] = _past_performance(index, 'director', df['director'])
+
+    rows, codes, vocabulary = list_items(df['top_stars_list'])
+    entries = index.lookup_many('star', vocabulary)[1][codes]
+    known = ~np.isnan(entries)
+    rows, entries = rows[known], entries[known]
+    count = np.bincount(rows, minlength=len(df))
+    total = np.bincount(rows, weights=entries, minlength=len(df))
+    highest = np.full(len(df), -np.inf)
+    np.maximum.at(highest, rows, entries)
+    df['stars_past_known'] = count.astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['stars_past_entries'] = np.where(count > 0, total / count, np.nan)
+    df['stars_past_max_entries'] = np.where(count > 0, highest, np.nan)
+
+    df['distributor_past_films'], df['distributor_past_entries'] = _past_performance(
+        index, 'distributor', df['distributor']
+    )
+
+    return df
+
+
+def add_franchise_features(df):
+    """
+    Add features related to movie franchise status
+    """
+    flags = TITLE_MATCHER.flags(df['film_title'])
+
+    df['franchise_level'] = np.select(
+        [
+            flags['mega_franchises'] == 1,
+            flags['major_franchises'] == 1,
+            flags['big_franchises'] == 1,
+            flags['top_franchises'] == 1,
+        ],
+        [4, 3, 2, 1],
+        default=0
+    )
+
+    df['is_mcu'] = flags['mcu_titles']
+    df['is_likely_blockbuster'] = flags['likely_blockbusters']
+
+    return df
+
+
+def add_licence_features(df):
+    """
+    Add licence flags, the sequel flag and the franchise blockbuster score
+    """
+    flags = TITLE_MATCHER.flags(df['film_title'])
+
+    df['is_superhero_franchise'] = flags['superhero_franchises']
+    df['is_animation_franchise'] = flags['animation_franchises']
+    df['is_action_franchise'] = flags['action_franchises']
+    df['is_gaming_franchise'] = flags['gaming_franchises']
+
+    df['is_licence'] = (
+        df['is_superhero_franchise'] |
+        df['is_animation_franchise'] |
+        df['is_action_franchise'] |
+        df['is_gaming_franchise']
+    ).astype(int)
+
+    df['is_sequel'] = flags['sequel_indicators']
+
+    bonus_cols = [
+        'is_superhero_franchise',
+        'is_animation_franchise',
+        'is_action_franchise',
+        'is_gaming_franchise',
+        'is_sequel'
+    ]
+    dist_bonus = DISTRIBUTOR_MATCHER.flags(df['distributor'])['strong_distributors']
+
+    df['franchise_blockbuster_score'] = df['franchise_level'] * 2 + df[bonus_cols].sum(axis=1) + dist_bonus
+
+    return df
+
+
+def add_studio_features(df):
+    """
+    Add features related to studio and production company
+    """
+    flags = DISTRIBUTOR_MATCHER.flags(df['distributor'])
+
+    df['is_major_studio'] = flags['major_studios']
+    df['is_french_major_studio'] = flags['french_majors']
+
+    df['major_studio_and_licence'] = (df['is_major_studio'] & df['is_licence']).astype(int)
+    df['french_major_and_licence'] = (df['is_french_major_studio'] & df['is_licence']).astype(int)
+
+    return df
@@ -88,4 +88,9 @@ class BatchMovieInput(BaseModel):
 
 
 class BatchMoviePrediction(BaseModel):
-    predictions: List[MoviePrediction]
\ No newline at end of file
+    predictions: List[MoviePrediction]
+
+
+class MultiModelPrediction(BaseModel):
+    film_title: str
+    predictions: Dict[str, MoviePrediction]
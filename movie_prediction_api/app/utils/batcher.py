@@ -0,0 +1,108 @@
+"""
+Micro-batching of concurrent single-movie predictions
+
+When many /predict calls arrive together (the dashboard fires one per film),
+each one pays for its own DataFrame, preprocessing pass and model call.
+MicroBatcher holds the requests for a few milliseconds, runs them as one batch
+on the inference executor and hands each caller its own result. Predictions do
+not depend on the batch a film lands in, since continuous features are scaled
+with the statistics of the preprocessing artifact. A batch is preprocessed once
+even when its films are routed to different models.
+
+Opt-in with PREDICT_MICROBATCH=1. PREDICT_BATCH_WINDOW_MS (default 5) is the
+longest a request waits for others, PREDICT_BATCH_MAX_SIZE (default 32) flushes
+a batch as soon as it is full.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.models.prediction_model import predict_movies_routed
+from app.utils.executor import get_executor
+
+logger = logging.getLogger(__name__)
+
+MICROBATCH_ENABLED = os.getenv("PREDICT_MICROBATCH", "0").lower() in ("1", "true", "yes")
+BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction requests into batches
+
+    Args:
+        window_ms: Time the first request of a batch waits for more requests
+        max_size: Number of requests that flushes a batch immediately
+        lane: Executor lane the batches are run on
+    """
+
+    def __init__(self, window_ms: float = BATCH_WINDOW_MS, max_size: int = BATCH_MAX_SIZE, lane: str = "predict"):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.lane = lane
+        self.batches = 0
+        self.items = 0
+        self._pending: List[Tuple[Dict[str, Any], str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, movie: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        """Queue one raw movie and wait for its prediction by the named model"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((movie, model_name, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], str, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            movies_df = pd.DataFrame([movie for movie, _, _ in batch])
+            model_names = [model_name for _, model_name, _ in batch]
+            predictions = await get_executor().run(self.lane, predict_movies_routed, movies_df, model_names)
+        except Exception as e:
+            # Every caller of the batch gets the error (including executor saturation)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug(f"Micro-batch of {len(batch)} predictions done")
+        for (_, _, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+        }
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> MicroBatcher:
+    """Get the process-wide micro-batcher (created on the running event loop)"""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher()
+    return _batcher
@@ -0,0 +1,106 @@
+"""
+Arrow IPC and Parquet batch inputs and outputs
+
+Columnar bodies are decoded straight into the DataFrame expected by
+preprocess_movie_data, with a check of the schema instead of one Pydantic
+object per film. The columns are those of MovieInput: film_title,
+release_date and duration are required, the others are optional and extra
+columns are ignored.
+"""
+import io
+import logging
+from typing import Any, Dict, List, Union
+
+import pandas as pd
+
+from app.models.prediction_model import predict_movies_routed
+from app.schema.movie_schema import MovieInput
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = ('arrow', 'parquet')
+
+MEDIA_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+MOVIE_INPUT_COLUMNS = list(MovieInput.model_fields)
+REQUIRED_COLUMNS = [name for name, field in MovieInput.model_fields.items() if field.is_required()]
+
+
+class ColumnarFormatError(ValueError):
+    """Raised when a columnar body cannot be read or lacks required columns"""
+
+
+def read_table(data: bytes, input_format: str):
+    """Decode an Arrow IPC (stream or file) or Parquet body into a pyarrow Table"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        if input_format == 'parquet':
+            return pq.read_table(io.BytesIO(data))
+        try:
+            return pa.ipc.open_stream(data).read_all()
+        except pa.ArrowInvalid:
+            return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    except Exception as e:
+        raise ColumnarFormatError(f"Invalid {input_format} body: {str(e)}")
+
+
+def table_to_movies(table) -> pd.DataFrame:
+    """MovieInput columns of a table as a DataFrame, missing optional columns as None"""
+    missing = [col for col in REQUIRED_COLUMNS if col not in table.column_names]
+    if missing:
+        raise ColumnarFormatError(f"Missing required columns: {', '.join(missing)}")
+
+    present = [col for col in MOVIE_INPUT_COLUMNS if col in table.column_names]
+    movies_df = table.select(present).to_pandas()
+    for col in MOVIE_INPUT_COLUMNS:
+        if col not in movies_df.columns:
+            movies_df[col] = None
+    return movies_df[MOVIE_INPUT_COLUMNS]
+
+
+def predictions_to_table(predictions: List[Dict[str, Any]]):
+    """pyarrow Table with one row per prediction"""
+    import pyarrow as pa
+
+    return pa.table({
+        'film_title': pa.array([p['film_title'] for p in predictions], type=pa.string()),
+        'predicted_fr_entries': pa.array([p['predicted_fr_entries'] for p in predictions], type=pa.int64()),
+        'method': pa.array([(p.get('features') or {}).get('method') for p in predictions], type=pa.string()),
+    })
+
+
+def write_table(table, output_format: str) -> bytes:
+    """Encode a table as an Arrow IPC stream or a Parquet file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    if output_format == 'parquet':
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def predict_columnar(data: bytes, input_format: str, output_format: str = 'json') -> Union[List[Dict[str, Any]], bytes]:
+    """
+    Decode a columnar body, predict its films and encode the results
+
+    Runs on an inference worker, so decoding and encoding stay off the event loop.
+
+    Returns:
+        List of prediction dicts for output_format "json", encoded bytes otherwise
+    """
+    movies_df = table_to_movies(read_table(data, input_format))
+    logger.info(f"{input_format} body decoded with {len(movies_df)} movies")
+
+    predictions = predict_movies_routed(movies_df)
+    if output_format == 'json':
+        return predictions
+    return write_table(predictions_to_table(predictions), output_format)
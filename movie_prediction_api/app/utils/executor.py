@@ -0,0 +1,190 @@
+"""
+Bounded worker pool for the CPU-bound inference work of the API
+
+Preprocessing, TextBlob and CatBoost are synchronous, so running them inside
+the async endpoints blocks the event loop. The endpoints hand that work to
+InferenceExecutor instead. Requests are admitted without waiting: when an
+endpoint already has its maximum number of jobs in flight the request is
+refused with 429, and when the pool and its queue are full it is refused with
+503, both with a Retry-After header.
+
+Configuration (environment):
+    INFERENCE_EXECUTOR      "thread" (default) or "process"
+    INFERENCE_WORKERS       number of workers (default: CPU count, between 4 and 8)
+    INFERENCE_QUEUE_SIZE    jobs allowed to wait for a worker (default 32)
+    INFERENCE_LIMITS        per-endpoint limits, e.g. "predict_csv=1,predict_batch=2"
+"""
+import os
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bulk endpoints get fewer slots than the default worker count, so that some
+# workers are always left for single predictions
+DEFAULT_LIMITS = {
+    'predict_batch': 2,
+    'predict_csv': 1,
+}
+
+
+def parse_limits(value: Optional[str]) -> Dict[str, int]:
+    """Parse "lane=limit,lane=limit" into a dict"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        lane, limit = item.split('=', 1)
+        limits[lane.strip()] = int(limit)
+    return limits
+
+
+_worker_process = False
+
+
+def _mark_worker_process() -> None:
+    """Initializer of the workers of the process pool"""
+    global _worker_process
+    _worker_process = True
+
+
+def in_worker_process() -> bool:
+    """Whether this process is a worker of a process InferenceExecutor"""
+    return _worker_process
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a job is refused because the executor is at capacity"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Worker pool with a bounded queue and per-endpoint concurrency limits
+
+    Args:
+        max_workers: Number of threads or processes running jobs
+        queue_size: Number of admitted jobs allowed to wait for a worker
+        limits: Maximum number of jobs in flight per lane (endpoint)
+        kind: "thread" or "process"
+    """
+
+    def __init__(self, max_workers: int = None, queue_size: int = 32,
+                 limits: Dict[str, int] = None, kind: str = "thread"):
+        self.max_workers = max_workers or max(4, min(8, os.cpu_count() or 1))
+        self.queue_size = queue_size
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.kind = kind
+        self._pool: Optional[Executor] = None
+        self._in_flight: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "InferenceExecutor":
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(parse_limits(os.getenv("INFERENCE_LIMITS")))
+        workers = os.getenv("INFERENCE_WORKERS")
+        return cls(
+            max_workers=int(workers) if workers else None,
+            queue_size=int(os.getenv("INFERENCE_QUEUE_SIZE", "32")),
+            limits=limits,
+            kind=os.getenv("INFERENCE_EXECUTOR", "thread"),
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Jobs that can be admitted at once, running or queued"""
+        return self.max_workers + self.queue_size
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_mark_worker_process)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+            logger.info(f"Inference {self.kind} pool started with {self.max_workers} workers "
+                        f"and a queue of {self.queue_size}")
+        return self._pool
+
+    def acquire(self, lane: str) -> None:
+        """
+        Reserve a slot of lane, without waiting
+
+        Raises:
+            ExecutorSaturated: If the lane or the whole pool is at capacity
+        """
+        with self._lock:
+            limit = self.limits.get(lane)
+            in_flight = self._in_flight.get(lane, 0)
+            if limit is not None and in_flight >= limit:
+                raise ExecutorSaturated(429, f"Too many concurrent {lane} requests ({limit} allowed), retry later")
+            if self._total >= self.capacity:
+                raise ExecutorSaturated(503, "Prediction workers are saturated, retry later")
+            self._in_flight[lane] = in_flight + 1
+            self._total += 1
+
+    def release(self, lane: str) -> None:
+        """Give back a slot reserved with acquire"""
+        with self._lock:
+            self._in_flight[lane] -= 1
+            self._total -= 1
+
+    async def run_acquired(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a job on a worker for a caller that already holds a slot (see acquire)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+
+    async def run(self, lane: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on a worker and await its result
+
+        With the process pool, fn must be a module-level function and its
+        arguments must be picklable.
+
+        Raises:
+            ExecutorSaturated: If the lane or the whole pool is at capacity
+        """
+        self.acquire(lane)
+        try:
+            return await self.run_acquired(fn, *args, **kwargs)
+        finally:
+            self.release(lane)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'workers': self.max_workers,
+                'queue_size': self.queue_size,
+                'in_flight': self._total,
+                'lanes': dict(self._in_flight),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_executor: Optional[InferenceExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> InferenceExecutor:
+    """Get the process-wide inference executor, configured from the environment"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = InferenceExecutor.from_env()
+    return _executor
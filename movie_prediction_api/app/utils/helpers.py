@@ -6,8 +6,6 @@ import json
 from typing import Dict, List, Any, Union
 from pathlib import Path
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def ensure_directory_exists(directory_path: Union[str, Path]) -> None:
@@ -0,0 +1,119 @@
+"""
+Prometheus metrics of the prediction API
+
+Histograms of request latency, batch size, time per preprocessing stage and
+model time, counters of the prediction method used and of the films answered
+by the degraded-mode stub, and the counters of the sentiment and prediction
+caches read at scrape time. They are served in the Prometheus text format by
+GET /metrics.
+
+With INFERENCE_EXECUTOR=process, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so the metrics recorded in the worker processes are aggregated.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Latencies range from a cached hit (microseconds) to a large CSV (minutes)
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000, 100000)
+
+REQUEST_LATENCY = Histogram(
+    'movie_api_request_duration_seconds', 'HTTP request latency until the response starts',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    'movie_api_batch_size', 'Number of films per prediction job', buckets=BATCH_SIZE_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    'movie_api_preprocessing_stage_seconds', 'Time spent in each preprocess_movie_data stage',
+    ['stage'], buckets=STAGE_BUCKETS
+)
+FEATURE_MATRIX_DURATION = Histogram(
+    'movie_api_feature_matrix_seconds', 'Time spent building the model inputs of a batch', buckets=STAGE_BUCKETS
+)
+MODEL_DURATION = Histogram(
+    'movie_api_model_inference_seconds', 'Time spent in the model predict call', buckets=STAGE_BUCKETS
+)
+UNSEEN_CATEGORIES = Counter(
+    'movie_api_unseen_categories', 'Categorical values absent from the training vocabulary', ['feature']
+)
+PREDICTIONS = Counter(
+    'movie_api_predictions', 'Films predicted, by prediction method (catboost, rule_based, mock_model)',
+    ['method']
+)
+STUB_PREDICTIONS = Counter(
+    'movie_api_stub_predictions', 'Films answered by the placeholder model while no model file is loaded'
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the with-block in a histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - started)
+
+
+class RuntimeCollector:
+    """Cache and executor counters, read from their objects at scrape time"""
+
+    def collect(self):
+        from app.preprocessing.sentiment import get_sentiment_cache
+        from app.utils.prediction_cache import get_prediction_cache
+        from app.utils.executor import get_executor
+
+        sentiment = get_sentiment_cache()
+        predictions = get_prediction_cache().stats()
+
+        lookups = CounterMetricFamily('movie_api_cache_lookups', 'Cache lookups by cache and result',
+                                      labels=['cache', 'result'])
+        lookups.add_metric(['sentiment', 'hit'], sentiment.hits)
+        lookups.add_metric(['sentiment', 'miss'], sentiment.misses)
+        lookups.add_metric(['prediction', 'hit'], predictions['hits'])
+        lookups.add_metric(['prediction', 'redis_hit'], predictions['redis_hits'])
+        lookups.add_metric(['prediction', 'miss'], predictions['misses'])
+        yield lookups
+
+        evictions = CounterMetricFamily('movie_api_cache_evictions', 'Entries evicted from a cache', labels=['cache'])
+        evictions.add_metric(['prediction'], predictions['evictions'])
+        yield evictions
+
+        size = GaugeMetricFamily('movie_api_cache_entries', 'Entries held in memory by a cache', labels=['cache'])
+        size.add_metric(['sentiment'], len(sentiment))
+        size.add_metric(['prediction'], predictions['size'])
+        yield size
+
+        executor = get_executor().stats()
+        in_flight = GaugeMetricFamily('movie_api_executor_in_flight', 'Jobs running or queued on the executor',
+                                      labels=['lane'])
+        for lane, count in executor['lanes'].items():
+            in_flight.add_metric([lane], count)
+        yield in_flight
+
+
+REGISTRY.register(RuntimeCollector())
+
+
+def render_metrics() -> bytes:
+    """Current metrics in the Prometheus text format"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(RuntimeCollector())
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+# Prometheus text format 0.0.4, Starlette appends the charset of text/ responses
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
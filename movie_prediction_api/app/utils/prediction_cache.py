@@ -0,0 +1,195 @@
+"""
+Cache of prediction results keyed by the normalized movie input
+
+The dashboard and the Django update_data view ask again and again for the
+same films with identical payloads. Results are cached under a hash of the
+normalized MovieInput and the version of the model that produced them, in an
+in-process LRU with a TTL and, when PREDICTION_CACHE_REDIS_URL is set, in
+Redis so that every worker and the Django side share the same entries.
+
+Configuration (environment):
+    PREDICTION_CACHE_SIZE       entries kept in memory, 0 disables the cache (default 10000)
+    PREDICTION_CACHE_TTL        seconds an entry stays valid (default 3600)
+    PREDICTION_CACHE_REDIS_URL  e.g. redis://localhost:6379/2 (optional, needs the redis package)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_REDIS_URL = os.getenv("PREDICTION_CACHE_REDIS_URL")
+
+# Fields of MovieInput that do not change the prediction (fr_entries is the target)
+IGNORED_FIELDS = {'fr_entries'}
+
+# Only predictions of the real model are cached, fallback results are not
+CACHEABLE_METHODS = {'catboost'}
+
+
+def normalize_movie(movie: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form of a movie payload: stripped strings, blanks as None"""
+    normalized = {}
+    for field, value in movie.items():
+        if field in IGNORED_FIELDS:
+            continue
+        if isinstance(value, str):
+            value = value.strip() or None
+        normalized[field] = value
+    return normalized
+
+
+def prediction_key(movie: Dict[str, Any], model_version: str) -> str:
+    """Cache key of a movie payload for a given model version"""
+    payload = json.dumps(normalize_movie(movie), sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"prediction:{model_version}:{digest}"
+
+
+class PredictionCache:
+    """
+    Two-tier cache of prediction results
+
+    Args:
+        max_size: Entries kept in memory (least recently used evicted), 0 disables the cache
+        ttl: Seconds an entry stays valid in both tiers
+        redis_url: Optional Redis URL of the shared tier
+    """
+
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE, ttl: float = PREDICTION_CACHE_TTL,
+                 redis_url: Optional[str] = PREDICTION_CACHE_REDIS_URL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = self._connect(redis_url) if redis_url and max_size > 0 else None
+
+    @staticmethod
+    def _connect(redis_url: str):
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.5)
+            client.ping()
+            logger.info(f"Prediction cache shared through Redis at {redis_url}")
+            return client
+        except Exception as e:
+            logger.warning(f"Redis prediction cache unavailable ({str(e)}), using the in-process cache only")
+            return None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached prediction for key, or None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+                self.evictions += 1
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+            except Exception as e:
+                logger.warning(f"Redis prediction cache read failed: {str(e)}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                with self._lock:
+                    self.redis_hits += 1
+                    self._remember(key, value, now)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a prediction in both tiers"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, value, time.monotonic())
+        if self._redis is not None:
+            try:
+                self._redis.set(key, json.dumps(value, ensure_ascii=False), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                logger.warning(f"Redis prediction cache write failed: {str(e)}")
+
+    def _remember(self, key: str, value: Dict[str, Any], now: float) -> None:
+        self._memory[key] = (now + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, movies: List[Dict[str, Any]],
+               model_versions: List[str]) -> Tuple[List[str], List[Optional[Dict[str, Any]]]]:
+        """
+        Keys and cached predictions (None when missing) of a list of movie payloads
+
+        Args:
+            movies: Raw movie payloads
+            model_versions: Version of the model each movie is predicted with
+        """
+        keys = [prediction_key(movie, version) for movie, version in zip(movies, model_versions)]
+        return keys, [self.get(key) for key in keys]
+
+    def store(self, keys: List[str], predictions: List[Dict[str, Any]]) -> None:
+        """Cache the predictions that came from the real model"""
+        for key, prediction in zip(keys, predictions):
+            if prediction.get('features', {}).get('method') in CACHEABLE_METHODS:
+                self.put(key, prediction)
+
+    def clear(self) -> None:
+        """Empty the in-process tier and reset the counters"""
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.redis_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._memory),
+                'hits': self.hits,
+                'redis_hits': self.redis_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                'redis': self._redis is not None,
+            }
+
+
+_cache: Optional[PredictionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache() -> PredictionCache:
+    """Get the process-wide prediction cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
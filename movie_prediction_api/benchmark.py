@@ -0,0 +1,504 @@
+"""
+Latency and throughput benchmark of the prediction service
+
+Builds synthetic catalogues from load_sample_data() and times every feature
+stage, the text field parsers, prepare_features, the model call and the HTTP
+endpoints (through the ASGI test client). The multi_hot section compares the
+dense and the sparse model inputs in time and in peak memory (tracemalloc).
+The parallel section times the sharded preprocessing on 1 to 8 worker
+processes. The cold_start section starts a real uvicorn process and
+measures the import time of app.main and the time to the first successful
+/predict. Results are written as JSON so runs on different commits can be
+compared.
+
+Usage (from movie_prediction_api):
+    python benchmark.py --sizes 1 100 10000 --output bench.json
+    python benchmark.py --sizes 100000 --sections pipeline model
+    python benchmark.py --compare before.json --output after.json
+    python benchmark.py --sections cold_start --repeat 5
+    python benchmark.py --sections parsing --sizes 1000 100000
+    python benchmark.py --sections multi_hot --sizes 10000 100000
+    python benchmark.py --sections parallel --sizes 50000 --repeat 1
+
+Caches (sentiment, keywords, predictions) are emptied before every repeat and
+every film of a catalogue has a distinct title and synopsis, so the numbers
+are those of films seen for the first time.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import re
+import platform
+import statistics
+import socket
+import subprocess
+import tracemalloc
+import urllib.request
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.utils.helpers import load_sample_data
+from app.preprocessing.feature_engineering import get_pipeline_stages, preprocess_movie_data, PIPELINE_STAGES
+
+DEFAULT_SIZES = [1, 100, 10000]
+SECTIONS = ['pipeline', 'parsing', 'model', 'multi_hot', 'parallel', 'endpoints', 'cold_start']
+PARALLEL_WORKERS = [1, 2, 4, 8]
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(API_DIR, "model", "catboost_model.cbm")
+
+# JSON bodies of /predict_batch beyond this size are not representative
+MAX_JSON_BATCH = 10000
+
+
+def synthetic_catalogue(n_films: int, seed: int = 0) -> pd.DataFrame:
+    """Sample films resampled to n_films rows, each with its own title and synopsis"""
+    sample = load_sample_data()
+    films = sample.sample(n_films, replace=True, random_state=seed).reset_index(drop=True)
+    suffix = pd.Series(range(n_films)).astype(str)
+    films['film_title'] = films['film_title'] + ' ' + suffix
+    films['synopsis'] = films['synopsis'] + ' Episode ' + suffix + '.'
+    return films
+
+
+def reset_caches() -> None:
+    """Empty the in-process caches so every repeat starts cold"""
+    from app.preprocessing.sentiment import get_sentiment_cache
+    from app.preprocessing.keywords import TITLE_MATCHER, DISTRIBUTOR_MATCHER
+    from app.utils.prediction_cache import get_prediction_cache
+    from app.preprocessing import parsing
+
+    get_sentiment_cache().clear()
+    for memoized in (parsing._duration_minutes, parsing._year_of, parsing._views_of, parsing._first_number):
+        memoized.cache_clear()
+    TITLE_MATCHER.match.cache_clear()
+    DISTRIBUTOR_MATCHER.match.cache_clear()
+    get_prediction_cache().clear()
+
+
+def measure(fn: Callable[[], object], repeat: int, setup: Callable[[], None] = reset_caches) -> List[float]:
+    """Wall time of repeat calls of fn, setup run untimed before each call"""
+    timings = []
+    for _ in range(repeat):
+        setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(name: str, size: int, timings: List[float]) -> Dict:
+    median = statistics.median(timings)
+    return {
+        'name': name,
+        'size': size,
+        'repeat': len(timings),
+        'min_s': min(timings),
+        'median_s': median,
+        'mean_s': statistics.fmean(timings),
+        'per_film_us': median / size * 1e6 if size else None,
+        'films_per_s': size / median if median else None,
+    }
+
+
+def peak_memory(name: str, size: int, fn: Callable[[], object]) -> Dict:
+    """Peak of the Python and numpy allocations of one call of fn"""
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'name': name, 'size': size, 'peak_bytes': peak}
+
+
+def bench_pipeline(films: pd.DataFrame, repeat: int) -> List[Dict]:
+    """Time each feature stage and the whole preprocess_movie_data call"""
+    size = len(films)
+    results = []
+    for vectorized in (True, False):
+        label = 'vectorized' if vectorized else 'rowwise'
+        if not vectorized and size > 10000:
+            continue
+        stage_timings: Dict[str, List[float]] = {name: [] for name in PIPELINE_STAGES}
+        for _ in range(repeat):
+            reset_caches()
+            df = films.copy()
+            for name, stage in zip(PIPELINE_STAGES, get_pipeline_stages(vectorized)):
+                started = time.perf_counter()
+                df = stage(df)
+                stage_timings[name].append(time.perf_counter() - started)
+        for name, timings in stage_timings.items():
+            results.append(summarize(f"stage.{label}.{name}", size, timings))
+
+        timings = measure(lambda: preprocess_movie_data(films.copy(), vectorized=vectorized), repeat)
+        results.append(summarize(f"preprocess.{label}", size, timings))
+    return results
+
+
+def legacy_parse_duration(duration_str):
+    """parse_duration as it was before app.preprocessing.parsing, the baseline of bench_parsing"""
+    if pd.isna(duration_str) or duration_str is None:
+        return 105
+    if isinstance(duration_str, (int, float)):
+        return float(duration_str)
+    total_minutes = 0
+    hours_match = re.search(r'(\d+)h', str(duration_str))
+    if hours_match:
+        total_minutes += int(hours_match.group(1)) * 60
+    minutes_match = re.search(r'(\d+)min', str(duration_str))
+    if minutes_match:
+        total_minutes += int(minutes_match.group(1))
+    if total_minutes == 0:
+        number_match = re.search(r'(\d+)', str(duration_str))
+        if number_match:
+            total_minutes = int(number_match.group(1))
+    return total_minutes if total_minutes > 0 else 105
+
+
+def legacy_parse_year(year_str):
+    """parse_year as it was before app.preprocessing.parsing"""
+    if pd.isna(year_str) or year_str is None:
+        return None
+    if isinstance(year_str, (int, float)):
+        return int(year_str)
+    year_match = re.search(r'(\d{4})', str(year_str))
+    if year_match:
+        return int(year_match.group(1))
+    return datetime.now().year
+
+
+def legacy_parse_trailer_views(views_str):
+    """parse_trailer_views as it was before app.preprocessing.parsing"""
+    if pd.isna(views_str) or views_str is None:
+        return 0
+    if isinstance(views_str, (int, float)):
+        return float(views_str)
+    num_match = re.findall(r'[\d\s.,]+', str(views_str))
+    if num_match:
+        num_str = ''.join(num_match).replace(' ', '').replace(',', '').replace('.', '')
+        try:
+            return float(num_str)
+        except ValueError:
+            pass
+    return 0
+
+
+def legacy_parse_count(x):
+    """The filming_secrets_num lambda as it was before app.preprocessing.parsing"""
+    return int(re.search(r'\d+', str(x)).group()) if pd.notna(x) and re.search(r'\d+', str(x)) else 0
+
+
+def synthetic_text_fields(n_films: int, seed: int = 0) -> pd.DataFrame:
+    """Scraped text fields with the repetition of real catalogues (a few hundred distinct durations)"""
+    rng = np.random.default_rng(seed)
+    hours = rng.integers(1, 4, n_films)
+    minutes = rng.integers(0, 60, n_films)
+    return pd.DataFrame({
+        'duration': [f"{h}h {m:02d}min" for h, m in zip(hours, minutes)],
+        'year_of_production': rng.integers(1970, 2026, n_films).astype(str),
+        'trailer_views': [f"{v:,} vues".replace(',', ' ') for v in rng.integers(1, 2000, n_films) * 1000],
+        'filming_secrets': [f"{c} anecdotes" for c in rng.integers(0, 60, n_films)],
+    })
+
+
+def bench_parsing(size: int, repeat: int, seed: int = 0) -> List[Dict]:
+    """Time the text field parsers against the implementations they replaced"""
+    from app.preprocessing import parsing
+
+    fields = synthetic_text_fields(size, seed)
+    parsers = {
+        'duration': (legacy_parse_duration, parsing.parse_duration, parsing.parse_duration_column),
+        'year_of_production': (legacy_parse_year, parsing.parse_year, parsing.parse_year_column),
+        'trailer_views': (legacy_parse_trailer_views, parsing.parse_trailer_views, parsing.parse_trailer_views_column),
+        'filming_secrets': (legacy_parse_count, parsing.parse_count, parsing.parse_count_column),
+    }
+    results = []
+    for column, (legacy, scalar, vectorized) in parsers.items():
+        values = fields[column]
+        results.append(summarize(f"parse.{column}.legacy_apply", size, measure(lambda: values.apply(legacy), repeat)))
+        results.append(summarize(f"parse.{column}.memoized_apply", size, measure(lambda: values.apply(scalar), repeat)))
+        results.append(summarize(f"parse.{column}.column", size, measure(lambda: vectorized(values), repeat)))
+    return results
+
+
+def bench_model(films: pd.DataFrame, repeat: int, model_path: str) -> List[Dict]:
+    """
+    Time the preprocessing pruned to the model's feature plan, prepare_features,
+    the CatBoost input builder, the model call, the rule-based fallback and predict
+
+    The categorical encoding is timed against a plain astype(str) of every
+    categorical column, and the numeric block is timed on its own.
+    """
+    from app.models.prediction_model import MoviePredictionModel
+
+    size = len(films)
+    model = MoviePredictionModel(model_path)
+    features = preprocess_movie_data(films.copy())
+
+    results = [summarize("model.preprocess_planned", size, measure(
+        lambda: preprocess_movie_data(films.copy(), stages=model.feature_stages), repeat))]
+    results.append(summarize("model.prepare_features", size, measure(lambda: model.prepare_features(features), repeat)))
+    if model.feature_builder is not None:
+        builder = model.feature_builder
+        categorical = [name for name in builder.categorical_features if name in features.columns]
+        results.append(summarize("model.numeric_matrix", size, measure(lambda: builder.numeric_matrix(features), repeat)))
+        results.append(summarize("model.categorical_astype_str", size,
+                                 measure(lambda: [features[name].astype(str).to_numpy() for name in categorical], repeat)))
+        results.append(summarize("model.categorical_vocabulary", size,
+                                 measure(lambda: builder.encode_categoricals(features), repeat)))
+        pool = builder.build_pool(features)
+        results.append(summarize("model.build_pool", size, measure(lambda: builder.build_pool(features), repeat)))
+        results.append(summarize("model.catboost_predict", size, measure(lambda: model.model.predict(pool), repeat)))
+    results.append(summarize("model.rule_based_predict", size, measure(lambda: model.fallback.predict(features), repeat)))
+    results.append(summarize("model.predict", size, measure(lambda: model.predict(features), repeat)))
+    return results
+
+
+def bench_multi_hot(films: pd.DataFrame, repeat: int, model_path: str) -> List[Dict]:
+    """
+    Dense and sparse model inputs of the one-hot features, in time and memory
+
+    Compares the model's one-hot features written into the dense numeric
+    block with the CSR block, then the whole Pool and the model call on both
+    paths.
+    """
+    from app.models.prediction_model import MoviePredictionModel
+
+    size = len(films)
+    model = MoviePredictionModel(model_path)
+    if model.feature_builder is None:
+        return []
+    builder = model.feature_builder
+    features = preprocess_movie_data(films.copy(), stages=model.feature_stages)
+
+    results = [
+        summarize("multi_hot.dense_numeric_matrix", size, measure(lambda: builder.numeric_matrix(features), repeat)),
+        summarize("multi_hot.sparse_encode", size, measure(lambda: builder.multi_hot.encode(features), repeat)),
+        peak_memory("multi_hot.dense_numeric_matrix", size, lambda: builder.numeric_matrix(features)),
+        peak_memory("multi_hot.sparse_encode", size, lambda: builder.multi_hot.encode(features)),
+    ]
+    for sparse in (False, True):
+        label = 'sparse' if sparse else 'dense'
+        pool = builder.build_pool(features, sparse=sparse)
+        results.append(summarize(f"multi_hot.{label}.build_pool", size,
+                                 measure(lambda: builder.build_pool(features, sparse=sparse), repeat)))
+        results.append(peak_memory(f"multi_hot.{label}.build_pool", size,
+                                   lambda: builder.build_pool(features, sparse=sparse)))
+        results.append(summarize(f"multi_hot.{label}.catboost_predict", size,
+                                 measure(lambda: model.model.predict(pool), repeat)))
+    return results
+
+
+def bench_parallel(films: pd.DataFrame, repeat: int, model_path: str) -> List[Dict]:
+    """
+    Scaling of the sharded preprocessing with the number of worker processes
+
+    Every repeat starts from a fresh pool, warmed untimed on a few other
+    films, so the worker caches are as cold as the in-process ones and the
+    process start-up is not timed.
+    """
+    from app.models.prediction_model import MoviePredictionModel
+    from app.preprocessing.parallel import preprocess_parallel, shutdown_pool
+
+    size = len(films)
+    stages = MoviePredictionModel(model_path).feature_stages
+    warm_up = synthetic_catalogue(16, seed=size + 1)
+    results = [summarize("parallel.in_process", size,
+                         measure(lambda: preprocess_movie_data(films.copy(), stages=stages), repeat))]
+    for workers in PARALLEL_WORKERS:
+        def setup():
+            reset_caches()
+            shutdown_pool()
+            preprocess_parallel(warm_up.copy(), stages=stages, workers=workers, min_rows=0)
+
+        timings = measure(lambda: preprocess_parallel(films.copy(), stages=stages, workers=workers, min_rows=0),
+                          repeat, setup)
+        results.append(summarize(f"parallel.workers_{workers}", size, timings))
+    shutdown_pool()
+    return results
+
+
+def bench_endpoints(films: pd.DataFrame, repeat: int, single_requests: int) -> List[Dict]:
+    """Time the HTTP endpoints in-process through the ASGI test client"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    size = len(films)
+    movies = json.loads(films.to_json(orient='records', force_ascii=False))
+    results = []
+    with TestClient(app) as client:
+        def post(path: str, **kwargs):
+            response = client.post(path, **kwargs)
+            response.raise_for_status()
+            return response
+
+        if size == 1 or single_requests:
+            # Latency of one film per request, each request timed on its own
+            timings = []
+            for movie in movies[:max(1, min(size, single_requests))]:
+                reset_caches()
+                started = time.perf_counter()
+                post("/predict", json=movie)
+                timings.append(time.perf_counter() - started)
+            results.append(summarize("endpoint.predict", 1, timings))
+
+        if size <= MAX_JSON_BATCH:
+            results.append(summarize("endpoint.predict_batch", size,
+                                     measure(lambda: post("/predict_batch", json={"movies": movies}), repeat)))
+
+        csv_body = films.to_csv(index=False).encode('utf-8')
+        results.append(summarize("endpoint.predict_csv", size, measure(
+            lambda: post("/predict_csv", files={"file": ("films.csv", csv_body, "text/csv")}), repeat)))
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_predict(timeout: float = 120.0) -> Dict[str, float]:
+    """Start uvicorn in a new process and poll /predict until it answers 200"""
+    from app.main import SAMPLE_MOVIE
+
+    port = free_port()
+    body = json.dumps(SAMPLE_MOVIE).encode('utf-8')
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            request = urllib.request.Request(f"http://127.0.0.1:{port}/predict", data=body,
+                                             headers={'Content-Type': 'application/json'})
+            sent = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    if response.status == 200:
+                        now = time.perf_counter()
+                        return {'first_predict_s': now - started, 'first_request_s': now - sent}
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"No successful /predict within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_cold_start(repeat: int) -> List[Dict]:
+    """Import time of app.main and time to the first successful /predict of a fresh server"""
+    import_timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', 'import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)'],
+            cwd=API_DIR, stderr=subprocess.DEVNULL, text=True
+        )
+        import_timings.append(float(output.strip().splitlines()[-1]))
+
+    runs = [time_to_first_predict() for _ in range(repeat)]
+    return [
+        summarize("cold_start.import_app", 1, import_timings),
+        summarize("cold_start.first_predict", 1, [run['first_predict_s'] for run in runs]),
+        summarize("cold_start.first_request_latency", 1, [run['first_request_s'] for run in runs]),
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(previous: Dict, current: Dict) -> None:
+    """Print the median of every measurement next to the one of a previous run"""
+    before = {(r['name'], r['size'], 'peak_bytes' in r): r for r in previous['results']}
+    print(f"{'measurement':55} {'size':>7} {'before':>10} {'after':>10} {'ratio':>7}")
+    for result in current['results']:
+        old = before.get((result['name'], result['size'], 'peak_bytes' in result))
+        if old is None:
+            continue
+        key = 'peak_bytes' if 'peak_bytes' in result else 'median_s'
+        ratio = result[key] / old[key] if old[key] else float('nan')
+        print(f"{result['name']:55} {result['size']:>7} {format_value(old):>10} {format_value(result):>10} {ratio:>7.2f}")
+
+
+def format_value(result: Dict) -> str:
+    """Median time in seconds, or peak memory in MB"""
+    if 'peak_bytes' in result:
+        return f"{result['peak_bytes'] / 1e6:.1f}MB"
+    return f"{result['median_s']:.4f}s"
+
+
+def main(argv: List[str] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark the movie prediction service")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Catalogue sizes in films")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement")
+    parser.add_argument("--single-requests", type=int, default=20, help="Films sent one by one to /predict")
+    parser.add_argument("--model-path", default=os.getenv("MODEL_PATH", DEFAULT_MODEL_PATH))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    run = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'model_path': args.model_path,
+            'sizes': args.sizes,
+            'repeat': args.repeat,
+        },
+        'results': [],
+    }
+
+    catalogue_sections = [section for section in args.sections if section != 'cold_start']
+    for size in (args.sizes if catalogue_sections else []):
+        films = synthetic_catalogue(size, args.seed)
+        if 'pipeline' in args.sections:
+            run['results'] += bench_pipeline(films, args.repeat)
+        if 'parsing' in args.sections:
+            run['results'] += bench_parsing(size, args.repeat, args.seed)
+        if 'model' in args.sections:
+            run['results'] += bench_model(films, args.repeat, args.model_path)
+        if 'multi_hot' in args.sections:
+            run['results'] += bench_multi_hot(films, args.repeat, args.model_path)
+        if 'parallel' in args.sections:
+            run['results'] += bench_parallel(films, args.repeat, args.model_path)
+        if 'endpoints' in args.sections:
+            run['results'] += bench_endpoints(films, args.repeat, args.single_requests if size == args.sizes[0] else 0)
+        print(f"Benchmarked {size} films", file=sys.stderr)
+
+    if 'cold_start' in args.sections:
+        run['results'] += bench_cold_start(args.repeat)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), run)
+    else:
+        for result in run['results']:
+            print(f"{result['name']:55} {result['size']:>7} {format_value(result):>11}")
+    return run
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Micro-batching of concurrent /predict requests: flushes, result routing and errors
+# Run with: python -m pytest test_batcher.py
+import asyncio
+import time
+
+import pytest
+
+from app.utils import batcher
+from app.utils.batcher import MicroBatcher
+from app.utils.executor import InferenceExecutor
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Batches run by the batcher, predicted by a fake model echoing each film and its model"""
+    calls = []
+
+    def predict(movies_df, model_names):
+        calls.append((movies_df['film_title'].tolist(), list(model_names)))
+        return [
+            {'film_title': title, 'predicted_fr_entries': len(calls), 'features': {'model': name}}
+            for title, name in zip(movies_df['film_title'], model_names)
+        ]
+
+    executor = InferenceExecutor(max_workers=2, queue_size=8, limits={})
+    monkeypatch.setattr(batcher, 'predict_movies_routed', predict)
+    monkeypatch.setattr(batcher, 'get_executor', lambda: executor)
+    yield calls
+    executor.shutdown()
+
+
+def submit_all(micro_batcher: MicroBatcher, titles, models=None, **gather):
+    models = models or ['default'] * len(titles)
+
+    async def run():
+        return await asyncio.gather(
+            *[micro_batcher.submit({'film_title': title}, model) for title, model in zip(titles, models)], **gather
+        )
+    return asyncio.run(run())
+
+
+def test_window_flushes_concurrent_requests_together(batches):
+    started = time.perf_counter()
+    results = submit_all(MicroBatcher(window_ms=50, max_size=100), ['A', 'B', 'C'])
+    assert time.perf_counter() - started >= 0.05
+    assert batches == [(['A', 'B', 'C'], ['default'] * 3)]
+    assert [r['predicted_fr_entries'] for r in results] == [1, 1, 1]
+
+
+def test_full_batch_flushes_without_waiting_for_the_window(batches):
+    micro_batcher = MicroBatcher(window_ms=10000, max_size=2)
+    started = time.perf_counter()
+    submit_all(micro_batcher, ['A', 'B', 'C', 'D'])
+    assert time.perf_counter() - started < 5
+    assert sorted(titles for titles, _ in batches) == [['A', 'B'], ['C', 'D']]
+    assert micro_batcher.stats() == {'batches': 2, 'items': 4, 'mean_batch_size': 2.0}
+
+
+def test_each_caller_gets_its_own_prediction(batches):
+    titles = [f"Film {i}" for i in range(7)]
+    models = ['default', 'challenger'] * 3 + ['default']
+    results = submit_all(MicroBatcher(window_ms=20, max_size=100), titles, models)
+    assert [r['film_title'] for r in results] == titles
+    assert [r['features']['model'] for r in results] == models
+    assert batches == [(titles, models)]
+
+
+def test_errors_reach_every_caller_of_the_batch(monkeypatch, batches):
+    def fail(movies_df, model_names):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(batcher, 'predict_movies_routed', fail)
+    results = submit_all(MicroBatcher(window_ms=20, max_size=100), ['A', 'B', 'C'], return_exceptions=True)
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) and str(result) == "model crashed" for result in results)
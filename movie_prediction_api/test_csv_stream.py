@@ -0,0 +1,98 @@
+# Streaming CSV predictions: NDJSON and CSV output, errors mid-stream and the predict_csv slot
+# Run with: python -m pytest test_csv_stream.py
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import LaneStreamingResponse, app
+from app.utils.executor import get_executor
+from app.utils.helpers import load_sample_data
+
+# The third film's quote is never closed, the parser fails after two chunks
+BROKEN_CSV = 'film_title,duration,synopsis\n"A",1h 40min,"ok"\n"B",1h 40min,"ok"\n"C,broken\n'
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def post_stream(client, body: str, output_format: str):
+    return client.post(f"/predict_csv_stream?format={output_format}&chunk_size=1",
+                       files={"file": ("films.csv", body, "text/csv")})
+
+
+def slots_in_use() -> int:
+    return get_executor().stats()['lanes'].get('predict_csv', 0)
+
+
+def test_ndjson_stream(client):
+    films = load_sample_data()
+    response = post_stream(client, films.to_csv(index=False), "ndjson")
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['film_title'] for line in lines] == films['film_title'].tolist()
+    assert all(line['predicted_fr_entries'] >= 0 for line in lines)
+    assert all(line['features']['model'] == 'default' for line in lines)
+    assert slots_in_use() == 0
+
+
+def test_csv_stream(client):
+    films = load_sample_data()
+    response = post_stream(client, films.to_csv(index=False), "csv")
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["film_title", "predicted_fr_entries", "method"]
+    assert [row[0] for row in rows[1:]] == films['film_title'].tolist()
+    assert slots_in_use() == 0
+
+
+def test_whole_file_predictions_name_their_model(client):
+    films = load_sample_data()
+    response = client.post("/predict_csv", files={"file": ("films.csv", films.to_csv(index=False), "text/csv")})
+    assert [p['features']['model'] for p in response.json()['predictions']] == ['default'] * len(films)
+
+    pa = pytest.importorskip("pyarrow")
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(films, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    response = client.post("/predict_arrow", content=sink.getvalue().to_pybytes())
+    assert [p['features']['model'] for p in response.json()['predictions']] == ['default'] * len(films)
+
+
+def test_ndjson_stream_ends_with_an_error_line(client):
+    lines = post_stream(client, BROKEN_CSV, "ndjson").text.splitlines()
+    assert [json.loads(line)['film_title'] for line in lines[:2]] == ["A", "B"]
+    assert "CSV prediction error" in json.loads(lines[-1])['error']
+    assert slots_in_use() == 0
+
+
+def test_csv_stream_is_aborted_on_error(client):
+    # The server drops the response, the test client re-raises the error
+    with pytest.raises(Exception, match="EOF inside string"):
+        post_stream(client, BROKEN_CSV, "csv")
+    assert slots_in_use() == 0
+
+
+def test_slot_is_released_when_the_response_is_never_sent():
+    async def body():
+        yield "never sent"
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        raise ConnectionResetError("client went away")
+
+    get_executor().acquire("predict_csv")
+    response = LaneStreamingResponse(body(), "predict_csv", media_type="text/csv")
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(response({'type': 'http', 'method': 'POST'}, receive, send))
+    assert slots_in_use() == 0
@@ -0,0 +1,77 @@
+# Admission control of the inference executor: per-lane limits, capacity and slot release
+# Run with: python -m pytest test_executor.py
+import asyncio
+import threading
+
+import pytest
+
+from app.utils.executor import ExecutorSaturated, InferenceExecutor, parse_limits
+
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(max_workers=2, queue_size=1, limits={'predict_csv': 1})
+    yield executor
+    executor.shutdown()
+
+
+def test_lane_limit_answers_429(executor):
+    executor.acquire('predict_csv')
+    with pytest.raises(ExecutorSaturated) as refused:
+        executor.acquire('predict_csv')
+    assert refused.value.status_code == 429
+    # Other lanes still get slots
+    executor.acquire('predict')
+    assert executor.stats()['lanes'] == {'predict_csv': 1, 'predict': 1}
+
+    executor.release('predict_csv')
+    executor.acquire('predict_csv')
+
+
+def test_capacity_answers_503(executor):
+    for _ in range(executor.capacity):
+        executor.acquire('predict')
+    with pytest.raises(ExecutorSaturated) as refused:
+        executor.acquire('predict')
+    assert refused.value.status_code == 503
+    assert refused.value.retry_after >= 1
+
+    executor.release('predict')
+    executor.acquire('predict')
+
+
+def test_running_job_holds_its_lane(executor):
+    started, finish = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        finish.wait(5)
+        return 'done'
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run('predict_csv', job))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run('predict_csv', job)
+        finish.set()
+        return await running
+
+    assert asyncio.run(scenario()) == 'done'
+    assert executor.stats()['in_flight'] == 0
+
+
+def test_slot_is_released_when_the_job_fails(executor):
+    def fail():
+        raise ValueError("bad CSV")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(executor.run('predict_csv', fail))
+    stats = executor.stats()
+    assert stats['in_flight'] == 0 and stats['lanes'] == {'predict_csv': 0}
+
+
+def test_parse_limits():
+    assert parse_limits("predict_csv=1, predict_batch=4,broken") == {'predict_csv': 1, 'predict_batch': 4}
+    assert parse_limits(None) == {}
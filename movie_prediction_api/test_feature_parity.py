@@ -0,0 +1,267 @@
+# Parity between the row-wise and the vectorized feature pipelines
+# Run with: python -m pytest test_feature_parity.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.models.feature_schema import category_string, distinct_strings, integral_categoricals
+from app.preprocessing.feature_engineering import preprocess_movie_data
+from app.preprocessing.keywords import KEYWORD_TABLE, KeywordMatcher
+from app.preprocessing import parsing
+from app.preprocessing.feature_plan import plan_stages
+from app.preprocessing.list_columns import is_list_array, list_items, to_python_lists
+from app.utils.helpers import load_sample_data
+
+# The row-wise stages return ints or floats for these columns depending on the
+# values in the batch, the vectorized stages always return floats
+BATCH_DEPENDENT_DTYPES = ['duration', 'top_distributor_score']
+
+
+def edge_case_data() -> pd.DataFrame:
+    """Sample films plus rows with missing, numeric and malformed values"""
+    extra = pd.DataFrame([
+        {
+            "film_title": "Les Minions 2 : Il était une fois Gru", "release_date": "2022-07-06",
+            "duration": "1h 28min", "producers": "['Chris Meledandri', 'Janet Healy']", "director": "",
+            "top_stars": " , Steve Carell ,, Pierre Coffin", "languages": None,
+            "distributor": "Universal Pictures International France", "year_of_production": "année 22",
+            "film_nationality": "France, U.S.A.", "filming_secrets": None, "awards": "  ",
+            "associated_genres": "", "broadcast_category": None, "trailer_views": "1 234 567 vues",
+            "synopsis": None
+        },
+        {
+            "film_title": "Astérix et Obélix : L'Empire du Milieu", "release_date": "01/02/2023",
+            "duration": 112, "producers": None, "director": None, "top_stars": None, "languages": "Français",
+            "distributor": "Pathé", "year_of_production": 2023, "film_nationality": "france",
+            "filming_secrets": "3", "awards": "1 prix", "associated_genres": "Comédie",
+            "broadcast_category": "en salle", "trailer_views": None, "synopsis": "x" * 750
+        },
+        {
+            "film_title": "Le Pacte des loups", "release_date": None, "duration": None, "producers": "A,B",
+            "director": "Christophe Gans", "top_stars": "C", "languages": "Français,Anglais",
+            "distributor": "Le Pacte / Walt Disney", "year_of_production": None, "film_nationality": None,
+            "filming_secrets": "aucune", "awards": None, "associated_genres": "[bad literal",
+            "broadcast_category": "", "trailer_views": "pas de vues",
+            "synopsis": "A terrible, horrible, awful day."
+        },
+        {
+            "film_title": "Star Wars: Episode IX", "release_date": "2019-12-18", "duration": "2h",
+            "producers": "", "director": "J.J. Abrams", "top_stars": "Daisy Ridley", "languages": "Anglais",
+            "distributor": "Walt Disney Studios Motion Pictures", "year_of_production": "2019",
+            "film_nationality": "U.S.A.", "filming_secrets": "42 anecdotes", "awards": "",
+            "associated_genres": "Science-Fiction", "broadcast_category": "en salle", "trailer_views": 12000,
+            "synopsis": "The wonderful best great happy saga ends."
+        },
+        {
+            "film_title": "Sans titre", "release_date": "2024-03-01", "duration": "95 min", "producers": None,
+            "director": None, "top_stars": None, "languages": None, "distributor": None,
+            "year_of_production": "", "film_nationality": None, "filming_secrets": None, "awards": None,
+            "associated_genres": None, "broadcast_category": None, "trailer_views": "", "synopsis": ""
+        },
+    ])
+    return pd.concat([load_sample_data(), extra], ignore_index=True)
+
+
+def assert_same_features(movies: pd.DataFrame) -> None:
+    expected = preprocess_movie_data(movies.copy(), vectorized=False)
+    result = preprocess_movie_data(movies.copy(), vectorized=True)
+
+    assert list(result.columns) == list(expected.columns)
+    for col in expected.columns:
+        # The vectorized list columns are Arrow list arrays
+        pd.testing.assert_series_equal(
+            to_python_lists(result[col]), expected[col],
+            check_dtype=col not in BATCH_DEPENDENT_DTYPES
+        )
+
+
+@pytest.mark.parametrize("rows", [slice(None), slice(0, 1), slice(1, 3)])
+def test_sample_data_parity(rows):
+    assert_same_features(load_sample_data().iloc[rows])
+
+
+def test_edge_case_parity():
+    assert_same_features(edge_case_data())
+
+
+def test_non_default_index_parity():
+    movies = edge_case_data()
+    movies.index = range(100, 100 - len(movies), -1)
+    assert_same_features(movies)
+
+
+def test_keyword_matcher_matches_substring_scan():
+    keywords = sorted({k for categories in KEYWORD_TABLE.values() for kws in categories.values() for k in kws})
+    # Every keyword alone, inside other words, and overlapping with the next one
+    texts = keywords + [f"Le {a.upper()}{b} 2" for a, b in zip(keywords, keywords[1:] + keywords[:1])]
+    texts += ["", "Partie", "Spider-Man: Across the Spider-Verse", None, 12]
+
+    for column, categories in KEYWORD_TABLE.items():
+        matcher = KeywordMatcher(categories)
+        flags = matcher.flags(pd.Series(texts, dtype=object))
+        for category, kws in categories.items():
+            expected = [int(isinstance(t, str) and any(k in t.lower() for k in kws)) for t in texts]
+            assert flags[category].tolist() == expected, (column, category)
+
+
+def test_distinct_strings_match_category_string():
+    features = preprocess_movie_data(edge_case_data())
+    # List columns are never categorical features
+    columns = [features[col] for col in features.columns if not is_list_array(features[col])]
+    columns.append(pd.Series([None, np.nan, 1, 1.0, '1', True, 'a'], dtype=object))
+    columns.append(pd.Series([2025.0, np.nan, 12.5, 7.0]))
+    for column in columns:
+        for integral in (False, True):
+            rows, uniques = distinct_strings(column, integral)
+            if column.dtype == object or (integral and pd.api.types.is_float_dtype(column.dtype)):
+                expected = [category_string(value, integral) for value in column]
+            else:
+                expected = column.astype(str).tolist()
+            assert uniques[rows].tolist() == expected, column.name
+    assert distinct_strings(pd.Series([2025.0, np.nan]), integral=True)[1].tolist() == ['2025', 'nan']
+    # Float categoricals keep their float form
+    assert distinct_strings(pd.Series([0.0, -0.0125]))[1].tolist() == ['0.0', '-0.0125']
+
+
+def test_integral_categoricals_follow_the_vocabularies():
+    vocabularies = {'year_of_production': ['2007', '2019'], 'synopsis_sentiment': ['-0.0125', '0.0', '1.0']}
+    columns = ['year_of_production', 'synopsis_sentiment', 'release_date_france_day', 'release_season']
+    assert integral_categoricals(columns, vocabularies) == {'year_of_production', 'release_date_france_day'}
+
+
+def test_list_items_match_row_wise_lists():
+    movies = edge_case_data()
+    expected = preprocess_movie_data(movies.copy(), vectorized=False)
+    result = preprocess_movie_data(movies.copy(), vectorized=True)
+    for col in ['producers_list', 'top_stars_list', 'languages_list', 'nationality_list', 'associated_genres_list']:
+        assert is_list_array(result[col])
+        items = []
+        for features in (result, expected):
+            rows, codes, vocabulary = list_items(features[col])
+            items.append(list(zip(rows.tolist(), vocabulary[codes].tolist())))
+        assert items[0] == items[1], col
+
+
+
+@pytest.mark.parametrize("repeat", [1, parsing.SCALAR_PATH_MAX_ROWS])
+def test_column_parsers_match_scalar_parsers(repeat):
+    values = ["1h 44min", "2h", "95 min", "aucune", "", " ", None, np.nan, 120, 130.5, "x 2020 y", "1999",
+              "15 anecdotes", "5 000 000 vues", "1,234.5", "..", "2h 05min 3"]
+    # Repeated past SCALAR_PATH_MAX_ROWS, the column goes through the distinct-value path
+    column = pd.Series(values * repeat, dtype=object, index=range(7, 7 + len(values) * repeat))
+    parsers = [
+        (parsing.parse_duration, parsing.parse_duration_column),
+        (parsing.parse_year, parsing.parse_year_column),
+        (parsing.parse_trailer_views, parsing.parse_trailer_views_column),
+        (parsing.parse_count, parsing.parse_count_column),
+    ]
+    for scalar, vectorized in parsers:
+        expected = column.apply(scalar).astype(float)
+        pd.testing.assert_series_equal(vectorized(column).astype(float), expected, obj=vectorized.__name__)
+
+
+
+def test_planned_stages_match_full_pipeline():
+    from app.models.prediction_model import DEFAULT_MODEL_PATH, MoviePredictionModel
+
+    model = MoviePredictionModel(DEFAULT_MODEL_PATH)
+    if not model.model_loaded:
+        pytest.skip("CatBoost model not available")
+    assert 'add_placeholder_columns' not in model.feature_stages
+
+    movies = edge_case_data()
+    for vectorized in (True, False):
+        full = preprocess_movie_data(movies.copy(), vectorized=vectorized)
+        planned = preprocess_movie_data(movies.copy(), vectorized=vectorized, stages=model.feature_stages)
+        columns = [col for col in model.required_columns if col in full.columns]
+        pd.testing.assert_frame_equal(planned[columns], full[columns])
+
+
+def test_plan_follows_stage_dependencies():
+    # is_major_studio needs is_licence, which needs franchise_level
+    assert plan_stages(['is_major_studio']) == ['add_franchise_features', 'add_licence_features', 'add_studio_features']
+    assert plan_stages(['film_title']) == []
+
+
+def test_sparse_pool_matches_dense_pool():
+    from app.models.prediction_model import DEFAULT_MODEL_PATH, MoviePredictionModel
+
+    model = MoviePredictionModel(DEFAULT_MODEL_PATH)
+    if not model.model_loaded:
+        pytest.skip("CatBoost model not available")
+    builder = model.feature_builder
+
+    for vectorized in (True, False):
+        features = preprocess_movie_data(edge_case_data(), vectorized=vectorized)
+        block = builder.multi_hot.encode(features).toarray()
+        dense = builder.numeric_matrix(features)
+        positions = [builder.numeric_features.index(name) for name in builder.multi_hot.feature_names]
+        np.testing.assert_array_equal(block, dense[:, positions])
+
+        expected = model.model.predict(builder.build_pool(features, sparse=False))
+        np.testing.assert_array_equal(model.model.predict(builder.build_pool(features, sparse=True)), expected)
+
+
+
+def test_prediction_does_not_depend_on_batch():
+    from app.models.prediction_model import DEFAULT_MODEL_PATH, MoviePredictionModel
+
+    model = MoviePredictionModel(DEFAULT_MODEL_PATH)
+    if not model.model_loaded:
+        pytest.skip("CatBoost model not available")
+
+    films = load_sample_data()
+    alone = [model.predict(preprocess_movie_data(films.iloc[[i]].copy()))[0] for i in range(len(films))]
+    # Missing optional values turn the integer categoricals of the batch into floats
+    partial = films.copy()
+    partial['film_title'] = partial['film_title'] + ' (partial)'
+    partial['year_of_production'] = None
+    partial['release_date'] = None
+    batch = model.predict(preprocess_movie_data(pd.concat([films, partial], ignore_index=True)))
+
+    assert [p['predicted_fr_entries'] for p in batch[:len(films)]] == [p['predicted_fr_entries'] for p in alone]
+
+
+def test_parallel_preprocessing_matches_in_process():
+    from app.preprocessing.parallel import preprocess_parallel, shutdown_pool
+
+    movies = pd.concat([edge_case_data(), load_sample_data().head(20)], ignore_index=True)
+    movies.index = movies.index * 3 + 7
+    try:
+        sharded = preprocess_parallel(movies.copy(), workers=2, shards=3, min_rows=0)
+    finally:
+        shutdown_pool()
+    expected = preprocess_movie_data(movies.copy())
+    pd.testing.assert_frame_equal(sharded, expected)
+    # The list columns of the shards are concatenated Arrow arrays
+    for column in ('top_stars_list', 'languages_list'):
+        for got, want in zip(list_items(sharded[column]), list_items(expected[column])):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_reassembly_of_shards_with_different_dtypes(monkeypatch):
+    from app.preprocessing import parallel
+
+    # Each shard is its own features, written to shared memory as the workers do
+    monkeypatch.setattr(parallel, 'preprocess_movie_data', lambda shard, stages=None: shard)
+    shards = [
+        pd.DataFrame({'year': [2019, 2020], 'rating': [3.5, 4.0], 'sequel': [True, False], 'title': ['A', 'B']}),
+        pd.DataFrame({'year': [2021.5], 'rating': ['n/a'], 'sequel': ['unknown'], 'title': ['C']}),
+        pd.DataFrame({'year': [2022], 'rating': [2.0], 'sequel': [True], 'title': ['D']}),
+    ]
+    results = [parallel._preprocess_shard(shard, None) for shard in shards]
+    try:
+        index = pd.Index([10, 11, 12, 13])
+        reassembled = parallel._reassemble(results, index)
+    finally:
+        parallel._release(results)
+
+    expected = pd.concat(shards, ignore_index=True).set_axis(index)
+    pd.testing.assert_frame_equal(reassembled, expected)
+    assert reassembled['rating'].tolist() == [3.5, 4.0, 'n/a', 2.0]
+    assert reassembled['year'].dtype == np.float64
+
+
+if __name__ == "__main__":
+    test_edge_case_parity()
+    print("Row-wise and vectorized pipelines produce the same features")
@@ -0,0 +1,50 @@
+# Incremental updates of the director/star/distributor history index
+# Run with: python -m pytest test_history_index.py
+import numpy as np
+import pytest
+
+from app.preprocessing.history_index import HistoryIndex, cast_names, normalize_name
+
+FIRST_RUN = {
+    '1': {'entries': 500000.0, 'director': ['Christopher Nolan'], 'star': ['Cillian Murphy', 'Emily Blunt'],
+          'distributor': ['Universal Pictures International France']},
+    '2': {'entries': 100000.0, 'director': ['Greta Gerwig'], 'star': ['Margot Robbie'],
+          'distributor': ['Warner Bros. France']},
+    '3': {'entries': None, 'director': ['Inconnu'], 'distributor': ['Warner Bros. France']},
+}
+SECOND_RUN = {
+    # Entries corrected, then a new film and the missing entries of film 3
+    '2': {'entries': 300000.0},
+    '4': {'entries': 900000.0, 'director': ['Christopher Nolan'], 'star': ['Timothée Chalamet'],
+          'distributor': ['Warner Bros. France']},
+    '3': {'entries': 50000.0},
+}
+
+
+def test_update_matches_full_build():
+    incremental = HistoryIndex(FIRST_RUN)
+    assert incremental.update(SECOND_RUN) == 3
+    assert incremental.update(SECOND_RUN) == 0
+
+    merged = {film_id: dict(record) for film_id, record in FIRST_RUN.items()}
+    for film_id, record in SECOND_RUN.items():
+        merged.setdefault(film_id, {}).update(record)
+    full = HistoryIndex(merged)
+
+    assert incremental.films == full.films
+    for role in ('director', 'star', 'distributor'):
+        assert incremental.totals[role].keys() == full.totals[role].keys()
+        for key, (films, entries) in full.totals[role].items():
+            assert incremental.totals[role][key][0] == films
+            assert incremental.totals[role][key][1] == pytest.approx(entries)
+
+    assert incremental.lookup('director', 'christopher  NOLAN') == (2, 700000.0)
+    assert incremental.lookup('distributor', 'Warner Bros France') == (3, pytest.approx(1250000.0 / 3))
+    assert incremental.lookup('star', None)[0] == 0 and np.isnan(incremental.lookup('star', 'Personne')[1])
+
+
+def test_names_are_normalized():
+    assert normalize_name("Timothée  Chalamet") == normalize_name("timothee chalamet") == "timothee chalamet"
+    assert cast_names("Tom Holland (Rôle principal - - Peter Parker) | Kevin Feige (Producteur) | Hans Zimmer") == [
+        "Tom Holland"
+    ]
@@ -0,0 +1,36 @@
+# Import-time budget of the API: heavy libraries are imported on first use or
+# by the startup warm-up, never when app.main is imported
+# Run with: python -m pytest test_import_budget.py
+import os
+import subprocess
+import sys
+
+DEFERRED_MODULES = ['textblob', 'nltk', 'scipy', 'sklearn', 'catboost', 'pyarrow.parquet']
+
+
+def test_app_import_defers_heavy_modules():
+    code = f"import sys, app.main; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+    )
+    assert output.strip() == '', f"Imported at startup: {output.strip()}"
+
+
+def test_app_runs_without_pyarrow():
+    # Only the columnar endpoints need pyarrow, they answer 501 without it
+    code = (
+        "import sys\n"
+        "for name in ('pyarrow', 'pyarrow.compute', 'pyarrow.parquet'): sys.modules[name] = None\n"
+        "from fastapi.testclient import TestClient\n"
+        "import app.main\n"
+        "from app.utils.helpers import load_sample_data\n"
+        "movies = load_sample_data().to_dict(orient='records')\n"
+        "with TestClient(app.main.app) as client:\n"
+        "    batch = client.post('/predict_batch', json={'movies': movies})\n"
+        "    arrow = client.post('/predict_arrow', content=b'')\n"
+        "print(batch.status_code, len(batch.json()['predictions']), arrow.status_code)\n"
+    )
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+    )
+    assert output.strip().splitlines()[-1] == '200 3 501'
@@ -0,0 +1,81 @@
+# Hot reload of the hosted models when their file changes on disk
+# Run with: python -m pytest test_model_registry.py
+import os
+import shutil
+
+import pytest
+
+from app.models.model_registry import ModelRegistry, UnknownModelError
+from app.models.prediction_model import DEFAULT_MODEL_PATH
+from app.models.preprocessing_artifact import ARTIFACT_FILENAME
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    """Copy of the shipped model and its preprocessing artifact, free to rewrite"""
+    if not os.path.exists(DEFAULT_MODEL_PATH):
+        pytest.skip("CatBoost model not available")
+    path = tmp_path / "catboost_model.cbm"
+    shutil.copyfile(DEFAULT_MODEL_PATH, path)
+    shutil.copyfile(os.path.join(os.path.dirname(DEFAULT_MODEL_PATH), ARTIFACT_FILENAME), tmp_path / ARTIFACT_FILENAME)
+    return str(path)
+
+
+def rewrite(path: str, content: bytes) -> None:
+    """Replace the file content and move its mtime forward, as a deployment would"""
+    stat = os.stat(path)
+    with open(path, 'wb') as f:
+        f.write(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_model_is_reloaded_when_its_file_changes(model_file):
+    registry = ModelRegistry(check_interval=0, models={'default': model_file})
+    first = registry.get_model()
+    assert first.model_loaded
+    assert registry.get_model() is first
+
+    with open(model_file, 'rb') as f:
+        content = f.read()
+    rewrite(model_file, content)
+    reloaded = registry.get_model()
+    assert reloaded is not first and reloaded.model_loaded
+    assert reloaded.model_version == first.model_version
+    assert registry.get_model() is reloaded
+
+
+def test_failed_reload_keeps_the_loaded_model(model_file):
+    registry = ModelRegistry(check_interval=0, models={'default': model_file})
+    working = registry.get_model()
+    with open(model_file, 'rb') as f:
+        content = f.read()
+
+    rewrite(model_file, b"not a catboost model")
+    assert registry.get_model() is working
+    # The broken file is not reloaded on every call
+    assert registry.get_model() is working
+    assert working.predictor.name == 'catboost'
+
+    rewrite(model_file, content)
+    repaired = registry.get_model()
+    assert repaired is not working and repaired.model_loaded
+
+
+def test_unknown_model_name(model_file):
+    registry = ModelRegistry(check_interval=0, models={'default': model_file})
+    with pytest.raises(UnknownModelError):
+        registry.get_model('challenger')
+
+
+def test_version_of_never_loads_a_model(model_file):
+    registry = ModelRegistry(check_interval=0, models={'default': model_file})
+    assert registry.version_of() is None
+    assert not registry.is_loaded(model_file)
+
+    model = registry.get_model()
+    with open(model_file, 'rb') as f:
+        content = f.read()
+    rewrite(model_file, content)
+    # The changed file is only reloaded by get
+    assert registry.version_of('default') == model.model_version
+    assert registry.get_model() is not model
@@ -0,0 +1,93 @@
+# Prediction cache: key normalization, TTL, LRU eviction and what gets cached
+# Run with: python -m pytest test_prediction_cache.py
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app.utils import prediction_cache
+from app.utils.helpers import load_sample_data
+from app.utils.prediction_cache import PredictionCache, prediction_key
+
+
+def prediction(entries: int, method: str = 'catboost') -> dict:
+    return {'film_title': 'Film', 'predicted_fr_entries': entries, 'features': {'method': method}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the cache module, moved by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_prediction_key_normalizes_payloads():
+    movie = {'film_title': 'Dune', 'director': 'Denis Villeneuve', 'awards': None, 'fr_entries': 0}
+    same = {'fr_entries': 4000000, 'awards': '   ', 'director': ' Denis Villeneuve ', 'film_title': 'Dune'}
+    assert prediction_key(movie, 'default:v1') == prediction_key(same, 'default:v1')
+    assert prediction_key(movie, 'default:v1') != prediction_key(movie, 'default:v2')
+    assert prediction_key(movie, 'default:v1') != prediction_key({**movie, 'director': 'Frank Herbert'}, 'default:v1')
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(max_size=10, ttl=60, redis_url=None)
+    cache.put('a', prediction(1))
+    clock[0] += 59
+    assert cache.get('a') == prediction(1)
+    clock[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0 and cache.misses == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = PredictionCache(max_size=2, ttl=60, redis_url=None)
+    cache.put('a', prediction(1))
+    cache.put('b', prediction(2))
+    assert cache.get('a') is not None
+    cache.put('c', prediction(3))
+    assert cache.get('b') is None
+    assert cache.get('a') == prediction(1) and cache.get('c') == prediction(3)
+    assert cache.evictions == 1
+
+
+def test_only_model_predictions_are_cached():
+    cache = PredictionCache(max_size=10, ttl=60, redis_url=None)
+    cache.store(['a', 'b', 'c'], [prediction(1), prediction(2, 'rule_based'), prediction(3, 'stub')])
+    keys, cached = cache.lookup([{'film_title': 'A'}], ['v1'])
+    assert cache.get('a') == prediction(1)
+    assert cache.get('b') is None and cache.get('c') is None
+    assert keys == [prediction_key({'film_title': 'A'}, 'v1')] and cached == [None]
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_size=0, ttl=60, redis_url=None)
+    cache.put('a', prediction(1))
+    assert cache.get('a') is None
+
+
+def test_cached_prediction_matches_single_film_prediction():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.models.prediction_model import get_model_instance, predict_movies
+
+    films = load_sample_data()
+    movies = json.loads(films.to_json(orient='records', force_ascii=False))
+    film = movies[0]
+    # Batched with a film missing its optional year, the batch's integer categoricals are floats
+    partial = {**movies[1], 'film_title': movies[1]['film_title'] + ' (partial)', 'year_of_production': None}
+
+    with TestClient(app) as client:
+        if get_model_instance().predictor.name != 'catboost':
+            pytest.skip("CatBoost model not available")
+        cache = prediction_cache.get_prediction_cache()
+        cache.clear()
+        assert client.post("/predict_batch", json={"movies": [film, partial]}).status_code == 200
+
+        hits = cache.hits
+        cached = client.post("/predict", json=film).json()
+        assert cache.hits == hits + 1
+
+    alone = predict_movies(pd.DataFrame([film]))[0]
+    assert cached['predicted_fr_entries'] == alone['predicted_fr_entries']
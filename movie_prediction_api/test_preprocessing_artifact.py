@@ -0,0 +1,43 @@
+# Preprocessing artifact: what fit accepts and what the shipped artifact holds
+# Run with: python -m pytest test_preprocessing_artifact.py
+import os
+
+import pandas as pd
+import pytest
+
+from app.models.prediction_model import DEFAULT_MODEL_PATH
+from app.models.preprocessing_artifact import PreprocessingArtifact, artifact_path_for
+
+
+def test_fit_refuses_missing_and_constant_columns():
+    features = pd.DataFrame({'duration': [90.0, 120.0], 'views': [0.0, 0.0], 'season': ['Hiver', 'Hiver']})
+    with pytest.raises(ValueError, match=r"missing columns \['award_count'\], constant columns \['views'\]"):
+        PreprocessingArtifact.fit(features, ['duration', 'views', 'award_count'], [])
+    with pytest.raises(ValueError, match=r"constant columns \['season'\]"):
+        PreprocessingArtifact.fit(features, ['duration'], ['season'])
+
+    artifact = PreprocessingArtifact.fit(features, ['duration'], [])
+    assert artifact.mean.tolist() == [105.0] and artifact.scale.tolist() == [15.0]
+
+
+def test_shipped_artifact_has_no_unfitted_feature():
+    path = artifact_path_for(DEFAULT_MODEL_PATH)
+    if not os.path.exists(path):
+        pytest.skip("No preprocessing artifact shipped")
+    artifact = PreprocessingArtifact.load(path)
+    identity = [col for col, mean, scale in zip(artifact.continuous_cols, artifact.mean, artifact.scale)
+                if mean == 0.0 and scale == 1.0]
+    assert identity == []
+    assert [col for col, values in artifact.vocabularies.items() if len(values) < 2] == []
+
+
+def test_shipped_artifact_freezes_the_model_multi_hot_vocabulary():
+    from app.models.prediction_model import get_model_instance
+
+    builder = get_model_instance().feature_builder
+    path = artifact_path_for(DEFAULT_MODEL_PATH)
+    if builder is None or not os.path.exists(path):
+        pytest.skip("CatBoost model or preprocessing artifact not available")
+    encoder = PreprocessingArtifact.load(path).multi_hot_encoder()
+    assert builder.multi_hot.n_features > 0
+    assert encoder.features == builder.multi_hot.features